@@ -0,0 +1,186 @@
+"""
+Respuestas de archivos con GET condicional y rangos de bytes.
+
+respuesta_archivo() es la base de servir_estatico y servir_media: responde
+304 si el cliente ya tiene el archivo (If-None-Match / If-Modified-Since),
+206 con el tramo pedido en Range (el video de inicio se puede adelantar sin
+descargarlo completo) y 416 si el rango no existe. El ETag es fuerte: sale
+del SHA-256 del contenido, que se calcula una vez por archivo y mtime.
+
+Con ARCHIVOS_PROXY = 'nginx' o 'apache' Django solo decide permisos y
+cabeceras y le pide al proxy que envíe los bytes (X-Accel-Redirect o
+X-Sendfile); el proxy se encarga entonces de los rangos.
+"""
+from functools import lru_cache
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+CACHE_REVALIDAR = 'public, max-age=0, must-revalidate'
+
+# Imágenes de productos nombradas por el hash de su contenido (menu.almacenamiento
+# y sus variantes de menu.imagenes): el nombre ya es el ETag y nunca cambian
+RUTA_POR_CONTENIDO = re.compile(r'^imgProductos/(?:[0-9a-f]{2}|variantes)/(?P<hash>[0-9a-f]{64})')
+
+RANGO = re.compile(r'^bytes=(?P<inicio>\d*)-(?P<fin>\d*)$')
+TAMANIO_BLOQUE = 64 * 1024
+
+
+@lru_cache(maxsize=1024)
+def _hash_contenido(completo, mtime_ns, tamanio):
+    # mtime y tamaño forman parte de la llave: si el archivo cambia se recalcula
+    resumen = hashlib.sha256()
+    with open(completo, 'rb') as archivo:
+        for bloque in iter(lambda: archivo.read(TAMANIO_BLOQUE), b''):
+            resumen.update(bloque)
+    return resumen.hexdigest()
+
+
+def etag_archivo(completo, stat=None):
+    """ETag fuerte del archivo a partir del hash de su contenido."""
+    stat = stat or os.stat(completo)
+    return '"%s"' % _hash_contenido(completo, stat.st_mtime_ns, stat.st_size)[:32]
+
+
+def _etags(cabecera):
+    return {etiqueta.strip().removeprefix('W/') for etiqueta in cabecera.split(',')}
+
+
+def _no_modificado(request, etag, mtime):
+    si_no_coincide = request.headers.get('If-None-Match')
+    if si_no_coincide is not None:
+        # If-None-Match manda sobre If-Modified-Since (RFC 9110 13.2.2)
+        etiquetas = _etags(si_no_coincide)
+        return '*' in etiquetas or etag in etiquetas
+    desde = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return desde is not None and int(mtime) <= desde
+
+
+def _rango(request, etag, mtime, tamanio):
+    """
+    (inicio, fin) inclusivos del Range pedido, None para enviar todo el
+    archivo o False si el rango no se puede satisfacer.
+    """
+    cabecera = request.headers.get('Range')
+    if not cabecera:
+        return None
+    si_rango = request.headers.get('If-Range')
+    if si_rango and si_rango != etag and parse_http_date_safe(si_rango) != int(mtime):
+        # El cliente tiene otra versión: se le manda la completa
+        return None
+    coincidencia = RANGO.match(cabecera.strip())
+    if coincidencia is None:
+        # Varios rangos o unidades desconocidas: se ignora Range (RFC 9110 14.2)
+        return None
+    inicio, fin = coincidencia['inicio'], coincidencia['fin']
+    if not inicio:
+        if not fin:
+            return None
+        # bytes=-N: los últimos N bytes
+        inicio, fin = max(tamanio - int(fin), 0), tamanio - 1
+    else:
+        inicio, fin = int(inicio), min(int(fin), tamanio - 1) if fin else tamanio - 1
+    if inicio >= tamanio or inicio > fin:
+        return False
+    return inicio, fin
+
+
+class _Tramo:
+    """Lector que entrega solo `longitud` bytes de un archivo a partir de `inicio`."""
+
+    def __init__(self, archivo, inicio, longitud):
+        archivo.seek(inicio)
+        self.archivo = archivo
+        self.restante = longitud
+
+    def read(self, tamanio=-1):
+        if tamanio < 0 or tamanio > self.restante:
+            tamanio = self.restante
+        datos = self.archivo.read(tamanio)
+        self.restante -= len(datos)
+        return datos
+
+    def close(self):
+        self.archivo.close()
+
+
+def _ruta_proxy(raiz, archivo):
+    if settings.ARCHIVOS_PROXY == 'apache':
+        return 'X-Sendfile', archivo
+    ubicacion = settings.ARCHIVOS_PROXY_UBICACIONES[raiz]
+    return 'X-Accel-Redirect', ubicacion + os.path.relpath(archivo, getattr(settings, f'{raiz.upper()}_ROOT'))
+
+
+def respuesta_archivo(request, archivo, content_type=None, cache_control=CACHE_REVALIDAR,
+                      codificacion=None, etag=None, raiz=None):
+    """
+    Responde con `archivo` (ruta absoluta) atendiendo GET condicional y Range.
+    `raiz` ('media' o 'static') indica qué location del proxy lo puede enviar
+    cuando ARCHIVOS_PROXY está configurado.
+    """
+    stat = os.stat(archivo)
+    etag = etag or etag_archivo(archivo, stat)
+    if content_type is None:
+        content_type = mimetypes.guess_type(archivo)[0] or 'application/octet-stream'
+
+    if _no_modificado(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+    elif raiz and settings.ARCHIVOS_PROXY:
+        response = HttpResponse(content_type=content_type)
+        cabecera, destino = _ruta_proxy(raiz, archivo)
+        response[cabecera] = destino
+    else:
+        rango = _rango(request, etag, stat.st_mtime, stat.st_size)
+        if rango is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+        elif rango is None:
+            # Archivo completo: el servidor WSGI puede usar sendfile con wsgi.file_wrapper
+            response = FileResponse(open(archivo, 'rb'), content_type=content_type)
+        else:
+            inicio, fin = rango
+            longitud = fin - inicio + 1
+            response = FileResponse(
+                _Tramo(open(archivo, 'rb'), inicio, longitud),
+                content_type=content_type, status=206,
+            )
+            response['Content-Length'] = longitud
+            response['Content-Range'] = f'bytes {inicio}-{fin}/{stat.st_size}'
+        if codificacion and response.status_code != 416:
+            response['Content-Encoding'] = codificacion
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = cache_control
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+@require_safe
+def servir_media(request, ruta):
+    """Sirve un archivo de MEDIA_ROOT (fotos de productos, archivos subidos)."""
+    ruta = posixpath.normpath(ruta).lstrip('/')
+    try:
+        completo = safe_join(settings.MEDIA_ROOT, ruta)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(completo):
+        raise Http404
+
+    por_contenido = RUTA_POR_CONTENIDO.match(ruta)
+    return respuesta_archivo(
+        request, completo,
+        cache_control=CACHE_INMUTABLE if por_contenido else CACHE_REVALIDAR,
+        etag='"%s"' % por_contenido['hash'][:32] if por_contenido else None,
+        raiz='media',
+    )
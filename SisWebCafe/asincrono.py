@@ -0,0 +1,25 @@
+"""
+Utilidades para las vistas asíncronas (checkout, menú y estado del pedido).
+
+Bajo ASGI cada request tiene su propio hilo para el código síncrono
+(ThreadSensitiveContext), así que los sync_to_async de distintos requests
+no se forman en una sola fila. Lo que toca la base fuera del ORM async
+(transacciones, plantillas con context processors) se manda a ese hilo.
+"""
+from asgiref.sync import sync_to_async
+from django.shortcuts import render
+
+
+async def obtener_usuario(request):
+    """
+    request.auser() y lo deja en request.user, así las plantillas y los
+    helpers síncronos no vuelven a cargarlo de la base.
+    """
+    usuario = await request.auser()
+    request.user = usuario
+    return usuario
+
+
+async def renderizar(request, plantilla, contexto=None):
+    # Los context processors (roles, tema) consultan la base
+    return await sync_to_async(render)(request, plantilla, contexto)
@@ -0,0 +1,169 @@
+"""
+Caché de páginas completas para visitantes anónimos.
+
+Las vistas marcadas con @pagina_publica (inicio, lista de productos, tipo de
+pedido) se ven igual para cualquier visitante sin sesión. CachePaginasMiddleware
+va antes de SessionMiddleware: a un GET sin cookie de sesión le responde la
+copia guardada sin cargar la sesión, sin context processors y sin plantillas.
+La llave es la ruta con los parámetros de PARAMETROS_PAGINA; los demás
+(?utm_source=..., ?fbclid=...) no cambian la página y se ignoran, así un
+enlace con parámetros de campaña no llena la caché de copias repetidas.
+
+Las copias y sus candados van en la caché 'paginas', aparte de 'default',
+para que no desplacen a las versiones del catálogo y del tema ni al CSS
+compilado; las versiones se siguen leyendo de 'default'.
+
+Cada copia recuerda la versión del catálogo y la del tema con que se generó.
+Si alguna cambió, la copia está obsoleta: el primer request que lo nota toma
+un candado (cache.add) y regenera la página, y los demás siguen recibiendo la
+copia obsoleta mientras tanto (stale-while-revalidate). Así una edición del
+catálogo no manda a todos los visitantes a reconstruir a la vez.
+
+No se guarda la respuesta si no es un 200, si pone cookies o si la página usó
+el token CSRF (tiene un formulario que se envía por POST).
+"""
+import hashlib
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache, caches
+from django.http import HttpResponse
+from django.utils.http import urlencode
+from django.urls import Resolver404, resolve
+
+from administracion.tema import CLAVE_TEMA, tema_compilado
+from menu.catalogo import CLAVE_VERSION, version_catalogo
+
+ALIAS_CACHE = 'paginas'
+PREFIJO_PAGINA = 'pagina:'
+# Parámetros del query string que leen las vistas con @pagina_publica; una
+# vista pública que lea otro parámetro debe agregarlo aquí
+PARAMETROS_PAGINA = ('categoria', 'subcategoria')
+PREFIJO_CANDADO = 'pagina_candado:'
+# Una copia que nadie regeneró (sin cambios de versión) se descarta a las 24 horas
+DURACION_COPIA = 24 * 60 * 60
+# Si quien regenera la página falla, otro request lo intenta pasado este tiempo
+DURACION_CANDADO = 30
+
+
+def pagina_publica(vista):
+    """Marca una vista cuya respuesta para anónimos puede salir de la caché de páginas."""
+    vista.pagina_publica = True
+    return vista
+
+
+def _respuesta(copia, estado):
+    response = HttpResponse(copia['contenido'], status=copia['status'])
+    for nombre, valor in copia['cabeceras']:
+        response[nombre] = valor
+    response['X-Cache-Pagina'] = estado
+    return response
+
+
+class CachePaginasMiddleware:
+    """Sirve y guarda las páginas públicas de los anónimos. Va antes de SessionMiddleware."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        clave = self.clave(request)
+        if clave is None:
+            return self.get_response(request)
+        versiones, response, candado = self.buscar(clave)
+        if response is not None:
+            return response
+        try:
+            response = self.get_response(request)
+            self.guardar(request, response, clave, versiones)
+        finally:
+            if candado:
+                caches[ALIAS_CACHE].delete(PREFIJO_CANDADO + clave)
+        return response
+
+    async def __acall__(self, request):
+        clave = self.clave(request)
+        if clave is None:
+            return await self.get_response(request)
+        # tema_compilado() consulta la base si la caché perdió el tema
+        versiones, response, candado = await sync_to_async(self.buscar)(clave)
+        if response is not None:
+            return response
+        try:
+            response = await self.get_response(request)
+            await sync_to_async(self.guardar, thread_sensitive=False)(request, response, clave, versiones)
+        finally:
+            if candado:
+                await caches[ALIAS_CACHE].adelete(PREFIJO_CANDADO + clave)
+        return response
+
+    def clave(self, request):
+        """Llave de la página en la caché, o None si el request no usa la caché."""
+        if request.method != 'GET':
+            return None
+        if settings.SESSION_COOKIE_NAME in request.COOKIES or CookieStorage.cookie_name in request.COOKIES:
+            # Sesión iniciada o mensajes pendientes
+            return None
+        try:
+            coincidencia = resolve(request.path_info)
+        except Resolver404:
+            return None
+        if not getattr(coincidencia.func, 'pagina_publica', False):
+            return None
+        # Las métricas por vista también cuentan las respuestas de la caché
+        request.resolver_match = coincidencia
+        consulta = urlencode([
+            (nombre, request.GET[nombre]) for nombre in PARAMETROS_PAGINA if nombre in request.GET
+        ])
+        return PREFIJO_PAGINA + hashlib.md5(f'{request.path}?{consulta}'.encode()).hexdigest()
+
+    def buscar(self, clave):
+        """
+        (versiones vigentes, respuesta a servir, candado tomado). La respuesta
+        es None si la página no está en la caché o si este request debe
+        regenerarla; en el segundo caso tiene el candado y debe soltarlo.
+        """
+        paginas = caches[ALIAS_CACHE]
+        # Las dos versiones en una sola lectura a la caché
+        valores = cache.get_many([CLAVE_VERSION, CLAVE_TEMA])
+        version = valores.get(CLAVE_VERSION)
+        if version is None:
+            version = version_catalogo()
+        tema = valores.get(CLAVE_TEMA) or tema_compilado()
+        versiones = (version, tema['version'])
+
+        copia = paginas.get(clave)
+        if copia is None:
+            return versiones, None, False
+        if copia['versiones'] == versiones:
+            return versiones, _respuesta(copia, 'HIT'), False
+        if paginas.add(PREFIJO_CANDADO + clave, time.time(), DURACION_CANDADO):
+            return versiones, None, True
+        # Otro request ya la está regenerando
+        return versiones, _respuesta(copia, 'STALE'), False
+
+    def guardar(self, request, response, clave, versiones):
+        if response.status_code != 200 or response.streaming or response.cookies:
+            return
+        if request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+            # La página lleva un token CSRF
+            return
+        control = response.get('Cache-Control', '')
+        if 'private' in control or 'no-store' in control:
+            return
+        caches[ALIAS_CACHE].set(clave, {
+            'versiones': versiones,
+            'status': response.status_code,
+            'cabeceras': list(response.items()),
+            'contenido': response.content,
+        }, DURACION_COPIA)
+        response['X-Cache-Pagina'] = 'MISS'
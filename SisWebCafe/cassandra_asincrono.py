@@ -0,0 +1,84 @@
+"""
+Consultas de cqlengine desde vistas asíncronas sin ocupar un hilo.
+
+cqlengine solo sabe ejecutar de forma bloqueante. consultar() arma la misma
+sentencia que el queryset, la manda con session.execute_async del driver y
+espera el ResponseFuture desde el event loop (los callbacks del driver
+llegan en su propio hilo de I/O y se pasan al loop con
+call_soon_threadsafe). Varias consultas lanzadas con asyncio.gather viajan
+a Cassandra a la vez.
+
+Usa el perfil de ejecución y las sentencias preparadas de
+SisWebCafe.cassandra_perfiles, igual que las consultas síncronas.
+
+Con CASSANDRA_BACKEND = 'memoria' no hay red: la sentencia se ejecuta en
+el momento contra las tablas en memoria.
+"""
+import asyncio
+import time
+
+from cassandra.cqlengine import connection
+from cassandra.cqlengine import query as cqlengine_query
+from cassandra.query import SimpleStatement
+
+from . import cassandra_memoria
+from .cassandra_perfiles import medir, perfil_actual, perfil_de_sentencia, preparar
+from .consultas import ALIAS_CASSANDRA, registrar_consulta
+
+
+def _sentencia(model, statement, consistencia):
+    # Igual que cqlengine.query._execute_statement, incluida la routing key
+    sentencia = SimpleStatement(str(statement), consistency_level=consistencia, fetch_size=statement.fetch_size)
+    if model._partition_key_index:
+        valores = statement.partition_key_values(model._partition_key_index)
+        if not any(v is None for v in valores):
+            version = connection.get_cluster(model._get_connection()).protocol_version
+            sentencia.routing_key = model._routing_key_from_values(valores, version)
+            sentencia.keyspace = model._get_keyspace()
+    return sentencia
+
+
+async def _esperar_paginas(futuro):
+    """Todas las filas de un ResponseFuture, pidiendo las páginas siguientes."""
+    loop = asyncio.get_running_loop()
+    paginas = asyncio.Queue()
+    # El driver vuelve a llamar los mismos callbacks en cada página
+    futuro.add_callbacks(
+        lambda filas: loop.call_soon_threadsafe(paginas.put_nowait, (filas, None)),
+        lambda error: loop.call_soon_threadsafe(paginas.put_nowait, (None, error)),
+    )
+    filas = []
+    while True:
+        pagina, error = await paginas.get()
+        if error is not None:
+            raise error
+        filas.extend(pagina)
+        if not futuro.has_more_pages:
+            return filas
+        futuro.start_fetching_next_page()
+
+
+async def ejecutar(model, statement, consistencia=None, timeout=connection.NOT_SET):
+    """Ejecuta una sentencia de cqlengine y devuelve sus filas (dicts)."""
+    if cassandra_memoria.instalado():
+        return list(cqlengine_query._execute_statement(model, statement, consistencia, timeout))
+    sesion = connection.get_session(model._get_connection())
+    sentencia = _sentencia(model, statement, consistencia)
+    perfil = perfil_de_sentencia(sentencia, perfil_actual())
+    sentencia, valores = preparar(sesion, sentencia, statement.get_context(), perfil)
+    inicio = time.perf_counter()
+    futuro = sesion.execute_async(sentencia, valores, timeout=timeout, execution_profile=perfil)
+    filas = await _esperar_paginas(futuro)
+    segundos = time.perf_counter() - inicio
+    medir(perfil, futuro, segundos)
+    registrar_consulta(ALIAS_CASSANDRA, segundos, len(filas))
+    return filas
+
+
+async def consultar(consulta):
+    """Equivalente asíncrono de list(consulta) para un queryset de cqlengine."""
+    constructor = consulta._maybe_inject_deferred(consulta._get_result_constructor())
+    filas = await ejecutar(
+        consulta.model, consulta._select_query(), consulta._consistency, consulta._timeout)
+    return [constructor(fila) for fila in filas]
+
@@ -0,0 +1,272 @@
+"""
+Backend de Cassandra en memoria para pruebas y benchmarks.
+
+Implementa el subconjunto de cqlengine que usa el proyecto (get, filter,
+all, count, save, update, delete, lotes, paginado por token, LWT y columnas
+Map/List/Set/Counter) sobre diccionarios de Python, sin necesidad de un
+cluster. Se activa con CASSANDRA_BACKEND = 'memoria': settings quita el
+alias 'cassandra' de DATABASES, menu.apps llama a instalar() y las pruebas
+corren con EjecutorPruebas, que vacía las tablas antes de cada prueba.
+
+Las tablas viven en el proceso: no sirve para varios workers ni para
+`manage.py test --parallel`.
+"""
+import copy
+import hashlib
+import re
+import threading
+import unittest
+
+from cassandra.cqlengine import models as cqlengine_models
+from cassandra.cqlengine import query as cqlengine_query
+from cassandra.cqlengine import functions, operators, statements
+from django.test.runner import DiscoverRunner
+
+
+KEYSPACE_MEMORIA = 'memoria'
+
+_tablas = {}
+_lock = threading.RLock()
+_instalado = False
+
+
+class ResultadoMemoria(list):
+    """Imita el ResultSet del driver: iterable de filas dict con one()."""
+
+    was_applied = True
+
+    def one(self):
+        return self[0] if self else None
+
+
+def _nombre_tabla(tabla):
+    return tabla.replace('"', '').split('.')[-1]
+
+
+def _clave_primaria(model, fila):
+    return tuple(fila.get(col.db_field_name) for col in model._primary_keys.values())
+
+
+def _modelos_por_tabla():
+    modelos = {}
+    pendientes = list(cqlengine_models.BaseModel.__subclasses__())
+    while pendientes:
+        model = pendientes.pop()
+        pendientes.extend(model.__subclasses__())
+        if getattr(model, '__abstract__', False):
+            continue
+        try:
+            modelos[_nombre_tabla(model.column_family_name(include_keyspace=False))] = model
+        except Exception:
+            continue
+    return modelos
+
+
+def _token(*valores):
+    """Token estable (no es Murmur3, pero da un orden fijo como el de Cassandra)."""
+    digest = hashlib.md5(repr(tuple(str(v) for v in valores)).encode()).digest()
+    return int.from_bytes(digest[:8], 'big', signed=True)
+
+
+_RE_TOKEN = re.compile(r'token\((.*)\)')
+
+
+def _campos_token(campo):
+    match = _RE_TOKEN.fullmatch(campo)
+    return [c.strip().strip('"') for c in match.group(1).split(',')] if match else None
+
+
+def _cumple(fila, clausula):
+    campos = _campos_token(clausula.field)
+    if campos is not None:
+        valor = _token(*(fila.get(c) for c in campos))
+        esperado = _token(*clausula.value.value) if isinstance(clausula.value, functions.Token) else clausula.value
+    else:
+        valor = fila.get(clausula.field)
+        esperado = clausula.value
+    operador = clausula.operator
+    if isinstance(operador, operators.InOperator):
+        return valor in esperado
+    if isinstance(operador, operators.ContainsOperator):
+        return valor is not None and esperado in valor
+    if isinstance(operador, operators.IsNotNullOperator):
+        return valor is not None
+    if isinstance(operador, operators.NotEqualsOperator):
+        return valor != esperado
+    if isinstance(operador, operators.EqualsOperator):
+        return valor == esperado
+    if valor is None:
+        return False
+    if isinstance(operador, operators.GreaterThanOperator):
+        return valor > esperado
+    if isinstance(operador, operators.GreaterThanOrEqualOperator):
+        return valor >= esperado
+    if isinstance(operador, operators.LessThanOperator):
+        return valor < esperado
+    if isinstance(operador, operators.LessThanOrEqualOperator):
+        return valor <= esperado
+    raise NotImplementedError(f'Operador no soportado en memoria: {operador}')
+
+
+def _filas(tabla, where):
+    return [fila for fila in _tablas.get(tabla, {}).values()
+            if all(_cumple(fila, c) for c in where)]
+
+
+def _ordenar(filas, order_by):
+    for condicion in reversed(order_by or []):
+        match = re.match(r'"?(\w+)"?\s*(ASC|DESC)?', condicion.strip(), re.I)
+        campo, sentido = match.group(1), (match.group(2) or 'ASC').upper()
+        filas.sort(key=lambda f: (f.get(campo) is None, f.get(campo)), reverse=sentido == 'DESC')
+    return filas
+
+
+def _select(statement, model=None):
+    filas = _filas(_nombre_tabla(statement.table), statement.where_clauses)
+    if statement.count:
+        return ResultadoMemoria([{'count': len(filas)}])
+    if model is not None and not statement.order_by:
+        # Cassandra devuelve las filas en orden de token de la partición y,
+        # dentro de cada partición, en el de sus columnas de clustering
+        for col in reversed(model._clustering_keys.values()):
+            filas.sort(key=lambda f: f.get(col.db_field_name), reverse=(col.clustering_order or '').upper() == 'DESC')
+        particion = [col.db_field_name for col in model._partition_keys.values()]
+        filas.sort(key=lambda f: _token(*(f.get(c) for c in particion)))
+    filas = _ordenar(filas, statement.order_by)
+    if statement.limit:
+        filas = filas[:statement.limit]
+    campos = statement.distinct_fields or statement.fields
+    if campos:
+        filas = [{c: f.get(c) for c in campos} for f in filas]
+    return ResultadoMemoria(copy.deepcopy(filas))
+
+
+def _condiciones_cumplidas(fila, statement):
+    return all(fila is not None and fila.get(c.field) == c.value for c in statement.conditionals)
+
+
+def _no_aplicado(fila):
+    resultado = ResultadoMemoria([dict(fila or {}, **{'[applied]': False})])
+    resultado.was_applied = False
+    return resultado
+
+
+def _insert(model, statement):
+    tabla = _tablas.setdefault(_nombre_tabla(statement.table), {})
+    nueva = {c.field: copy.deepcopy(c.value) for c in statement.assignments}
+    clave = _clave_primaria(model, nueva)
+    if statement.if_not_exists and clave in tabla:
+        return _no_aplicado(tabla[clave])
+    fila = tabla.setdefault(clave, {})
+    fila.update(nueva)
+    return ResultadoMemoria()
+
+
+def _valor_asignado(clausula, actual):
+    if isinstance(clausula, statements.CounterUpdateClause):
+        return (actual or 0) + clausula.value - clausula.previous
+    return copy.deepcopy(clausula.value)
+
+
+def _update(model, statement):
+    tabla = _tablas.setdefault(_nombre_tabla(statement.table), {})
+    claves = {c.field: c.value for c in statement.where_clauses}
+    clave = _clave_primaria(model, claves)
+    existente = tabla.get(clave)
+    if (statement.if_exists and existente is None) or not _condiciones_cumplidas(existente, statement):
+        return _no_aplicado(existente)
+    fila = tabla.setdefault(clave, dict(claves))
+    for clausula in statement.assignments:
+        fila[clausula.field] = _valor_asignado(clausula, fila.get(clausula.field))
+    return ResultadoMemoria()
+
+
+def _delete(statement):
+    tabla = _tablas.setdefault(_nombre_tabla(statement.table), {})
+    afectadas = [clave for clave, fila in tabla.items()
+                 if all(_cumple(fila, c) for c in statement.where_clauses)]
+    if statement.if_exists and not afectadas:
+        return _no_aplicado(None)
+    for clave in afectadas:
+        if not _condiciones_cumplidas(tabla[clave], statement):
+            return _no_aplicado(tabla[clave])
+        if not statement.fields:
+            del tabla[clave]
+            continue
+        for campo in statement.fields:
+            if isinstance(campo, statements.MapDeleteClause):
+                campo._analyze()
+                for llave in campo._removals:
+                    (tabla[clave].get(campo.field) or {}).pop(llave, None)
+            else:
+                tabla[clave][getattr(campo, 'field', campo)] = None
+    return ResultadoMemoria()
+
+
+def ejecutar(model, statement):
+    """Ejecuta una sentencia de cqlengine contra las tablas en memoria."""
+    with _lock:
+        if isinstance(statement, statements.SelectStatement):
+            return _select(statement, model)
+        if isinstance(statement, statements.InsertStatement):
+            return _insert(model, statement)
+        if isinstance(statement, statements.UpdateStatement):
+            return _update(model, statement)
+        if isinstance(statement, statements.DeleteStatement):
+            return _delete(statement)
+    raise NotImplementedError(f'Sentencia no soportada en memoria: {statement}')
+
+
+def _execute_statement(model, statement, consistency_level, timeout, connection=None):
+    return ejecutar(model, statement)
+
+
+def _batch_execute(batch):
+    batch._executed = True
+    modelos = _modelos_por_tabla()
+    with _lock:
+        for statement in batch.queries:
+            ejecutar(modelos.get(_nombre_tabla(statement.table)), statement)
+    batch.queries = []
+    batch._execute_callbacks()
+
+
+def limpiar():
+    """Vacía todas las tablas en memoria."""
+    with _lock:
+        _tablas.clear()
+
+
+# El original, para las pruebas que necesitan el lote tal como lo arma cqlengine
+batch_execute_cqlengine = cqlengine_query.BatchQuery.execute
+
+
+def instalar():
+    """Redirige la ejecución de cqlengine al almacén en memoria."""
+    global _instalado
+    if _instalado:
+        return
+    cqlengine_models.DEFAULT_KEYSPACE = cqlengine_models.DEFAULT_KEYSPACE or KEYSPACE_MEMORIA
+    cqlengine_query._execute_statement = _execute_statement
+    cqlengine_query.BatchQuery.execute = _batch_execute
+    _instalado = True
+
+
+def instalado():
+    return _instalado
+
+
+class _LimpiarAlEmpezar:
+    def startTest(self, test):
+        # Cada prueba empieza con Cassandra vacía, como hace el flush de
+        # django_cassandra_engine con el cluster
+        limpiar()
+        super().startTest(test)
+
+
+class EjecutorPruebas(DiscoverRunner):
+    """Test runner para CASSANDRA_BACKEND = 'memoria'."""
+
+    def get_resultclass(self):
+        base = super().get_resultclass() or unittest.TextTestResult
+        return type('ResultadoPruebasMemoria', (_LimpiarAlEmpezar, base), {})
@@ -0,0 +1,291 @@
+"""
+Perfiles de ejecución de Cassandra por carga de trabajo y sentencias preparadas.
+
+perfiles_de_ejecucion() arma los ExecutionProfile que settings pasa al
+Cluster (OPTIONS['connection']['execution_profiles']):
+
+- PERFIL_MENU: lecturas del menú y del carrito a LOCAL_ONE con ejecución
+  especulativa; si la réplica tarda, se pregunta a otra sin esperar.
+- PERFIL_ADMIN: escrituras del catálogo (menu.views, administracion) a
+  LOCAL_QUORUM. Toda escritura (también los lotes de las tablas de consulta)
+  usa este perfil salvo dentro de PERFIL_MASIVO.
+- PERFIL_MASIVO: comandos que recorren tablas completas, con páginas
+  grandes y timeout largo.
+
+Todos balancean con LatenciaPrimero(TokenAwarePolicy(DCAwareRoundRobinPolicy)):
+primero las réplicas del dato, y al final los hosts que están respondiendo
+lento.
+
+El código elige el perfil con perfil_cassandra(), como bloque `with` o como
+decorador de vistas. instalar() reemplaza la función por la que cqlengine
+ejecuta todo: aplica el perfil vigente, prepara las sentencias que se
+repiten (el texto de cqlengine no incluye los valores, así que hay pocas
+distintas) y publica la latencia de cada perfil en /metrics.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+import re
+import threading
+import time
+
+from cassandra import ConsistencyLevel, InvalidRequest
+from cassandra.cluster import EXEC_PROFILE_DEFAULT, ExecutionProfile
+from cassandra.cqlengine import connection as cqlengine_connection
+from cassandra.cqlengine.statements import BaseCQLStatement
+from cassandra.policies import (
+    ConstantSpeculativeExecutionPolicy, DCAwareRoundRobinPolicy, TokenAwarePolicy, WrapperPolicy,
+)
+from cassandra.protocol import SyntaxException
+from cassandra.query import BatchStatement, SimpleStatement, dict_factory
+from prometheus_client import Histogram
+
+logger = logging.getLogger(__name__)
+
+PERFIL_MENU = 'menu'
+PERFIL_ADMIN = 'admin'
+PERFIL_MASIVO = 'masivo'
+
+# Filas por página en PERFIL_MASIVO
+TAMANIO_PAGINA_MASIVO = 10000
+# Una sentencia se prepara la segunda vez que se ejecuta: las que corren una
+# sola vez (migraciones, consultas de un comando) no pagan el viaje extra
+USOS_PARA_PREPARAR = 2
+MAXIMO_PREPARADAS = 512
+
+LATENCIA_PERFIL = Histogram(
+    'siswebcafe_cassandra_perfil_segundos',
+    'Duración de las consultas a Cassandra por perfil de ejecución',
+    ['perfil'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 10),
+)
+
+# Marcadores %(n)s que cqlengine deja en el texto de la sentencia
+MARCADOR = re.compile(r'%\((\w+)\)s')
+PREPARABLES = ('SELECT', 'INSERT', 'UPDATE', 'DELETE')
+
+_perfil_actual = ContextVar('perfil_cassandra', default=EXEC_PROFILE_DEFAULT)
+
+
+@contextmanager
+def perfil_cassandra(nombre):
+    """Ejecuta las consultas de Cassandra del bloque (o de la vista decorada) con el perfil `nombre`."""
+    token = _perfil_actual.set(nombre)
+    try:
+        yield
+    finally:
+        _perfil_actual.reset(token)
+
+
+def perfil_actual():
+    return _perfil_actual.get()
+
+
+def perfil_de_sentencia(sentencia, perfil):
+    """Perfil con que se ejecuta `sentencia`: las escrituras van a PERFIL_ADMIN."""
+    if perfil == PERFIL_MASIVO:
+        return perfil
+    if isinstance(sentencia, BatchStatement) or not sentencia.query_string.lstrip().startswith('SELECT'):
+        return PERFIL_ADMIN
+    return perfil
+
+
+def nombre_perfil(perfil):
+    return 'default' if perfil is EXEC_PROFILE_DEFAULT else perfil
+
+
+class _Latencias:
+    """Promedio móvil de la latencia de cada host, con la hora de la última medición."""
+
+    def __init__(self, peso=0.1):
+        self.peso = peso
+        self.hosts = {}
+
+    def registrar(self, host, segundos):
+        if host is None:
+            return
+        anterior = self.hosts.get(host)
+        promedio = segundos if anterior is None else anterior[0] + self.peso * (segundos - anterior[0])
+        self.hosts[host] = (promedio, time.monotonic())
+
+    def vigente(self, host, vigencia):
+        medicion = self.hosts.get(host)
+        if medicion is None or time.monotonic() - medicion[1] > vigencia:
+            return None
+        return medicion[0]
+
+
+latencias = _Latencias()
+
+
+class LatenciaPrimero(WrapperPolicy):
+    """
+    Manda al final del plan de la política hija los hosts cuya latencia
+    promedio pasa de `umbral` veces la del más rápido. Una medición más vieja
+    que `vigencia` segundos no cuenta, así un host que se recuperó vuelve a
+    recibir consultas.
+    """
+
+    def __init__(self, child_policy, umbral=2.0, vigencia=10.0):
+        super().__init__(child_policy)
+        self.umbral = umbral
+        self.vigencia = vigencia
+
+    def make_query_plan(self, working_keyspace=None, query=None):
+        plan = list(self._child_policy.make_query_plan(working_keyspace, query))
+        medidas = {host: latencias.vigente(host, self.vigencia) for host in plan}
+        conocidas = [m for m in medidas.values() if m is not None]
+        if not conocidas:
+            yield from plan
+            return
+        limite = min(conocidas) * self.umbral
+        lentos = []
+        for host in plan:
+            if medidas[host] is not None and medidas[host] > limite:
+                lentos.append(host)
+            else:
+                yield host
+        yield from lentos
+
+
+def perfiles_de_ejecucion(dc_local=None, espera_especulativa=0.05):
+    """ExecutionProfile por nombre para Cluster(execution_profiles=...)."""
+
+    def balanceo():
+        return LatenciaPrimero(TokenAwarePolicy(DCAwareRoundRobinPolicy(local_dc=dc_local)))
+
+    # cqlengine lee las filas como dicts
+    return {
+        EXEC_PROFILE_DEFAULT: ExecutionProfile(
+            load_balancing_policy=balanceo(),
+            consistency_level=ConsistencyLevel.LOCAL_ONE,
+            row_factory=dict_factory,
+        ),
+        PERFIL_MENU: ExecutionProfile(
+            load_balancing_policy=balanceo(),
+            consistency_level=ConsistencyLevel.LOCAL_ONE,
+            speculative_execution_policy=ConstantSpeculativeExecutionPolicy(espera_especulativa, 2),
+            request_timeout=5.0,
+            row_factory=dict_factory,
+        ),
+        PERFIL_ADMIN: ExecutionProfile(
+            load_balancing_policy=balanceo(),
+            consistency_level=ConsistencyLevel.LOCAL_QUORUM,
+            serial_consistency_level=ConsistencyLevel.LOCAL_SERIAL,
+            request_timeout=10.0,
+            row_factory=dict_factory,
+        ),
+        PERFIL_MASIVO: ExecutionProfile(
+            load_balancing_policy=balanceo(),
+            consistency_level=ConsistencyLevel.LOCAL_ONE,
+            request_timeout=60.0,
+            row_factory=dict_factory,
+        ),
+    }
+
+
+class _Preparadas:
+    """
+    Caché LRU por sesión y texto de sentencia. El valor es la sentencia
+    preparada, el número de usos mientras no llega a USOS_PARA_PREPARAR o
+    None si Cassandra no la pudo preparar.
+    """
+
+    def __init__(self, maximo=MAXIMO_PREPARADAS):
+        self.maximo = maximo
+        self.sentencias = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _guardar(self, clave, valor):
+        self.sentencias[clave] = valor
+        self.sentencias.move_to_end(clave)
+        while len(self.sentencias) > self.maximo:
+            self.sentencias.popitem(last=False)
+
+    def obtener(self, sesion, texto):
+        clave = (sesion, texto)
+        with self.lock:
+            valor = self.sentencias.get(clave, 0)
+            if not isinstance(valor, int):
+                self.sentencias.move_to_end(clave)
+                return valor
+            if valor + 1 < USOS_PARA_PREPARAR:
+                self._guardar(clave, valor + 1)
+                return None
+        # Fuera del lock: dos hilos pueden preparar la misma a la vez, no pasa nada
+        try:
+            preparada = sesion.prepare(texto)
+        except (SyntaxException, InvalidRequest):
+            logger.warning('No se pudo preparar la sentencia: %s', texto, exc_info=True)
+            preparada = None
+        except Exception:
+            # Falla pasajera (timeout, nodo caído): se reintenta en otro uso
+            logger.warning('Error al preparar la sentencia: %s', texto, exc_info=True)
+            return None
+        with self.lock:
+            self._guardar(clave, preparada)
+        return preparada
+
+
+preparadas = _Preparadas()
+
+
+def preparar(sesion, sentencia, parametros, perfil=None):
+    """
+    (sentencia, parámetros) a ejecutar para una SimpleStatement de cqlengine:
+    la versión preparada si la sentencia ya se repitió, o la misma si no.
+    """
+    texto = sentencia.query_string
+    lectura = texto.startswith('SELECT')
+    if lectura and perfil == PERFIL_MASIVO and not sentencia.fetch_size:
+        sentencia.fetch_size = TAMANIO_PAGINA_MASIVO
+    # Sin esto el driver no hace ejecución especulativa
+    sentencia.is_idempotent = lectura
+
+    if not texto.startswith(PREPARABLES) or not isinstance(parametros, dict):
+        return sentencia, parametros
+    preparada = preparadas.obtener(sesion, MARCADOR.sub('?', texto))
+    if preparada is None:
+        return sentencia, parametros
+    ligada = preparada.bind([parametros[nombre] for nombre in MARCADOR.findall(texto)])
+    ligada.consistency_level = sentencia.consistency_level
+    ligada.serial_consistency_level = sentencia.serial_consistency_level
+    ligada.fetch_size = sentencia.fetch_size
+    ligada.is_idempotent = sentencia.is_idempotent
+    return ligada, None
+
+
+def medir(perfil, futuro, segundos):
+    """Registra la latencia del perfil y la del host que respondió."""
+    LATENCIA_PERFIL.labels(nombre_perfil(perfil)).observe(segundos)
+    latencias.registrar(futuro.coordinator_host, segundos)
+
+
+def ejecutar(query, params=None, consistency_level=None, timeout=cqlengine_connection.NOT_SET,
+             connection=None):
+    """Reemplazo de cqlengine.connection.execute con perfiles y sentencias preparadas."""
+    # Igual que el original: BatchQuery manda el lote como texto
+    if isinstance(query, BaseCQLStatement):
+        params = query.get_context()
+        query = SimpleStatement(str(query), consistency_level=consistency_level, fetch_size=query.fetch_size)
+    elif isinstance(query, str):
+        query = SimpleStatement(query, consistency_level=consistency_level)
+    sesion = cqlengine_connection.get_session(connection)
+    perfil = perfil_de_sentencia(query, perfil_actual())
+    if isinstance(query, BatchStatement):
+        sentencia, valores = query, params
+    else:
+        sentencia, valores = preparar(sesion, query, params, perfil)
+    inicio = time.perf_counter()
+    futuro = sesion.execute_async(sentencia, valores, timeout=timeout, execution_profile=perfil)
+    try:
+        return futuro.result()
+    finally:
+        medir(perfil, futuro, time.perf_counter() - inicio)
+
+
+def instalar():
+    """Hace que cqlengine ejecute con ejecutar(). Se llama desde menu.apps."""
+    if cqlengine_connection.execute is not ejecutar:
+        cqlengine_connection.execute = ejecutar
@@ -0,0 +1,197 @@
+"""
+Conteo y métricas de consultas por request a PostgreSQL y a Cassandra.
+
+contar_consultas() registra cada sentencia SQL (con execute_wrapper de cada
+conexión) y cada sentencia que cqlengine manda a Cassandra durante el
+bloque: cuántas, cuánto tardó cada una y cuántas filas devolvió, por alias
+de base de datos. El contador vive en un ContextVar, así los requests
+concurrentes de otros hilos no se mezclan.
+
+ConteoConsultasMiddleware lo aplica a cada request:
+
+- Con METRICAS_CONSULTAS = True publica en /metrics (django_prometheus) los
+  histogramas de consultas por request, latencia y filas por consulta,
+  etiquetados por vista resuelta y alias. Sirven para alertar de N+1.
+- Con CONTAR_CONSULTAS = True agrega X-Consultas-SQL y X-Consultas-Cassandra
+  a la respuesta; benchmarks/carga_cafe.py las lee.
+
+Con ambos apagados el middleware no se instala.
+"""
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from cassandra.cqlengine import query as cqlengine_query
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from prometheus_client import Histogram
+
+ALIAS_CASSANDRA = 'cassandra'
+# Vista de los requests que no resolvieron a ninguna (404, estáticos de otro servidor)
+SIN_VISTA = '<sin_vista>'
+
+CONSULTAS_POR_REQUEST = Histogram(
+    'siswebcafe_consultas_por_request',
+    'Consultas a la base de datos por request',
+    ['vista', 'alias'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144),
+)
+LATENCIA_CONSULTA = Histogram(
+    'siswebcafe_consulta_segundos',
+    'Duración de cada consulta a la base de datos',
+    ['vista', 'alias'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+FILAS_CONSULTA = Histogram(
+    'siswebcafe_consulta_filas',
+    'Filas devueltas (o afectadas) por cada consulta',
+    ['vista', 'alias'],
+    buckets=(0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000),
+)
+
+_contador_actual = ContextVar('contador_consultas', default=None)
+_instalacion = threading.Lock()
+
+
+class ContadorConsultas:
+    def __init__(self, padre=None):
+        # alias -> [(segundos, filas), ...]
+        self.consultas = defaultdict(list)
+        # Contador del bloque que encierra a este; también ve estas consultas
+        self.padre = padre
+
+    def registrar(self, alias, segundos, filas):
+        self.consultas[alias].append((segundos, filas))
+        if self.padre is not None:
+            self.padre.registrar(alias, segundos, filas)
+
+    @property
+    def sql(self):
+        return sum(len(c) for alias, c in self.consultas.items() if alias != ALIAS_CASSANDRA)
+
+    @property
+    def cassandra(self):
+        return len(self.consultas[ALIAS_CASSANDRA])
+
+
+def registrar_consulta(alias, segundos, filas):
+    """Suma una consulta al contador del request en curso, si lo hay."""
+    contador = _contador_actual.get()
+    if contador is not None:
+        contador.registrar(alias, segundos, filas)
+
+
+def _filas_cassandra(resultado):
+    filas = getattr(resultado, 'current_rows', resultado)
+    try:
+        return len(filas)
+    except TypeError:
+        return 0
+
+
+def _instalar_conteo_cassandra():
+    """Envuelve una sola vez la función por la que cqlengine ejecuta todo."""
+    with _instalacion:
+        if getattr(cqlengine_query._execute_statement, 'cuenta_consultas', False):
+            return
+        original = cqlengine_query._execute_statement
+
+        def ejecutar(*args, **kwargs):
+            if _contador_actual.get() is None:
+                return original(*args, **kwargs)
+            inicio = time.perf_counter()
+            resultado = original(*args, **kwargs)
+            registrar_consulta(ALIAS_CASSANDRA, time.perf_counter() - inicio, _filas_cassandra(resultado))
+            return resultado
+
+        ejecutar.cuenta_consultas = True
+        cqlengine_query._execute_statement = ejecutar
+
+
+def _contar_sql(execute, sql, params, many, context):
+    contador = _contador_actual.get()
+    if contador is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        # rowcount: filas del SELECT o afectadas por INSERT/UPDATE/DELETE
+        filas = getattr(context['cursor'], 'rowcount', -1)
+        contador.registrar(context['connection'].alias, time.perf_counter() - inicio, max(filas, 0))
+
+
+@contextmanager
+def contar_consultas():
+    """
+    Registra las sentencias SQL y de Cassandra ejecutadas dentro del bloque.
+    Los bloques se pueden anidar: cada consulta cuenta en todos.
+    """
+    _instalar_conteo_cassandra()
+    padre = _contador_actual.get()
+    contador = ContadorConsultas(padre)
+    token = _contador_actual.set(contador)
+    try:
+        with ExitStack() as pila:
+            # Dentro de otro bloque los wrappers ya están puestos
+            if padre is None:
+                for conexion in connections.all():
+                    if conexion.vendor != 'cassandra':
+                        pila.enter_context(conexion.execute_wrapper(_contar_sql))
+            yield contador
+    finally:
+        _contador_actual.reset(token)
+
+
+def publicar_metricas(vista, contador):
+    """Observa en Prometheus las consultas de un request ya terminado."""
+    aliases = {alias for alias in settings.DATABASES if connections[alias].vendor != 'cassandra'}
+    for alias in aliases | {ALIAS_CASSANDRA} | set(contador.consultas):
+        consultas = contador.consultas.get(alias, ())
+        # Se observa también el cero: el promedio por request no se sesga
+        CONSULTAS_POR_REQUEST.labels(vista, alias).observe(len(consultas))
+        for segundos, filas in consultas:
+            LATENCIA_CONSULTA.labels(vista, alias).observe(segundos)
+            FILAS_CONSULTA.labels(vista, alias).observe(filas)
+
+
+class ConteoConsultasMiddleware:
+    """Mide las consultas de cada request y las publica en /metrics y/o en cabeceras."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.metricas = getattr(settings, 'METRICAS_CONSULTAS', True)
+        self.cabeceras = getattr(settings, 'CONTAR_CONSULTAS', False)
+        if not (self.metricas or self.cabeceras):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            # Con ASGI las vistas asíncronas no pasan por un hilo por culpa de este middleware
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with contar_consultas() as contador:
+            response = self.get_response(request)
+        return self.publicar(request, response, contador)
+
+    async def __acall__(self, request):
+        with contar_consultas() as contador:
+            response = await self.get_response(request)
+        return self.publicar(request, response, contador)
+
+    def publicar(self, request, response, contador):
+        if self.metricas:
+            coincidencia = getattr(request, 'resolver_match', None)
+            publicar_metricas(coincidencia.view_name if coincidencia else SIN_VISTA, contador)
+        if self.cabeceras:
+            response['X-Consultas-SQL'] = contador.sql
+            response['X-Consultas-Cassandra'] = contador.cassandra
+        return response
@@ -1,4 +1,5 @@
+from .roles import es_gerente as usuario_es_gerente
+
+
 def es_gerente(request):
-    if request.user.is_authenticated:
-        return {'es_gerente': request.user.groups.filter(name='Gerente').exists()}
-    return {'es_gerente': False}
+    return {'es_gerente': usuario_es_gerente(request.user)}
@@ -0,0 +1,113 @@
+"""
+Archivos estáticos con nombre por hash, precomprimidos y con caché larga.
+
+EstaticosComprimidos es el storage de collectstatic: además del manifiesto
+con los nombres con hash de ManifestStaticFilesStorage, deja junto a cada
+archivo de texto su versión .gz y, si está instalado el paquete brotli, .br.
+servir_estatico() elige la variante según Accept-Encoding sin comprimir
+nada por request y la entrega con SisWebCafe.archivos (ETag, 304, Range);
+los nombres con hash se sirven con Cache-Control immutable porque su
+contenido nunca cambia.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, StaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import require_safe
+
+from .archivos import CACHE_INMUTABLE, CACHE_REVALIDAR, respuesta_archivo
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se generan .gz
+    brotli = None
+
+# Solo vale la pena comprimir formatos de texto; imágenes y video ya vienen comprimidos
+EXTENSIONES_COMPRIMIBLES = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.xml', '.map', '.ico')
+TAMANIO_MINIMO = 256
+
+# (sufijo, Content-Encoding) en orden de preferencia
+CODIFICACIONES = (('.br', 'br'), ('.gz', 'gzip'))
+
+
+class EstaticosComprimidos(ManifestStaticFilesStorage):
+
+    def url(self, name, force=False):
+        try:
+            return super().url(name, force)
+        except ValueError:
+            # Sin collectstatic (desarrollo, pruebas) no hay manifiesto: nombre original
+            return StaticFilesStorage.url(self, name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        # El padre hace varias pasadas y puede devolver un archivo más de una vez
+        procesados = {}
+        for nombre, hashed, procesado in super().post_process(paths, dry_run, **options):
+            procesados[nombre] = hashed
+            yield nombre, hashed, procesado
+        if dry_run:
+            return
+        for nombre, hashed in procesados.items():
+            # El original y su copia con hash se sirven ambos
+            for ruta in {nombre, hashed or nombre}:
+                self.comprimir(ruta)
+
+    def comprimir(self, nombre):
+        if not nombre.endswith(EXTENSIONES_COMPRIMIBLES):
+            return
+        with self.open(nombre) as archivo:
+            contenido = archivo.read()
+        if len(contenido) < TAMANIO_MINIMO:
+            return
+        ruta = self.path(nombre)
+        with open(ruta + '.gz', 'wb') as destino:
+            # mtime=0 para que el .gz sea reproducible entre builds
+            destino.write(gzip.compress(contenido, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(ruta + '.br', 'wb') as destino:
+                destino.write(brotli.compress(contenido))
+
+
+def _nombres_con_hash():
+    return set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+
+@require_safe
+def servir_estatico(request, ruta):
+    """Sirve un archivo de STATIC_ROOT con la mejor variante precomprimida que acepte el cliente."""
+    ruta = posixpath.normpath(ruta).lstrip('/')
+    try:
+        completo = safe_join(settings.STATIC_ROOT, ruta)
+        if not os.path.isfile(completo):
+            # Sin collectstatic se buscan en las carpetas de origen
+            completo = finders.find(ruta)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not completo or not os.path.isfile(completo):
+        raise Http404
+
+    aceptadas = request.headers.get('Accept-Encoding', '')
+    archivo, codificacion = completo, None
+    for sufijo, nombre_codificacion in CODIFICACIONES:
+        if nombre_codificacion in aceptadas and os.path.isfile(completo + sufijo):
+            archivo, codificacion = completo + sufijo, nombre_codificacion
+            break
+
+    response = respuesta_archivo(
+        request, archivo,
+        content_type=mimetypes.guess_type(completo)[0],
+        cache_control=CACHE_INMUTABLE if ruta in _nombres_con_hash() else CACHE_REVALIDAR,
+        codificacion=codificacion,
+        # Las copias de collectstatic las puede enviar el proxy; las de origen no
+        raiz='static' if completo.startswith(os.path.join(settings.STATIC_ROOT, '')) else None,
+    )
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
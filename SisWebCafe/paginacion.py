@@ -0,0 +1,55 @@
+"""
+Paginación por llave (keyset) sobre un campo de fecha y el id.
+
+En lugar de OFFSET, cada página pide las filas anteriores a la última que
+se mostró, así el costo de una página no depende de cuántas filas hay antes.
+El cursor es opaco para el cliente: base64 de "<fecha iso>|<id>".
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+
+def codificar_cursor(valor, pk):
+    texto = f'{valor.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """Devuelve (fecha, id) o None si el cursor no es válido."""
+    if not cursor:
+        return None
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        texto = base64.urlsafe_b64decode(cursor + relleno).decode()
+        valor, pk = texto.split('|')
+        return datetime.fromisoformat(valor), int(pk)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+
+
+def paginar_por_llave(queryset, cursor=None, campo='fecha_hora', por_pagina=50):
+    """
+    Ordena por (campo, id) descendente y devuelve (objetos, siguiente_cursor)
+    con las filas posteriores al cursor. siguiente_cursor es None en la
+    última página. Un cursor inválido se trata como la primera página.
+    """
+    queryset = queryset.order_by(f'-{campo}', '-id')
+    posicion = decodificar_cursor(cursor)
+    if posicion:
+        valor, pk = posicion
+        # El filtro redundante campo <= valor deja al planner recorrer el
+        # índice (campo, id) desde el cursor en lugar de evaluar el OR completo
+        queryset = queryset.filter(**{f'{campo}__lte': valor}).filter(
+            Q(**{f'{campo}__lt': valor}) | Q(**{campo: valor, 'id__lt': pk})
+        )
+
+    objetos = list(queryset[:por_pagina + 1])
+    siguiente = None
+    if len(objetos) > por_pagina:
+        objetos = objetos[:por_pagina]
+        ultimo = objetos[-1]
+        siguiente = codificar_cursor(getattr(ultimo, campo), ultimo.pk)
+    return objetos, siguiente
@@ -0,0 +1,142 @@
+"""
+Resolución de roles (grupos) del usuario con memoria por request y por sesión.
+
+roles_de(user) devuelve el frozenset de nombres de grupo. El resultado se
+guarda en el objeto user (dura lo que dura el request) y en la sesión junto
+con una versión; la versión se cambia cuando cambian los grupos del usuario o
+los grupos mismos, así la sesión nunca sirve roles viejos. La versión vive en
+la base (miInicio.VersionRoles) igual que las sesiones: en una caché por
+proceso, un proceso que no vio la invalidación aceptaría la sesión vieja. En
+estado estable una verificación de rol es una lectura por llave primaria en
+lugar de la consulta de grupos.
+
+RolesMiddleware publica la sesión del request para que funciones que solo
+reciben el usuario (como las de user_passes_test) también la aprovechen.
+"""
+from contextvars import ContextVar
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from miInicio.models import VersionRoles
+
+GRUPO_GERENTE = 'Gerente'
+
+CLAVE_SESION = '_roles_usuario'
+CLAVE_VERSION_GRUPOS = 'grupos'
+PREFIJO_VERSION_USUARIO = 'usuario:'
+
+_sesion_actual = ContextVar('sesion_roles', default=None)
+
+
+def _clave_usuario(user_id):
+    return f'{PREFIJO_VERSION_USUARIO}{user_id}'
+
+
+def version_roles(user_id):
+    """Versión de los roles de un usuario: (versión global de grupos, versión del usuario)."""
+    clave = _clave_usuario(user_id)
+    versiones = dict(
+        VersionRoles.objects.filter(clave__in=[CLAVE_VERSION_GRUPOS, clave]).values_list('clave', 'version'))
+    return [versiones.get(CLAVE_VERSION_GRUPOS), versiones.get(clave)]
+
+
+def invalidar_roles(user_ids=None):
+    """
+    Invalida los roles guardados en sesión de los usuarios indicados, o de
+    todos si user_ids es None (por ejemplo, al renombrar un grupo).
+    """
+    version = time.time_ns()
+    claves = [CLAVE_VERSION_GRUPOS] if user_ids is None else [_clave_usuario(user_id) for user_id in user_ids]
+    VersionRoles.objects.bulk_create(
+        [VersionRoles(clave=clave, version=version) for clave in claves],
+        update_conflicts=True, unique_fields=['clave'], update_fields=['version'],
+    )
+
+
+def roles_de(user):
+    """Nombres de los grupos del usuario como frozenset (vacío si es anónimo)."""
+    if not user.is_authenticated:
+        return frozenset()
+
+    roles = getattr(user, '_roles', None)
+    if roles is not None:
+        return roles
+
+    sesion = _sesion_actual.get()
+    version = version_roles(user.pk)
+    guardado = sesion.get(CLAVE_SESION) if sesion is not None else None
+    if guardado and guardado['usuario'] == user.pk and guardado['version'] == version:
+        roles = frozenset(guardado['roles'])
+    else:
+        roles = frozenset(user.groups.values_list('name', flat=True))
+        if sesion is not None:
+            sesion[CLAVE_SESION] = {
+                'usuario': user.pk,
+                'version': version,
+                'roles': sorted(roles),
+            }
+
+    user._roles = roles
+    return roles
+
+
+def es_gerente(user):
+    return GRUPO_GERENTE in roles_de(user)
+
+
+class RolesMiddleware:
+    """Expone la sesión del request a roles_de(). Va después de AuthenticationMiddleware."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _sesion_actual.set(getattr(request, 'session', None))
+        try:
+            return self.get_response(request)
+        finally:
+            _sesion_actual.reset(token)
+
+    async def __acall__(self, request):
+        # La variable de contexto llega a los sync_to_async que llame la vista
+        token = _sesion_actual.set(getattr(request, 'session', None))
+        try:
+            return await self.get_response(request)
+        finally:
+            _sesion_actual.reset(token)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def roles_cambiados(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        return
+    if not reverse:
+        if action == 'pre_clear':
+            return
+        # user.groups.add/remove/clear
+        instance.__dict__.pop('_roles', None)
+        invalidar_roles([instance.pk])
+    elif action == 'pre_clear':
+        # group.user_set.clear(): después del clear ya no se sabe quiénes eran
+        instance._usuarios_por_limpiar = list(instance.user_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        invalidar_roles(getattr(instance, '_usuarios_por_limpiar', []))
+    else:
+        invalidar_roles(pk_set)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def grupo_cambiado(sender, **kwargs):
+    invalidar_roles()
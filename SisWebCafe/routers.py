@@ -1,3 +1,10 @@
+# Modelos de menu que viven en Cassandra
+MODELOS_CASSANDRA = {
+    'Categoria', 'Subcategoria', 'Producto', 'AtributoSubcategoria', 'ReferenciaImagen',
+    'ProductoPorCategoria', 'SubcategoriaPorCategoria', 'AtributoPorSubcategoria',
+}
+
+
 class CassandraRouter:
     """
     Router para dirigir las operaciones de modelos específicos a Cassandra
@@ -10,7 +17,7 @@ class CassandraRouter:
         """
         if model._meta.app_label == 'menu':
             # Los modelos de productos van a Cassandra
-            if model.__name__ in ['Categoria', 'Subcategoria', 'Producto', 'AtributoSubcategoria']:
+            if model.__name__ in MODELOS_CASSANDRA:
                 return 'cassandra'
         return 'default'
 
@@ -20,7 +27,7 @@ class CassandraRouter:
         """
         if model._meta.app_label == 'menu':
             # Los modelos de productos van a Cassandra
-            if model.__name__ in ['Categoria', 'Subcategoria', 'Producto', 'AtributoSubcategoria']:
+            if model.__name__ in MODELOS_CASSANDRA:
                 return 'cassandra'
         return 'default'
 
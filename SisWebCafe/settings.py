@@ -23,6 +23,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.sites',
+    'django.contrib.postgres',
     'django_cassandra_engine',
     'crispy_forms',
     'crispy_bootstrap4',
@@ -47,10 +48,14 @@ INTERNAL_IPS = [
 
 MIDDLEWARE = [
     'django_prometheus.middleware.PrometheusBeforeMiddleware',
+    'SisWebCafe.consultas.ConteoConsultasMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Antes de la sesión: las páginas públicas de los anónimos salen de la caché
+    'SisWebCafe.cache_paginas.CachePaginasMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'SisWebCafe.roles.RolesMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
@@ -103,7 +108,17 @@ DATABASES = {
         'HOST': config('DBP_HOST'),  
         'PORT': config('DBP_PORT'),  
     },
-    'cassandra': {
+}
+
+# Cassandra: 'cluster' se conecta con DBC_*; 'memoria' usa las tablas en memoria de
+# SisWebCafe.cassandra_memoria para correr pruebas y benchmarks sin cluster
+CASSANDRA_BACKEND = config('CASSANDRA_BACKEND', default='cluster')
+if CASSANDRA_BACKEND == 'memoria':
+    TEST_RUNNER = 'SisWebCafe.cassandra_memoria.EjecutorPruebas'
+else:
+    from SisWebCafe.cassandra_perfiles import perfiles_de_ejecucion
+
+    DATABASES['cassandra'] = {
         'ENGINE': 'django_cassandra_engine',
         'NAME': config('DBC_NAME'),
         'TEST_NAME': config('DBC_TEST_NAME'),
@@ -111,16 +126,63 @@ DATABASES = {
         'PORT': 9042,
         'OPTIONS': {
             'replication': {'strategy_class': 'SimpleStrategy','replication_factor': 3,},
-            
-       
+            # Perfiles por carga de trabajo (menú, administración, comandos masivos)
+            'connection': {
+                'execution_profiles': perfiles_de_ejecucion(
+                    dc_local=config('DBC_DC', default=None),
+                    espera_especulativa=config('DBC_ESPERA_ESPECULATIVA', default=0.05, cast=float),
+                ),
+            },
         }
     }
+# Router para manejar lecturas/escrituras
+DATABASE_ROUTERS = ['SisWebCafe.routers.CassandraRouter']
 
+# Caché compartida: guarda la versión del catálogo (menu.catalogo). Con varios
+# workers debe apuntar a un backend común (Redis/Memcached) para que todos vean
+# las invalidaciones.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    },
+    # Fragmentos de plantilla (tarjetas de productos). En memoria de cada proceso:
+    # leer 300 tarjetas no son 300 viajes a la caché compartida, y la llave
+    # lleva la versión del catálogo y del tema, así que no hace falta borrarlas
+    'fragmentos': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fragmentos',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    # Páginas completas para anónimos (SisWebCafe.cache_paginas), aparte de
+    # 'default' para no desplazar las versiones del catálogo y del tema
+    'paginas': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'paginas',
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
 
-    
+# Cola de preparación (caja.cola): mantener las colas en memoria con un hilo
+# que escucha los NOTIFY de pedidos. En False se leen de la base en cada consulta.
+COLA_PREPARACION_EVENTOS = config('COLA_PREPARACION_EVENTOS', default=True, cast=bool)
+
+# Consultas por vista en /metrics: cantidad, latencia y filas (SisWebCafe.consultas)
+METRICAS_CONSULTAS = config('METRICAS_CONSULTAS', default=True, cast=bool)
+# Agrega X-Consultas-SQL y X-Consultas-Cassandra a cada respuesta (pruebas de carga)
+CONTAR_CONSULTAS = config('CONTAR_CONSULTAS', default=False, cast=bool)
+
+# Hilos que generan las variantes de las imágenes de productos (menu.imagenes)
+IMAGENES_WORKERS = config('IMAGENES_WORKERS', default=2, cast=int)
+
+# Proxy que envía los archivos de media y estáticos (SisWebCafe.archivos):
+# '' los envía Django, 'nginx' responde con X-Accel-Redirect y 'apache' con X-Sendfile
+ARCHIVOS_PROXY = config('ARCHIVOS_PROXY', default='')
+# Locations internas de nginx que apuntan a MEDIA_ROOT y STATIC_ROOT
+ARCHIVOS_PROXY_UBICACIONES = {
+    'media': config('ARCHIVOS_PROXY_MEDIA', default='/_media/'),
+    'static': config('ARCHIVOS_PROXY_STATIC', default='/_static/'),
 }
-# Router para manejar lecturas/escrituras
-DATABASE_ROUTERS = ['SisWebCafe.routers.CassandraRouter']
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -162,7 +224,13 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 STATIC_URL = '/static/'
-STATIC_ROOT = os.path.join(BASE_DIR, '/static/')
+# Salida de collectstatic (construir_estaticos); no es la carpeta static/ del código
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    # Nombres con hash, manifiesto y copias .gz/.br (SisWebCafe.estaticos)
+    'staticfiles': {'BACKEND': 'SisWebCafe.estaticos.EstaticosComprimidos'},
+}
 LOGIN_URL = '/signin/'
 LOGIN_REDIRECT_URL = 'home'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
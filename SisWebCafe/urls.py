@@ -15,10 +15,11 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.contrib.auth import views as auth_views
+from SisWebCafe.archivos import servir_media
+from SisWebCafe.estaticos import servir_estatico
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -64,5 +65,8 @@ urlpatterns = [
 ]
 
 
-urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+# Estáticos precomprimidos y media con ETag y Range; también fuera de DEBUG
+urlpatterns += [
+    re_path(r'^%s(?P<ruta>.*)$' % settings.STATIC_URL.lstrip('/'), servir_estatico, name='estatico'),
+    re_path(r'^%s(?P<ruta>.*)$' % settings.MEDIA_URL.lstrip('/'), servir_media, name='media'),
+]
\ No newline at end of file
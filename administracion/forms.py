@@ -1,6 +1,7 @@
 # administracion/forms.py
 from django import forms
 from menu.models import Categoria, Subcategoria, AtributoSubcategoria
+from menu.catalogo import obtener_catalogo
 import json
 
 class CategoriaForm(forms.ModelForm):
@@ -63,7 +64,7 @@ class SubcategoriaForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         
         # Poblar opciones de categoría
-        categorias = Categoria.objects.filter(activo=True)
+        categorias = obtener_catalogo().categorias_activas
         choices = [('', 'Selecciona una categoría')]
         for categoria in categorias:
             choices.append((str(categoria.id), categoria.nombre))
@@ -134,14 +135,14 @@ class AtributoSubcategoriaForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         
         # Poblar opciones de categoría
-        categorias = Categoria.objects.filter(activo=True)
+        categorias = obtener_catalogo().categorias_activas
         choices_categoria = [('', 'Selecciona una categoría')]
         for categoria in categorias:
             choices_categoria.append((str(categoria.id), categoria.nombre))
         self.fields['categoria_id'].choices = choices_categoria
         
         # Poblar opciones de subcategoría (todas inicialmente)
-        subcategorias = Subcategoria.objects.filter(activo=True)
+        subcategorias = [s for s in obtener_catalogo().subcategorias if s.activo]
         choices_subcategoria = [('', 'Primero selecciona una categoría')]
         for subcategoria in subcategorias:
             choices_subcategoria.append((str(subcategoria.id), subcategoria.nombre))
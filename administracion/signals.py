@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import SiteTheme
+from .tema import publicar_tema
+
+
+@receiver(post_save, sender=SiteTheme)
+@receiver(post_delete, sender=SiteTheme)
+def recompilar_tema(sender, **kwargs):
+    """Cualquier cambio a un tema vuelve a compilar y publicar el tema activo."""
+    publicar_tema(SiteTheme.get_active_theme())
@@ -0,0 +1,131 @@
+"""
+Tema del sitio compilado una sola vez y guardado en la caché.
+
+publicar_tema() genera el CSS del tema activo, le calcula un hash de
+contenido y lo guarda junto con su JSON. El context processor y la vista
+theme_css solo leen de la caché; la base de datos se consulta únicamente
+cuando la caché no tiene el tema (por ejemplo, después de reiniciarla).
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.urls import reverse
+
+from .models import SiteTheme
+
+CLAVE_TEMA = 'tema_compilado'
+PREFIJO_CSS = 'tema_css:'
+
+BORDER_RADIUS_MAP = {
+    'sharp': {'sm': '4px', 'md': '6px', 'lg': '8px', 'xl': '10px'},
+    'normal': {'sm': '8px', 'md': '12px', 'lg': '15px', 'xl': '20px'},
+    'rounded': {'sm': '12px', 'md': '16px', 'lg': '20px', 'xl': '25px'}
+}
+
+SHADOW_MAP = {
+    'light': {
+        'sm': '0 1px 2px rgba(0,0,0,0.03)',
+        'md': '0 2px 8px rgba(0,0,0,0.05)',
+        'lg': '0 5px 15px rgba(0,0,0,0.07)',
+        'xl': '0 10px 25px rgba(0,0,0,0.1)'
+    },
+    'medium': {
+        'sm': '0 2px 4px rgba(0,0,0,0.05)',
+        'md': '0 4px 12px rgba(0,0,0,0.08)',
+        'lg': '0 10px 30px rgba(0,0,0,0.1)',
+        'xl': '0 20px 40px rgba(0,0,0,0.15)'
+    },
+    'strong': {
+        'sm': '0 3px 6px rgba(0,0,0,0.08)',
+        'md': '0 6px 16px rgba(0,0,0,0.12)',
+        'lg': '0 12px 35px rgba(0,0,0,0.15)',
+        'xl': '0 25px 50px rgba(0,0,0,0.2)'
+    }
+}
+
+
+def compilar_css(theme):
+    """Genera las variables CSS (:root) de un tema."""
+    colores = theme.to_dict()
+    radii = BORDER_RADIUS_MAP.get(theme.border_radius, BORDER_RADIUS_MAP['normal'])
+    shadows = SHADOW_MAP.get(theme.shadow_intensity, SHADOW_MAP['medium'])
+
+    return f""":root {{
+    /* Colores Primarios */
+    --primary-color: {colores['primaryColor']};
+    --primary-dark: {colores['primaryDark']};
+    --primary-light: {colores['primaryLight']};
+    --primary-gradient: linear-gradient(135deg, {colores['primaryColor']} 0%, {colores['primaryDark']} 100%);
+
+    /* Colores Secundarios */
+    --secondary-color: {colores['secondaryColor']};
+    --secondary-dark: {colores['secondaryDark']};
+    --secondary-light: {colores['secondaryLight']};
+
+    /* Colores de Estado */
+    --success-color: {colores['successColor']};
+    --success-bg: {colores['successBg']};
+    --success-dark: {colores['successDark']};
+    --error-color: {colores['errorColor']};
+    --error-bg: {colores['errorBg']};
+    --error-dark: {colores['errorDark']};
+    --warning-color: {colores['warningColor']};
+    --warning-bg: {colores['warningBg']};
+    --warning-dark: {colores['warningDark']};
+    --info-color: {colores['infoColor']};
+    --info-bg: {colores['infoBg']};
+    --info-dark: {colores['infoDark']};
+
+    /* Bordes */
+    --radius-sm: {radii['sm']};
+    --radius-md: {radii['md']};
+    --radius-lg: {radii['lg']};
+    --radius-xl: {radii['xl']};
+
+    /* Sombras */
+    --shadow-sm: {shadows['sm']};
+    --shadow-md: {shadows['md']};
+    --shadow-lg: {shadows['lg']};
+    --shadow-xl: {shadows['xl']};
+}}
+"""
+
+
+def publicar_tema(theme):
+    """
+    Compila el tema y lo deja en la caché sin expiración. Con theme=None
+    (sin tema activo) se guarda un tema vacío para no volver a consultar.
+    """
+    if theme is None:
+        tema = {'version': None, 'url': None, 'json': '{}', 'datos': None}
+    else:
+        css = compilar_css(theme)
+        version = hashlib.sha256(css.encode()).hexdigest()[:16]
+        cache.set(PREFIJO_CSS + version, css, None)
+        tema = {
+            'version': version,
+            'url': reverse('administracion:theme_css', args=[version]),
+            'json': theme.to_json(),
+            'datos': theme.to_dict(),
+        }
+    cache.set(CLAVE_TEMA, tema, None)
+    return tema
+
+
+def tema_compilado():
+    """Tema activo compilado; solo consulta la base de datos si la caché no lo tiene."""
+    tema = cache.get(CLAVE_TEMA)
+    if tema is None:
+        tema = publicar_tema(SiteTheme.get_active_theme())
+    return tema
+
+
+def css_de_version(version):
+    """CSS de una versión del tema o None si no es la versión vigente ni una publicada."""
+    css = cache.get(PREFIJO_CSS + version)
+    if css is None:
+        # La entrada pudo salir de la caché: se recompila el tema activo
+        tema = publicar_tema(SiteTheme.get_active_theme())
+        if tema['version'] == version:
+            css = cache.get(PREFIJO_CSS + version)
+    return css
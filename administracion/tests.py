@@ -1,6 +1,13 @@
 # administracion/tests.py
+import json
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+
+from .context_processors import theme_context
 from .models import SiteTheme
+from .tema import tema_compilado
 
 class SiteThemeModelTest(TestCase):
     def test_creacion_tema_predeterminado(self):
@@ -47,4 +54,48 @@ class SiteThemeModelTest(TestCase):
         )
         
         tema_obtenido = SiteTheme.get_active_theme()
-        self.assertEqual(tema_obtenido, tema_activo)
\ No newline at end of file
+        self.assertEqual(tema_obtenido, tema_activo)
+
+
+class TemaCompiladoTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        SiteTheme.objects.create(name='custom', primary_color='667EEA', primary_dark='764BA2')
+
+    def test_context_processor_no_consulta_la_base(self):
+        with self.assertNumQueries(0):
+            contexto = theme_context(None)
+
+        self.assertTrue(contexto['theme_css_url'].endswith('.css'))
+        self.assertEqual(json.loads(contexto['theme_json'])['primaryColor'], '#667eea')
+
+    def test_cache_vacia_se_reconstruye_una_vez(self):
+        cache.clear()
+        with self.assertNumQueries(1):
+            tema_compilado()
+        with self.assertNumQueries(0):
+            tema_compilado()
+
+    def test_save_theme_publica_nueva_version(self):
+        url_anterior = theme_context(None)['theme_css_url']
+
+        response = self.client.post(
+            reverse('administracion:theme_save'),
+            data=json.dumps({'primaryColor': '#FF0000'}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+
+        url_nueva = theme_context(None)['theme_css_url']
+        self.assertNotEqual(url_nueva, url_anterior)
+
+        response = self.client.get(url_nueva)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/css; charset=utf-8')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('--primary-color: #ff0000;', response.content.decode())
+
+    def test_version_desconocida_404(self):
+        response = self.client.get(
+            reverse('administracion:theme_css', args=['0000000000000000']))
+        self.assertEqual(response.status_code, 404)
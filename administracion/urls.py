@@ -37,4 +37,5 @@ urlpatterns = [
     path('theme/customizer/', views.theme_customizer, name='theme_customizer'),
     path('api/theme/save/', views.save_theme, name='theme_save'),
     path('api/theme/active/', views.get_active_theme, name='theme_active'),
+    path('api/theme/<str:version>.css', views.theme_css, name='theme_css'),
 ]
\ No newline at end of file
@@ -4,18 +4,29 @@ from django.views.generic import ListView, CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
 from django.http import JsonResponse
 from django.contrib import messages
-from menu.models import Categoria, Subcategoria, AtributoSubcategoria
+from menu.models import Categoria, Subcategoria, AtributoSubcategoria, SubcategoriaPorCategoria, AtributoPorSubcategoria
+from menu.catalogo import invalidar_catalogo
 from .forms import CategoriaForm, SubcategoriaForm, AtributoSubcategoriaForm
 import uuid
 from django.contrib.auth.decorators import user_passes_test
 from django.core.cache import cache
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, Http404
 from django.views.decorators.http import require_http_methods
 import json
 from .models import SiteTheme
+from .tema import tema_compilado, css_de_version
+from SisWebCafe.roles import es_gerente
+from SisWebCafe.cassandra_perfiles import PERFIL_ADMIN, perfil_cassandra
+
 
-def es_gerente(user):
-    return user.is_authenticated and user.groups.filter(name='Gerente').exists()
+class InvalidaCatalogoMixin:
+    """Escribe a LOCAL_QUORUM e incrementa la versión del catálogo después de cada escritura exitosa"""
+
+    def form_valid(self, form):
+        with perfil_cassandra(PERFIL_ADMIN):
+            response = super().form_valid(form)
+        invalidar_catalogo()
+        return response
 
 
 def panel_admin(request):
@@ -73,7 +84,7 @@ class CategoriaListView(LoginRequiredMixin, ListView):
     template_name = 'administracion/categoria_list.html'
     context_object_name = 'categorias'
 
-class CategoriaCreateView(LoginRequiredMixin, CreateView):
+class CategoriaCreateView(LoginRequiredMixin, InvalidaCatalogoMixin, CreateView):
     model = Categoria
     form_class = CategoriaForm
     template_name = 'administracion/categoria_form.html'
@@ -85,7 +96,7 @@ class CategoriaCreateView(LoginRequiredMixin, CreateView):
         print(f'Categoriaaaaaa:{Categoria.objects.count()}')
         return super().form_valid(form)
 
-class CategoriaUpdateView(LoginRequiredMixin, UpdateView):
+class CategoriaUpdateView(LoginRequiredMixin, InvalidaCatalogoMixin, UpdateView):
     model = Categoria
     form_class = CategoriaForm
     template_name = 'administracion/categoria_form.html'
@@ -96,7 +107,7 @@ class CategoriaUpdateView(LoginRequiredMixin, UpdateView):
         messages.success(self.request, 'Categoría actualizada exitosamente.')
         return super().form_valid(form)
 
-class CategoriaDeleteView(LoginRequiredMixin, DeleteView):
+class CategoriaDeleteView(LoginRequiredMixin, InvalidaCatalogoMixin, DeleteView):
     model = Categoria
     success_url = reverse_lazy('administracion:categoria_list')
     
@@ -105,11 +116,13 @@ class CategoriaDeleteView(LoginRequiredMixin, DeleteView):
         messages.success(self.request, 'Categoría eliminada exitosamente.')
         return super().delete(request, *args, **kwargs)
 
+@perfil_cassandra(PERFIL_ADMIN)
 def eliminar_categoria(request, categoria_id):
     if request.method == 'POST':
         try:
             categoria = get_object_or_404(Categoria, id=categoria_id)
             categoria.delete()
+            invalidar_catalogo()
             return JsonResponse({'success': True, 'message': 'Categoría eliminada exitosamente'})
         except Exception as e:
             return JsonResponse({'success': False, 'message': str(e)})
@@ -135,7 +148,7 @@ class SubcategoriaListView(LoginRequiredMixin, ListView):
         
         return context
 
-class SubcategoriaCreateView(LoginRequiredMixin, CreateView):
+class SubcategoriaCreateView(LoginRequiredMixin, InvalidaCatalogoMixin, CreateView):
     model = Subcategoria
     form_class = SubcategoriaForm
     template_name = 'administracion/subcategoria_form.html'
@@ -145,7 +158,7 @@ class SubcategoriaCreateView(LoginRequiredMixin, CreateView):
         messages.success(self.request, 'Subcategoría creada exitosamente.')
         return super().form_valid(form)
 
-class SubcategoriaUpdateView(LoginRequiredMixin, UpdateView):
+class SubcategoriaUpdateView(LoginRequiredMixin, InvalidaCatalogoMixin, UpdateView):
     model = Subcategoria
     form_class = SubcategoriaForm
     template_name = 'administracion/subcategoria_form.html'
@@ -155,7 +168,7 @@ class SubcategoriaUpdateView(LoginRequiredMixin, UpdateView):
         messages.success(self.request, 'Subcategoría actualizada exitosamente.')
         return super().form_valid(form)
 
-class SubcategoriaDeleteView(LoginRequiredMixin, DeleteView):
+class SubcategoriaDeleteView(LoginRequiredMixin, InvalidaCatalogoMixin, DeleteView):
     model = Subcategoria
     success_url = reverse_lazy('administracion:subcategoria_list')
     
@@ -163,11 +176,13 @@ class SubcategoriaDeleteView(LoginRequiredMixin, DeleteView):
         messages.success(self.request, 'Subcategoría eliminada exitosamente.')
         return super().delete(request, *args, **kwargs)
 
+@perfil_cassandra(PERFIL_ADMIN)
 def eliminar_subcategoria(request, subcategoria_id):
     if request.method == 'POST':
         try:
             subcategoria = get_object_or_404(Subcategoria, id=subcategoria_id)
             subcategoria.delete()
+            invalidar_catalogo()
             return JsonResponse({'success': True, 'message': 'Subcategoría eliminada exitosamente'})
         except Exception as e:
             return JsonResponse({'success': False, 'message': str(e)})
@@ -212,7 +227,7 @@ class AtributoSubcategoriaListView(LoginRequiredMixin, ListView):
         context["atributos"] = atributos
         return context
 
-class AtributoSubcategoriaCreateView(LoginRequiredMixin, CreateView):
+class AtributoSubcategoriaCreateView(LoginRequiredMixin, InvalidaCatalogoMixin, CreateView):
     model = AtributoSubcategoria
     form_class = AtributoSubcategoriaForm
     template_name = 'administracion/atributo_form.html'
@@ -222,7 +237,7 @@ class AtributoSubcategoriaCreateView(LoginRequiredMixin, CreateView):
         messages.success(self.request, 'Atributo creado exitosamente.')
         return super().form_valid(form)
 
-class AtributoSubcategoriaUpdateView(LoginRequiredMixin, UpdateView):
+class AtributoSubcategoriaUpdateView(LoginRequiredMixin, InvalidaCatalogoMixin, UpdateView):
     model = AtributoSubcategoria
     form_class = AtributoSubcategoriaForm
     template_name = 'administracion/atributo_form.html'
@@ -232,7 +247,7 @@ class AtributoSubcategoriaUpdateView(LoginRequiredMixin, UpdateView):
         messages.success(self.request, 'Atributo actualizado exitosamente.')
         return super().form_valid(form)
 
-class AtributoSubcategoriaDeleteView(LoginRequiredMixin, DeleteView):
+class AtributoSubcategoriaDeleteView(LoginRequiredMixin, InvalidaCatalogoMixin, DeleteView):
     model = AtributoSubcategoria
     success_url = reverse_lazy('administracion:atributo_list')
     
@@ -240,11 +255,13 @@ class AtributoSubcategoriaDeleteView(LoginRequiredMixin, DeleteView):
         messages.success(self.request, 'Atributo eliminado exitosamente.')
         return super().delete(request, *args, **kwargs)
 
+@perfil_cassandra(PERFIL_ADMIN)
 def eliminar_atributo(request, atributo_id):
     if request.method == 'POST':
         try:
             atributo = get_object_or_404(AtributoSubcategoria, id=atributo_id)
             atributo.delete()
+            invalidar_catalogo()
             return JsonResponse({'success': True, 'message': 'Atributo eliminado exitosamente'})
         except Exception as e:
             return JsonResponse({'success': False, 'message': str(e)})
@@ -258,7 +275,10 @@ def get_subcategorias_categoria(request, categoria_id):
     if not es_gerente_flag:
         return JsonResponse({'error': 'No autorizado'}, status=403)
     
-    subcategorias = Subcategoria.objects.filter(categoria_id=categoria_id, activo=True)
+    # Una sola partición de la tabla de consulta, ya ordenada por nombre
+    subcategorias = [
+        s for s in SubcategoriaPorCategoria.objects.filter(categoria_id=categoria_id) if s.activo
+    ]
     
     return JsonResponse({
         'subcategorias': [
@@ -276,7 +296,7 @@ def get_atributos_subcategoria(request, subcategoria_id):
     if not es_gerente_flag:
         return JsonResponse({'error': 'No autorizado'}, status=403)
         
-    atributos = AtributoSubcategoria.objects.filter(subcategoria_id=subcategoria_id)
+    atributos = AtributoPorSubcategoria.objects.filter(subcategoria_id=subcategoria_id)
     return JsonResponse({
         'atributos': [
             {
@@ -436,17 +456,19 @@ def save_theme(request):
 @require_http_methods(["GET"])
 def get_active_theme(request):
     """Obtener el tema activo (público)"""
-    theme = SiteTheme.get_active_theme()
-    
-    if theme:
-        return JsonResponse({
-            'success': True,
-            'theme': theme.to_dict()
-        })
-    else:
-        return JsonResponse({
-            'success': True,
-            'theme': None
-        })
-        
+    return JsonResponse({
+        'success': True,
+        'theme': tema_compilado()['datos']
+    })
+
+
+@require_http_methods(["GET"])
+def theme_css(request, version):
+    """CSS compilado del tema. La URL cambia con el contenido, así que se cachea para siempre."""
+    css = css_de_version(version)
+    if css is None:
+        raise Http404('Versión de tema no encontrada')
 
+    response = HttpResponse(css, content_type='text/css; charset=utf-8')
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
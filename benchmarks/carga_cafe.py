@@ -0,0 +1,370 @@
+"""
+Benchmark: prueba de carga con el tráfico real de la cafetería.
+
+Lanza usuarios virtuales contra un servidor ya levantado que repiten los
+flujos completos por HTTP:
+
+    navegar  GET del menú (lista_productos) y del kiosko
+    kiosko   arma un carrito y hace POST a kiosko_pedido
+    pickup   sesión de cliente: GET y POST a pickup_pedido
+    caja     sesión de staff: consulta la lista de pedidos y avanza su
+             estado con cambiar_estado_pedido (pendiente -> preparando ->
+             listo -> pagado)
+
+Reporta peticiones por segundo, latencia p50/p95/p99 y consultas SQL y de
+Cassandra por request de cada operación. Las consultas salen de las
+cabeceras de SisWebCafe.consultas, así que el servidor debe correr con
+CONTAR_CONSULTAS=True. Los resultados se guardan en JSON y se comparan con
+una línea base: si alguna operación empeora más que la tolerancia el
+script termina con código 1.
+
+Lee de la base (con la misma configuración que el servidor) los productos
+activos y las sucursales para armar carritos válidos. Crea pedidos reales:
+úsese contra una base de pruebas.
+
+Uso:
+    CONTAR_CONSULTAS=True python manage.py runserver --noreload &
+    python benchmarks/carga_cafe.py --url http://127.0.0.1:8000 \\
+        --cliente cliente1 --cajero caja1 --usuarios 20 --duracion 60 \\
+        --salida resultados.json --linea-base benchmarks/linea_base_carga.json
+
+Para medir el checkout asíncrono, el mismo comando contra un worker ASGI:
+    CONTAR_CONSULTAS=True uvicorn SisWebCafe.asgi:application --workers 1
+"""
+import argparse
+from collections import defaultdict
+from datetime import timedelta
+import http.cookiejar
+import json
+import os
+import queue
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'SisWebCafe.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.utils import timezone  # noqa: E402
+
+from menu.models import Producto  # noqa: E402
+from pedido.models import Sucursal  # noqa: E402
+
+MEZCLA = 'navegar=50,kiosko=20,pickup=20,caja=10'
+# Siguiente estado que la caja le da a un pedido
+SIGUIENTE_ESTADO = {'pendiente': 'preparando', 'preparando': 'listo', 'listo': 'pagado'}
+# caja_buscar_pedido queda en '/', que resuelve primero a la portada (miInicio.home);
+# la caja consulta la lista de pedidos, que es la que muestra los pendientes
+RUTAS = {
+    'menu': '/productos/',
+    'kiosko': '/ordenar/kiosko/',
+    'pickup': '/ordenar/pickup/',
+    'caja': '/pedidos/',
+    'cambiar_estado': '/pedidos/{id}/cambiar-estado/',
+    'signin': '/signin/',
+}
+PEDIDO_CREADO = re.compile(r'/pedidos/estado/(\d+)/')
+
+
+class SinRedirecciones(urllib.request.HTTPRedirectHandler):
+    """Cada redirección se mide como su propio request."""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Cliente:
+    """Navegador mínimo: cookies de sesión y token CSRF."""
+
+    def __init__(self, url_base, timeout):
+        self.url_base = url_base.rstrip('/')
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), SinRedirecciones())
+
+    def csrf(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def pedir(self, ruta, datos=None):
+        """Devuelve (status, cabeceras, cuerpo, segundos)."""
+        url = self.url_base + ruta
+        cuerpo = None
+        cabeceras = {'Referer': url}
+        if datos is not None:
+            datos = {**datos, 'csrfmiddlewaretoken': self.csrf()}
+            cuerpo = urllib.parse.urlencode(datos).encode()
+            cabeceras['X-CSRFToken'] = datos['csrfmiddlewaretoken']
+        peticion = urllib.request.Request(url, data=cuerpo, headers=cabeceras)
+        inicio = time.perf_counter()
+        try:
+            with self.opener.open(peticion, timeout=self.timeout) as respuesta:
+                contenido = respuesta.read()
+                status, encabezados = respuesta.status, respuesta.headers
+        except urllib.error.HTTPError as error:
+            contenido = error.read()
+            status, encabezados = error.code, error.headers
+        return status, encabezados, contenido, time.perf_counter() - inicio
+
+    def iniciar_sesion(self, usuario, clave):
+        self.pedir(RUTAS['signin'])
+        status, _, _, _ = self.pedir(RUTAS['signin'], {'username': usuario, 'password': clave})
+        if status != 302:
+            sys.exit(f'No se pudo iniciar sesión como {usuario}.')
+
+
+class Resultados:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.muestras = defaultdict(list)
+        self.errores = defaultdict(int)
+        self.sql = defaultdict(list)
+        self.cassandra = defaultdict(list)
+        self.midiendo = False
+
+    def registrar(self, operacion, status, cabeceras, segundos):
+        if not self.midiendo:
+            return
+        with self._lock:
+            self.muestras[operacion].append(segundos)
+            if status >= 400:
+                self.errores[operacion] += 1
+            if cabeceras.get('X-Consultas-SQL') is not None:
+                self.sql[operacion].append(int(cabeceras['X-Consultas-SQL']))
+                self.cassandra[operacion].append(int(cabeceras['X-Consultas-Cassandra']))
+
+
+def _carrito(productos):
+    elegidos = random.sample(productos, min(len(productos), random.randint(1, 4)))
+    return json.dumps([{'id': str(p), 'cantidad': random.randint(1, 3)} for p in elegidos])
+
+
+class Escenarios:
+    """Flujos de un usuario virtual. Cada método hace una iteración completa."""
+
+    def __init__(self, productos, sucursales, resultados, pedidos):
+        self.productos = productos
+        self.sucursales = sucursales
+        self.resultados = resultados
+        self.pedidos = pedidos
+
+    def medir(self, cliente, operacion, ruta, datos=None):
+        status, cabeceras, cuerpo, segundos = cliente.pedir(ruta, datos)
+        self.resultados.registrar(operacion, status, cabeceras, segundos)
+        return status, cabeceras, cuerpo
+
+    def navegar(self, cliente):
+        self.medir(cliente, 'lista_productos', RUTAS['menu'])
+        self.medir(cliente, 'kiosko_get', RUTAS['kiosko'])
+
+    def kiosko(self, cliente):
+        self.medir(cliente, 'kiosko_get', RUTAS['kiosko'])
+        self.medir(cliente, 'kiosko_pedido', RUTAS['kiosko'], {
+            'sucursal': random.choice(self.sucursales),
+            'carrito_json': _carrito(self.productos),
+            'nombre': 'Carga',
+            'telefono': '5555555555',
+        })
+
+    def pickup(self, cliente):
+        self.medir(cliente, 'pickup_get', RUTAS['pickup'])
+        horario = timezone.localtime() + timedelta(minutes=random.randint(15, 120))
+        _, cabeceras, _ = self.medir(cliente, 'pickup_pedido', RUTAS['pickup'], {
+            'sucursal': random.choice(self.sucursales),
+            'horario_recoleccion': horario.strftime('%Y-%m-%dT%H:%M'),
+            'tipo_pago': 'tarjeta',
+            'carrito_json': _carrito(self.productos),
+            'puntos_a_usar': 0,
+        })
+        creado = PEDIDO_CREADO.search(cabeceras.get('Location') or '')
+        if creado:
+            self.pedidos.put((int(creado.group(1)), 'pendiente'))
+
+    def caja(self, cliente):
+        self.medir(cliente, 'caja_lista', RUTAS['caja'])
+        try:
+            pedido_id, estado = self.pedidos.get_nowait()
+        except queue.Empty:
+            return
+        nuevo = SIGUIENTE_ESTADO[estado]
+        self.medir(cliente, 'cambiar_estado_pedido', RUTAS['cambiar_estado'].format(id=pedido_id),
+                   {'nuevo_estado': nuevo})
+        if nuevo in SIGUIENTE_ESTADO:
+            self.pedidos.put((pedido_id, nuevo))
+
+
+def usuario_virtual(escenarios, flujos, pesos, clientes, fin):
+    while time.monotonic() < fin:
+        flujo = random.choices(flujos, pesos)[0]
+        try:
+            getattr(escenarios, flujo)(clientes[flujo])
+        except OSError as error:
+            escenarios.resultados.registrar(flujo, 599, {}, 0)
+            print(f'{flujo}: {error}', file=sys.stderr)
+
+
+def _percentiles(muestras):
+    if len(muestras) < 2:
+        valor = muestras[0] * 1000 if muestras else 0
+        return valor, valor, valor
+    cortes = statistics.quantiles(muestras, n=100, method='inclusive')
+    return cortes[49] * 1000, cortes[94] * 1000, cortes[98] * 1000
+
+
+def resumir(resultados, duracion):
+    operaciones = {}
+    for operacion, muestras in sorted(resultados.muestras.items()):
+        p50, p95, p99 = _percentiles(muestras)
+        sql, cassandra = resultados.sql[operacion], resultados.cassandra[operacion]
+        operaciones[operacion] = {
+            'peticiones': len(muestras),
+            'errores': resultados.errores[operacion],
+            'rps': round(len(muestras) / duracion, 2),
+            'p50_ms': round(p50, 1),
+            'p95_ms': round(p95, 1),
+            'p99_ms': round(p99, 1),
+            'sql_por_peticion': round(statistics.fmean(sql), 2) if sql else None,
+            'cassandra_por_peticion': round(statistics.fmean(cassandra), 2) if cassandra else None,
+        }
+    todas = [m for muestras in resultados.muestras.values() for m in muestras]
+    p50, p95, p99 = _percentiles(todas)
+    total = {
+        'peticiones': len(todas),
+        'errores': sum(resultados.errores.values()),
+        'rps': round(len(todas) / duracion, 2),
+        'p50_ms': round(p50, 1),
+        'p95_ms': round(p95, 1),
+        'p99_ms': round(p99, 1),
+    }
+    return {'total': total, 'operaciones': operaciones}
+
+
+def comparar(actual, base, tolerancia):
+    """Lista de regresiones de `actual` respecto a `base`."""
+    regresiones = []
+    for operacion, medida in actual['operaciones'].items():
+        anterior = base['operaciones'].get(operacion)
+        if anterior is None:
+            continue
+        if medida['p95_ms'] > anterior['p95_ms'] * (1 + tolerancia):
+            regresiones.append(f"{operacion}: p95 {anterior['p95_ms']} -> {medida['p95_ms']} ms")
+        if medida['rps'] < anterior['rps'] * (1 - tolerancia):
+            regresiones.append(f"{operacion}: rps {anterior['rps']} -> {medida['rps']}")
+        for clave in ('sql_por_peticion', 'cassandra_por_peticion'):
+            # Las consultas son deterministas: cualquier aumento es una regresión
+            if None not in (medida[clave], anterior.get(clave)) and medida[clave] > anterior[clave] + 0.5:
+                regresiones.append(f'{operacion}: {clave} {anterior[clave]} -> {medida[clave]}')
+    return regresiones
+
+
+def imprimir(resumen):
+    print(f"{'operación':<22} {'reqs':>6} {'err':>4} {'rps':>7} {'p50':>7} {'p95':>7} {'p99':>7} {'SQL':>5} {'CQL':>5}")
+    filas = list(resumen['operaciones'].items()) + [('TOTAL', resumen['total'])]
+    for operacion, m in filas:
+        sql = m.get('sql_por_peticion')
+        cql = m.get('cassandra_por_peticion')
+        print(f"{operacion:<22} {m['peticiones']:>6} {m['errores']:>4} {m['rps']:>7} "
+              f"{m['p50_ms']:>7} {m['p95_ms']:>7} {m['p99_ms']:>7} "
+              f"{'-' if sql is None else sql:>5} {'-' if cql is None else cql:>5}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--usuarios', type=int, default=10, help='usuarios virtuales concurrentes')
+    parser.add_argument('--duracion', type=float, default=30, help='segundos de medición')
+    parser.add_argument('--calentamiento', type=float, default=5, help='segundos sin medir al inicio')
+    parser.add_argument('--mezcla', default=MEZCLA, help='pesos de cada flujo, p. ej. navegar=50,caja=10')
+    parser.add_argument('--cliente', help='usuario cliente para pickup')
+    parser.add_argument('--cajero', help='usuario staff para caja')
+    parser.add_argument('--clave', default=os.environ.get('CARGA_CLAVE', ''),
+                        help='contraseña de ambos usuarios (o CARGA_CLAVE)')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--salida', help='archivo JSON con los resultados')
+    parser.add_argument('--linea-base', help='JSON de una corrida anterior para comparar')
+    parser.add_argument('--guardar-linea-base', action='store_true',
+                        help='sobrescribe --linea-base con esta corrida')
+    parser.add_argument('--tolerancia', type=float, default=0.2,
+                        help='empeoramiento relativo permitido en p95 y rps (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    mezcla = {flujo: float(peso) for flujo, peso in (p.split('=') for p in args.mezcla.split(','))}
+    if 'pickup' in mezcla and not args.cliente:
+        sys.exit('El flujo pickup necesita --cliente.')
+    if 'caja' in mezcla and not args.cajero:
+        sys.exit('El flujo caja necesita --cajero.')
+
+    productos = [p.id for p in Producto.objects.filter(activo=True)]
+    sucursales = list(Sucursal.objects.values_list('id', flat=True))
+    if not productos or not sucursales:
+        sys.exit('Se necesita al menos una sucursal y un producto activo.')
+
+    resultados = Resultados()
+    escenarios = Escenarios(productos, sucursales, resultados, queue.Queue())
+    hilos = []
+    fin = time.monotonic() + args.calentamiento + args.duracion
+    for _ in range(args.usuarios):
+        # Cada usuario virtual tiene sus propias sesiones, como un navegador
+        clientes = {}
+        for flujo in mezcla:
+            clientes[flujo] = Cliente(args.url, args.timeout)
+            if flujo == 'pickup':
+                clientes[flujo].iniciar_sesion(args.cliente, args.clave)
+            elif flujo == 'caja':
+                clientes[flujo].iniciar_sesion(args.cajero, args.clave)
+        hilos.append(threading.Thread(
+            target=usuario_virtual,
+            args=(escenarios, list(mezcla), list(mezcla.values()), clientes, fin),
+            daemon=True,
+        ))
+    for hilo in hilos:
+        hilo.start()
+    time.sleep(args.calentamiento)
+    resultados.midiendo = True
+    inicio = time.monotonic()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.monotonic() - inicio
+
+    resumen = resumir(resultados, duracion)
+    resumen['parametros'] = {
+        'url': args.url, 'usuarios': args.usuarios, 'duracion': round(duracion, 1), 'mezcla': mezcla,
+    }
+    resumen['fecha'] = timezone.now().isoformat()
+    imprimir(resumen)
+    if not resultados.sql:
+        print('Sin cabeceras X-Consultas-*: levanta el servidor con CONTAR_CONSULTAS=True.')
+
+    if args.salida:
+        with open(args.salida, 'w') as archivo:
+            json.dump(resumen, archivo, indent=2, ensure_ascii=False)
+
+    if args.linea_base and args.guardar_linea_base:
+        with open(args.linea_base, 'w') as archivo:
+            json.dump(resumen, archivo, indent=2, ensure_ascii=False)
+        print(f'Línea base guardada en {args.linea_base}.')
+    elif args.linea_base:
+        with open(args.linea_base) as archivo:
+            regresiones = comparar(resumen, json.load(archivo), args.tolerancia)
+        for regresion in regresiones:
+            print(f'REGRESIÓN {regresion}')
+        if regresiones:
+            sys.exit(1)
+        print('Sin regresiones respecto a la línea base.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark: tiempo de render de menu/lista_productos.html con y sin la caché
+de fragmentos de las tarjetas de productos.
+
+Arma un menú de prueba (por defecto 300 productos con imagen y atributos) y
+renderiza la plantilla sin request, así no toca la base de datos ni
+Cassandra. "sin caché" reemplaza la caché 'fragmentos' por DummyCache, que
+equivale a renderizar todas las tarjetas en cada request; "primera" es el
+render que llena la caché y "con caché" los siguientes con la misma versión
+del catálogo y del tema.
+
+Uso:
+    python benchmarks/render_tarjetas.py --productos 300 --repeticiones 30
+"""
+import argparse
+from decimal import Decimal
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'SisWebCafe.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.cache import caches  # noqa: E402
+from django.template.loader import render_to_string  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+
+PLANTILLA = 'menu/lista_productos.html'
+
+
+def menu_de_prueba(cantidad):
+    """Productos como los arma menu.views.lista_productos."""
+    productos = []
+    for i in range(cantidad):
+        nombre = f'{i:064x}'
+        productos.append({
+            'id': uuid.uuid4(),
+            'nombre': f'Producto {i}',
+            'descripcion': 'Café de especialidad con leche vaporizada y un toque de canela.',
+            'precio': Decimal('45.50'),
+            'imagen': f'imgProductos/{nombre[:2]}/{nombre}.jpg',
+            'variantes': {
+                f'{variante}.{extension}': f'imgProductos/variantes/{nombre}-{ancho}.{extension}'
+                for variante, ancho in (('miniatura', 160), ('tarjeta', 400), ('detalle', 800))
+                for extension in ('webp', 'jpg')
+            },
+            'stock': i % 30,
+            'activo': True,
+            'atributos_legibles': [
+                {'nombre': atributo, 'valor': 'valor'}
+                for atributo in ('Tamaño', 'Leche', 'Temperatura', 'Azúcar')
+            ],
+        })
+    return productos
+
+
+def medir(contexto, repeticiones):
+    """(ms del primer render, mediana en ms de los siguientes)."""
+    tiempos = []
+    for _ in range(repeticiones + 1):
+        inicio = time.perf_counter()
+        render_to_string(PLANTILLA, contexto)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return tiempos[0], statistics.median(tiempos[1:])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--productos', type=int, default=300)
+    parser.add_argument('--repeticiones', type=int, default=30)
+    args = parser.parse_args()
+
+    contexto = {
+        'productos': menu_de_prueba(args.productos),
+        'categorias': [],
+        'catalogo_version': 1,
+        'theme_version': 'abc123',
+    }
+    sin_cache = dict(settings.CACHES, fragmentos={'BACKEND': 'django.core.cache.backends.dummy.DummyCache'})
+
+    print(f"{'rol':>8} | {'sin caché':>10} | {'primera':>10} | {'con caché':>10}  (ms)")
+    for es_gerente in (False, True):
+        contexto['es_gerente'] = es_gerente
+        with override_settings(CACHES=sin_cache):
+            _, antes = medir(contexto, args.repeticiones)
+        caches['fragmentos'].clear()
+        primera, ahora = medir(contexto, args.repeticiones)
+        rol = 'gerente' if es_gerente else 'cliente'
+        print(f'{rol:>8} | {antes:>10.1f} | {primera:>10.1f} | {ahora:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Benchmark: sentencias por checkout antes y después de la cotización en lote.
+
+Compara el flujo anterior de pickup_pedido (un Producto.objects.get por línea
+para el total, otro por línea para el detalle, DetallePedido.save() con su
+propia consulta a Cassandra y un INSERT por línea) contra el flujo actual
+(cotizar_carrito + crear_detalles_pedido dentro de una transacción).
+
+Todo se ejecuta dentro de una transacción que se revierte al final, así que
+no deja pedidos en la base de datos. Requiere productos activos en Cassandra
+y al menos una sucursal en PostgreSQL; con CASSANDRA_BACKEND=memoria crea
+productos de prueba que se pierden al terminar.
+
+Uso:
+    python benchmarks/sentencias_checkout.py --lineas 1 4 12
+"""
+import argparse
+from decimal import Decimal
+import os
+import sys
+import uuid
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'SisWebCafe.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from cassandra.cqlengine import query as cqlengine_query  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from menu.models import Producto  # noqa: E402
+from pedido.carrito import cotizar_carrito, crear_detalles_pedido  # noqa: E402
+from pedido.models import DetallePedido, Pedido, PedidoPickup, Sucursal  # noqa: E402
+
+
+class Contador:
+    def __init__(self):
+        self.sql = 0
+        self.cassandra = 0
+
+
+@contextmanager
+def contar_sentencias():
+    """Cuenta las sentencias SQL (sin savepoints) y las de cqlengine."""
+    contador = Contador()
+    original = cqlengine_query._execute_statement
+
+    def contar(*args, **kwargs):
+        contador.cassandra += 1
+        return original(*args, **kwargs)
+
+    cqlengine_query._execute_statement = contar
+    try:
+        with CaptureQueriesContext(connection) as capturadas:
+            yield contador
+    finally:
+        cqlengine_query._execute_statement = original
+    contador.sql = len([
+        q for q in capturadas.captured_queries
+        if 'SAVEPOINT' not in q['sql'].upper()
+    ])
+
+
+def checkout_anterior(carrito, sucursal):
+    """Réplica del flujo de pickup_pedido previo a la cotización en lote."""
+    total = 0
+    for item in carrito:
+        producto = Producto.objects.get(id=item['id'])
+        total += producto.precio * int(item['cantidad'])
+    pedido = Pedido.objects.create(sucursal=sucursal, total=total)
+    for item in carrito:
+        producto = Producto.objects.get(id=item['id'])
+        # save() vuelve a consultar Cassandra porque los campos de caché van vacíos
+        DetallePedido.objects.create(
+            pedido=pedido,
+            producto_id=producto.id,
+            cantidad=int(item['cantidad']),
+        )
+    PedidoPickup.objects.create(
+        pedido=pedido, horario_recoleccion=timezone.now(), tipo_pago='tarjeta')
+
+
+def checkout_actual(carrito, sucursal):
+    cotizacion = cotizar_carrito(carrito)
+    with transaction.atomic():
+        pedido = Pedido.objects.create(sucursal=sucursal, total=cotizacion.total)
+        crear_detalles_pedido(pedido, cotizacion)
+        PedidoPickup.objects.create(
+            pedido=pedido, horario_recoleccion=timezone.now(), tipo_pago='tarjeta')
+
+
+def medir(flujo, carrito, sucursal):
+    with transaction.atomic():
+        with contar_sentencias() as contador:
+            flujo(carrito, sucursal)
+        transaction.set_rollback(True)
+    return contador
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--lineas', type=int, nargs='+', default=[1, 4, 12])
+    args = parser.parse_args()
+
+    if settings.CASSANDRA_BACKEND == 'memoria':
+        categoria = uuid.uuid4()
+        for i in range(max(args.lineas)):
+            Producto.create(categoria_id=categoria, nombre=f'Producto {i}', precio=Decimal('35'), activo=True)
+
+    sucursal = Sucursal.objects.first()
+    productos = list(Producto.objects.filter(activo=True).limit(max(args.lineas)))
+    if sucursal is None or not productos:
+        sys.exit('Se necesita al menos una sucursal y un producto activo.')
+
+    print(f"{'líneas':>6} | {'SQL antes':>9} {'CQL antes':>9} | {'SQL ahora':>9} {'CQL ahora':>9}")
+    for lineas in args.lineas:
+        carrito = [
+            {'id': str(productos[i % len(productos)].id), 'cantidad': 1}
+            for i in range(lineas)
+        ]
+        antes = medir(checkout_anterior, carrito, sucursal)
+        ahora = medir(checkout_actual, carrito, sucursal)
+        print(f'{lineas:>6} | {antes.sql:>9} {antes.cassandra:>9} | {ahora.sql:>9} {ahora.cassandra:>9}')
+
+
+if __name__ == '__main__':
+    main()
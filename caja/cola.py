@@ -0,0 +1,247 @@
+"""
+Cola de preparación en memoria por sucursal.
+
+Cada sucursal tiene un heap de pedidos en espera ordenado por
+(horario_recoleccion, id). Encolar y sacar cuestan O(log n) y consultar el
+siguiente es O(1) mientras la cima sea vigente. Quitar un pedido (cambió de
+estado) es O(1): solo se borra de `vigentes` y la entrada del heap se
+descarta cuando llega a la cima (borrado perezoso).
+
+Al conectar la escucha de pedido.eventos (un hilo del proceso, que arranca
+con el primer uso) las colas de todas las sucursales se arman desde
+PostgreSQL con una sola consulta y después se mantienen con los eventos. Si
+la escucha se cae, las colas se descartan y se vuelven a armar al reconectar
+para no perder cambios.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+import heapq
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+
+from pedido.eventos import escuchar_eventos, publicar_evento_pedido
+from pedido.models import Pedido
+
+logger = logging.getLogger(__name__)
+
+# Pedidos que esperan a cocina: los pendientes y los pagados que no han pasado
+# por cocina (pagados por completo con puntos al crearlos). Un pedido que caja
+# pasa de listo a pagado tiene preparado=True y no vuelve a la cola.
+EN_COLA = Q(estado='pendiente') | Q(estado='pagado', preparado=False)
+
+
+def en_cola(estado, preparado):
+    """La misma condición que EN_COLA para los datos de un evento."""
+    return estado == 'pendiente' or (estado == 'pagado' and not preparado)
+
+
+@dataclass(frozen=True)
+class EntradaCola:
+    pedido_id: int
+    codigo: str
+    horario_recoleccion: datetime
+
+    @property
+    def prioridad(self):
+        return (self.horario_recoleccion, self.pedido_id)
+
+    def to_dict(self):
+        return {
+            'id': self.pedido_id,
+            'codigo': self.codigo,
+            'horario_recoleccion': self.horario_recoleccion.isoformat(),
+        }
+
+
+class ColaSucursal:
+    """Heap de pedidos en espera de una sucursal con borrado perezoso."""
+
+    def __init__(self, entradas=()):
+        self.vigentes = {entrada.pedido_id: entrada for entrada in entradas}
+        self._heap = [entrada.prioridad for entrada in self.vigentes.values()]
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        return len(self.vigentes)
+
+    def encolar(self, entrada):
+        anterior = self.vigentes.get(entrada.pedido_id)
+        self.vigentes[entrada.pedido_id] = entrada
+        if anterior is None or anterior.prioridad != entrada.prioridad:
+            heapq.heappush(self._heap, entrada.prioridad)
+            self._compactar()
+
+    def quitar(self, pedido_id):
+        self.vigentes.pop(pedido_id, None)
+        self._compactar()
+
+    def _vigente(self, prioridad):
+        entrada = self.vigentes.get(prioridad[1])
+        return entrada is not None and entrada.prioridad == prioridad
+
+    def _limpiar_cima(self):
+        while self._heap and not self._vigente(self._heap[0]):
+            heapq.heappop(self._heap)
+
+    def _compactar(self):
+        # Evita que las entradas obsoletas crezcan sin límite
+        if len(self._heap) > 2 * len(self.vigentes) + 32:
+            self._heap = [e.prioridad for e in self.vigentes.values()]
+            heapq.heapify(self._heap)
+
+    def siguiente(self):
+        """Próximo pedido a preparar sin sacarlo, o None."""
+        self._limpiar_cima()
+        return self.vigentes[self._heap[0][1]] if self._heap else None
+
+    def sacar(self):
+        """Saca y devuelve el próximo pedido a preparar, o None."""
+        entrada = self.siguiente()
+        if entrada is not None:
+            heapq.heappop(self._heap)
+            del self.vigentes[entrada.pedido_id]
+        return entrada
+
+    def primeros(self, cantidad):
+        """Los siguientes `cantidad` pedidos en orden, sin modificar la cola."""
+        return [
+            self.vigentes[prioridad[1]]
+            for prioridad in heapq.nsmallest(cantidad, (p for p in self._heap if self._vigente(p)))
+        ]
+
+
+def _pedidos_en_cola(**filtros):
+    """(sucursal_id, id, codigo, horario) de los pedidos en espera."""
+    return (
+        Pedido.objects.filter(EN_COLA, **filtros)
+        .annotate(horario=Coalesce(F('pickup__horario_recoleccion'), F('fecha_hora')))
+        .values_list('sucursal_id', 'id', 'codigo', 'horario')
+    )
+
+
+def _cargar_sucursal(sucursal_id):
+    return ColaSucursal(EntradaCola(*fila) for _, *fila in _pedidos_en_cola(sucursal_id=sucursal_id))
+
+
+class ColasPreparacion:
+    """Colas de todas las sucursales de este proceso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._colas = {}
+        self._escuchando = False
+
+    def cola(self, sucursal_id):
+        """Cola de la sucursal; se construye desde la base si aún no existe."""
+        with self._lock:
+            cola = self._colas.get(sucursal_id)
+            if cola is None or not self._escuchando:
+                # Sin escucha de eventos la cola no se puede mantener al día
+                cola = _cargar_sucursal(sucursal_id)
+                if self._escuchando:
+                    self._colas[sucursal_id] = cola
+            return cola
+
+    def siguiente(self, sucursal_id):
+        cola = self.cola(sucursal_id)
+        with self._lock:
+            return cola.siguiente()
+
+    def primeros(self, sucursal_id, cantidad):
+        cola = self.cola(sucursal_id)
+        with self._lock:
+            return cola.primeros(cantidad), len(cola)
+
+    def quitar(self, sucursal_id, pedido_id):
+        with self._lock:
+            cola = self._colas.get(sucursal_id)
+            if cola is not None:
+                cola.quitar(pedido_id)
+
+    def aplicar_evento(self, evento):
+        """Actualiza la cola de la sucursal del evento, si ya está cargada."""
+        with self._lock:
+            cola = self._colas.get(evento['sucursal_id'])
+            if cola is None:
+                return
+            if en_cola(evento['estado'], evento.get('preparado')) and evento.get('horario_recoleccion'):
+                cola.encolar(EntradaCola(
+                    pedido_id=evento['id'],
+                    codigo=evento['codigo'],
+                    horario_recoleccion=datetime.fromisoformat(evento['horario_recoleccion']),
+                ))
+            else:
+                cola.quitar(evento['id'])
+
+    def descartar(self):
+        with self._lock:
+            self._colas.clear()
+
+    def precargar(self):
+        """Arma las colas de todas las sucursales con pedidos en espera."""
+        entradas = {}
+        for sucursal_id, *fila in _pedidos_en_cola():
+            entradas.setdefault(sucursal_id, []).append(EntradaCola(*fila))
+        colas = {sucursal_id: ColaSucursal(lista) for sucursal_id, lista in entradas.items()}
+        with self._lock:
+            self._colas = colas
+
+    def iniciar_escucha(self):
+        """Arranca (una sola vez) el hilo que aplica los eventos de pedidos."""
+        with self._lock:
+            if self._escuchando:
+                return
+            self._escuchando = True
+        threading.Thread(target=self._escuchar, name='cola-preparacion', daemon=True).start()
+
+    def _escuchar(self):
+        while True:
+            try:
+                # Las colas armadas antes del LISTEN pudieron perder eventos;
+                # las que se arman después reciben todos los que sigan
+                for evento in escuchar_eventos(al_conectar=self.precargar):
+                    if evento is not None:
+                        self.aplicar_evento(evento)
+            except Exception:
+                logger.exception('Se perdió la escucha de eventos de pedidos; se reconstruyen las colas')
+                self.descartar()
+                close_old_connections()
+                time.sleep(5)
+
+
+_colas = ColasPreparacion()
+
+
+def obtener_colas():
+    """Colas del proceso. Arranca la escucha de eventos en el primer uso si está habilitada."""
+    if getattr(settings, 'COLA_PREPARACION_EVENTOS', True):
+        _colas.iniciar_escucha()
+    return _colas
+
+
+def tomar_siguiente(sucursal_id):
+    """
+    Pasa a 'preparando' el siguiente pedido de la sucursal y lo devuelve, o
+    None si la cola está vacía. El UPDATE condicionado al estado evita que
+    dos pantallas tomen el mismo pedido.
+    """
+    colas = obtener_colas()
+    while True:
+        entrada = colas.siguiente(sucursal_id)
+        if entrada is None:
+            return None
+        colas.quitar(sucursal_id, entrada.pedido_id)
+        with transaction.atomic():
+            tomado = Pedido.objects.filter(
+                EN_COLA, id=entrada.pedido_id,
+            ).update(estado='preparando', preparado=True)
+            if tomado:
+                pedido = Pedido.objects.select_related('pickup').get(id=entrada.pedido_id)
+                publicar_evento_pedido(pedido)
+                return pedido
@@ -0,0 +1,104 @@
+"""
+Estadísticas de pedidos calculadas en la base de datos.
+
+La lista de caja usa estadisticas_pedidos(), que resuelve el conteo por
+estado y las ventas del día con un solo GROUP BY. Los reportes de rangos
+pasados leen ResumenDiarioPedidos, que llena consolidar_dia() (comando
+consolidar_pedidos), para no recorrer la tabla de pedidos.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from pedido.models import Pedido
+
+from .models import ResumenDiarioPedidos
+
+# Estados que cuentan como venta cobrada
+ESTADOS_VENTA = ('pagado', 'recogido')
+
+
+def rango_del_dia(fecha):
+    """Inicio y fin (exclusivo) del día como datetimes aware, para usar el índice de fecha_hora."""
+    inicio = timezone.make_aware(datetime.combine(fecha, time.min))
+    return inicio, inicio + timedelta(days=1)
+
+
+def estadisticas_pedidos(hoy=None):
+    """
+    Devuelve (estadisticas, total_ventas_hoy). Una sola consulta agrupada por
+    estado trae el conteo total y la suma de hoy filtrada por fecha_hora.
+    """
+    hoy = hoy or timezone.now().date()
+    inicio, fin = rango_del_dia(hoy)
+    filas = list(
+        Pedido.objects.order_by()
+        .values('estado')
+        .annotate(
+            pedidos=Count('id'),
+            ventas_hoy=Sum('total', filter=Q(fecha_hora__gte=inicio, fecha_hora__lt=fin)),
+        )
+    )
+    conteos = {fila['estado']: fila['pedidos'] for fila in filas}
+    total_ventas_hoy = sum(
+        (fila['ventas_hoy'] or Decimal('0') for fila in filas if fila['estado'] in ESTADOS_VENTA),
+        Decimal('0'),
+    )
+    estadisticas = {
+        'total': sum(conteos.values()),
+        'pendientes': conteos.get('pendiente', 0),
+        'preparando': conteos.get('preparando', 0),
+        'listos': conteos.get('listo', 0),
+        'pagados': conteos.get('pagado', 0),
+        'recogidos': conteos.get('recogido', 0),
+        'cancelados': conteos.get('cancelado', 0),
+    }
+    return estadisticas, total_ventas_hoy
+
+
+def consolidar_dia(fecha):
+    """
+    Recalcula el resumen de un día a partir de los pedidos. Es idempotente:
+    reemplaza las filas del día, así que puede correrse de nuevo si algún
+    pedido cambió de estado después de consolidar.
+    """
+    inicio, fin = rango_del_dia(fecha)
+    filas = (
+        Pedido.objects.filter(fecha_hora__gte=inicio, fecha_hora__lt=fin)
+        .order_by()
+        .values('sucursal_id', 'estado')
+        .annotate(pedidos=Count('id'), ingresos=Sum('total'))
+    )
+    resumenes = [
+        ResumenDiarioPedidos(
+            fecha=fecha,
+            sucursal_id=fila['sucursal_id'],
+            estado=fila['estado'],
+            pedidos=fila['pedidos'],
+            ingresos=fila['ingresos'] or 0,
+        )
+        for fila in filas
+    ]
+    with transaction.atomic():
+        ResumenDiarioPedidos.objects.filter(fecha=fecha).delete()
+        ResumenDiarioPedidos.objects.bulk_create(resumenes)
+    return resumenes
+
+
+def resumen_periodo(desde, hasta, sucursal=None):
+    """
+    Pedidos e ingresos por estado entre dos fechas (inclusive) leídos solo
+    del resumen diario. Los días sin consolidar no aparecen.
+    """
+    resumenes = ResumenDiarioPedidos.objects.filter(fecha__gte=desde, fecha__lte=hasta)
+    if sucursal is not None:
+        resumenes = resumenes.filter(sucursal=sucursal)
+    filas = resumenes.order_by().values('estado').annotate(
+        pedidos=Sum('pedidos'), ingresos=Sum('ingresos'))
+    return {
+        fila['estado']: {'pedidos': fila['pedidos'], 'ingresos': fila['ingresos']}
+        for fila in filas
+    }
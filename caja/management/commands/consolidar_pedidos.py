@@ -0,0 +1,33 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from caja.estadisticas import consolidar_dia
+
+
+class Command(BaseCommand):
+    help = 'Consolida pedidos e ingresos por día, sucursal y estado en ResumenDiarioPedidos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Primer día a consolidar (AAAA-MM-DD). Por defecto, ayer.')
+        parser.add_argument('--hasta', help='Último día a consolidar (AAAA-MM-DD). Por defecto, igual a --desde.')
+
+    def handle(self, *args, **options):
+        try:
+            desde = date.fromisoformat(options['desde']) if options['desde'] else None
+            hasta = date.fromisoformat(options['hasta']) if options['hasta'] else None
+        except ValueError as e:
+            raise CommandError(f'Fecha inválida: {e}')
+
+        desde = desde or timezone.now().date() - timedelta(days=1)
+        hasta = hasta or desde
+        if hasta < desde:
+            raise CommandError('--hasta no puede ser anterior a --desde.')
+
+        fecha = desde
+        while fecha <= hasta:
+            resumenes = consolidar_dia(fecha)
+            self.stdout.write(f'{fecha}: {len(resumenes)} filas de resumen')
+            fecha += timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS('Consolidación terminada.'))
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('pedido', '0003_pedido_pedido_estado_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiarioPedidos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('estado', models.CharField(max_length=20)),
+                ('pedidos', models.PositiveIntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('sucursal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_diarios', to='pedido.sucursal')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'sucursal', 'estado'), name='resumen_diario_unico')],
+            },
+        ),
+    ]
@@ -1,3 +1,22 @@
 from django.db import models
 
-# Create your models here.
+from pedido.models import Sucursal
+
+
+class ResumenDiarioPedidos(models.Model):
+    """Pedidos e ingresos consolidados por día, sucursal y estado."""
+    fecha = models.DateField()
+    sucursal = models.ForeignKey(
+        Sucursal, on_delete=models.CASCADE, related_name='resumenes_diarios')
+    estado = models.CharField(max_length=20)
+    pedidos = models.PositiveIntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['fecha', 'sucursal', 'estado'], name='resumen_diario_unico'),
+        ]
+
+    def __str__(self):
+        return f'{self.fecha} - {self.sucursal.nombre_sucursal} ({self.estado}): {self.pedidos}'
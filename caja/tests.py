@@ -1,3 +1,284 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from pedido.eventos import datos_evento
+from pedido.models import Pedido, PedidoPickup, Sucursal
+
+from .cola import ColaSucursal, ColasPreparacion, EntradaCola
+from .estadisticas import consolidar_dia, estadisticas_pedidos, resumen_periodo
+from .models import ResumenDiarioPedidos
+
+
+class EstadisticasPedidosTest(TestCase):
+    def setUp(self):
+        self.sucursal = Sucursal.objects.create(
+            nombre_sucursal='Centro', calle='Juárez', numero_exterior='10',
+            colonia='Centro', ciudad='Morelia', municipio='Morelia',
+            codigo_postal='58000', telefono='4430000000',
+            hora_apertura='08:00', hora_cierre='20:00',
+        )
+        self.hoy = timezone.now().date()
+        self.ayer = self.hoy - timedelta(days=1)
+
+    def crear_pedido(self, estado, total, dias_atras=0):
+        pedido = Pedido.objects.create(sucursal=self.sucursal, estado=estado, total=Decimal(total))
+        if dias_atras:
+            # fecha_hora es auto_now_add, se mueve con update()
+            Pedido.objects.filter(pk=pedido.pk).update(
+                fecha_hora=pedido.fecha_hora - timedelta(days=dias_atras))
+        return pedido
+
+    def test_estadisticas_en_una_consulta(self):
+        self.crear_pedido('pendiente', '10.00')
+        self.crear_pedido('pagado', '50.00')
+        self.crear_pedido('recogido', '30.00')
+        self.crear_pedido('cancelado', '99.00')
+        self.crear_pedido('pagado', '70.00', dias_atras=1)
+
+        with self.assertNumQueries(1):
+            estadisticas, total_ventas_hoy = estadisticas_pedidos(self.hoy)
+
+        self.assertEqual(estadisticas['total'], 5)
+        self.assertEqual(estadisticas['pendientes'], 1)
+        self.assertEqual(estadisticas['pagados'], 2)
+        self.assertEqual(estadisticas['recogidos'], 1)
+        self.assertEqual(estadisticas['cancelados'], 1)
+        self.assertEqual(estadisticas['listos'], 0)
+        # Solo pagados y recogidos de hoy
+        self.assertEqual(total_ventas_hoy, Decimal('80.00'))
+
+    def test_consolidar_dia_es_idempotente(self):
+        self.crear_pedido('pagado', '20.00', dias_atras=1)
+        self.crear_pedido('pagado', '25.00', dias_atras=1)
+        self.crear_pedido('cancelado', '5.00', dias_atras=1)
+        self.crear_pedido('pagado', '100.00')
+
+        consolidar_dia(self.ayer)
+        consolidar_dia(self.ayer)
+
+        resumenes = ResumenDiarioPedidos.objects.filter(fecha=self.ayer)
+        self.assertEqual(resumenes.count(), 2)
+        pagado = resumenes.get(estado='pagado')
+        self.assertEqual(pagado.pedidos, 2)
+        self.assertEqual(pagado.ingresos, Decimal('45.00'))
+
+    def test_resumen_periodo_no_lee_pedidos(self):
+        self.crear_pedido('pagado', '20.00', dias_atras=1)
+        consolidar_dia(self.ayer)
+        Pedido.objects.all().delete()
+
+        resumen = resumen_periodo(self.ayer, self.ayer, sucursal=self.sucursal)
+
+        self.assertEqual(resumen['pagado']['pedidos'], 1)
+        self.assertEqual(resumen['pagado']['ingresos'], Decimal('20.00'))
+
+    def test_comando_consolida_ayer_por_defecto(self):
+        self.crear_pedido('listo', '15.00', dias_atras=1)
+
+        call_command('consolidar_pedidos', stdout=StringIO())
+
+        self.assertTrue(ResumenDiarioPedidos.objects.filter(fecha=self.ayer, estado='listo').exists())
+
+
+class ListaPedidosCajaTest(TestCase):
+    def setUp(self):
+        self.sucursal = Sucursal.objects.create(
+            nombre_sucursal='Centro', calle='Juárez', numero_exterior='10',
+            colonia='Centro', ciudad='Morelia', municipio='Morelia',
+            codigo_postal='58000', telefono='4430000000',
+            hora_apertura='08:00', hora_cierre='20:00',
+        )
+        self.cliente = User.objects.create_user('mariana', password='clave12345')
+        self.cajero = User.objects.create_user('cajero', password='clave12345', is_staff=True)
+        self.client.login(username='cajero', password='clave12345')
+        self.url = reverse('caja:lista_pedidos_caja')
+
+    def crear_pedidos(self, cantidad, **kwargs):
+        return [
+            Pedido.objects.create(sucursal=self.sucursal, usuario=self.cliente, total=10, **kwargs)
+            for _ in range(cantidad)
+        ]
+
+    def consultas_de_lista(self):
+        with CaptureQueriesContext(connection) as capturadas:
+            response = self.client.get(self.url, {'fecha': 'todos'})
+        self.assertEqual(response.status_code, 200)
+        return len(capturadas.captured_queries)
+
+    def test_consultas_no_dependen_de_los_pedidos(self):
+        self.crear_pedidos(2)
+        # La primera visita guarda los roles en la sesión
+        self.consultas_de_lista()
+        pocas = self.consultas_de_lista()
+        self.crear_pedidos(10)
+        self.assertEqual(self.consultas_de_lista(), pocas)
+
+    def test_busqueda_por_codigo_y_usuario(self):
+        pedido = Pedido.objects.create(sucursal=self.sucursal, codigo='ABC12345', total=10)
+        otro = Pedido.objects.create(sucursal=self.sucursal, usuario=self.cliente, codigo='ZZZ99999', total=10)
+
+        response = self.client.get(self.url, {'fecha': 'todos', 'buscar': 'abc'})
+        self.assertEqual(list(response.context['pedidos']), [pedido])
+
+        response = self.client.get(self.url, {'fecha': 'todos', 'buscar': 'ARIAN'})
+        self.assertEqual(list(response.context['pedidos']), [otro])
+
+    @mock.patch('caja.views.PEDIDOS_POR_PAGINA', 3)
+    def test_paginacion_por_cursor(self):
+        pedidos = self.crear_pedidos(7)
+        # Empates en fecha_hora: el id desempata el orden
+        Pedido.objects.filter(pk__in=[p.pk for p in pedidos[2:5]]).update(
+            fecha_hora=pedidos[3].fecha_hora)
+
+        vistos = []
+        parametros = {'fecha': 'todos'}
+        while True:
+            response = self.client.get(self.url, parametros)
+            vistos.extend(p.pk for p in response.context['pedidos'])
+            siguiente = response.context['siguiente_cursor']
+            if not siguiente:
+                break
+            parametros['cursor'] = siguiente
+
+        esperado = list(
+            Pedido.objects.order_by('-fecha_hora', '-id').values_list('pk', flat=True))
+        self.assertEqual(vistos, esperado)
+
+    def test_cursor_invalido_muestra_primera_pagina(self):
+        self.crear_pedidos(2)
+        response = self.client.get(self.url, {'fecha': 'todos', 'cursor': 'no-es-un-cursor'})
+        self.assertEqual(len(response.context['pedidos']), 2)
+
+
+class ColaSucursalTest(SimpleTestCase):
+    def entrada(self, pedido_id, minutos):
+        base = timezone.now().replace(microsecond=0)
+        return EntradaCola(pedido_id, f'P{pedido_id}', base + timedelta(minutes=minutos))
+
+    def test_orden_por_horario_y_borrado_perezoso(self):
+        cola = ColaSucursal([self.entrada(1, 30), self.entrada(2, 10), self.entrada(3, 20)])
+        self.assertEqual(cola.siguiente().pedido_id, 2)
+
+        cola.quitar(2)
+        self.assertEqual(len(cola), 2)
+        self.assertEqual([e.pedido_id for e in cola.primeros(5)], [3, 1])
+
+        # Cambiar el horario reordena sin duplicar el pedido
+        cola.encolar(self.entrada(1, 5))
+        self.assertEqual([e.pedido_id for e in cola.primeros(5)], [1, 3])
+        self.assertEqual(cola.sacar().pedido_id, 1)
+        self.assertEqual(cola.sacar().pedido_id, 3)
+        self.assertIsNone(cola.sacar())
+
+
+@override_settings(COLA_PREPARACION_EVENTOS=False)
+class ColaPreparacionTest(TestCase):
+    def setUp(self):
+        self.sucursal = Sucursal.objects.create(
+            nombre_sucursal='Centro', calle='Juárez', numero_exterior='10',
+            colonia='Centro', ciudad='Morelia', municipio='Morelia',
+            codigo_postal='58000', telefono='4430000000',
+            hora_apertura='08:00', hora_cierre='20:00',
+        )
+        self.cajero = User.objects.create_user('cajero', password='clave12345', is_staff=True)
+        self.client.login(username='cajero', password='clave12345')
+        self.ahora = timezone.now()
+
+    def crear_pedido(self, minutos, estado='pendiente'):
+        pedido = Pedido.objects.create(sucursal=self.sucursal, estado=estado, total=10)
+        PedidoPickup.objects.create(
+            pedido=pedido, tipo_pago='efectivo',
+            horario_recoleccion=self.ahora + timedelta(minutes=minutos))
+        return pedido
+
+    def test_cola_en_json(self):
+        tarde = self.crear_pedido(40)
+        pronto = self.crear_pedido(10)
+        # Pagado por completo con puntos: también espera a cocina
+        con_puntos = self.crear_pedido(20, estado='pagado')
+        self.crear_pedido(5, estado='listo')
+
+        response = self.client.get(reverse('caja:cola_preparacion', args=[self.sucursal.id]))
+        datos = response.json()
+        self.assertEqual(datos['en_cola'], 3)
+        self.assertEqual(datos['siguiente']['id'], pronto.id)
+        self.assertEqual([p['id'] for p in datos['pedidos']], [pronto.id, con_puntos.id, tarde.id])
+
+    def test_tomar_siguiente(self):
+        tarde = self.crear_pedido(40)
+        pronto = self.crear_pedido(10, estado='pagado')
+        url = reverse('caja:tomar_siguiente_pedido', args=[self.sucursal.id])
+
+        self.assertEqual(self.client.post(url).json()['pedido']['id'], pronto.id)
+        pronto.refresh_from_db()
+        self.assertEqual(pronto.estado, 'preparando')
+        self.assertEqual(self.client.post(url).json()['pedido']['id'], tarde.id)
+        self.assertIsNone(self.client.post(url).json()['pedido'])
+
+    def test_precargar_todas_las_sucursales(self):
+        otra = Sucursal.objects.create(
+            nombre_sucursal='Norte', calle='Madero', numero_exterior='20',
+            colonia='Centro', ciudad='Morelia', municipio='Morelia',
+            codigo_postal='58000', telefono='4430000001',
+            hora_apertura='08:00', hora_cierre='20:00',
+        )
+        pedido = self.crear_pedido(20, estado='pagado')
+        Pedido.objects.create(sucursal=otra, estado='pendiente', total=10)
+        self.crear_pedido(5, estado='preparando')
+        # Pagado en caja después de prepararlo: historial, no cola
+        entregado = self.crear_pedido(1, estado='listo')
+        entregado.estado = 'pagado'
+        entregado.save()
+
+        colas = ColasPreparacion()
+        colas._escuchando = True
+        with self.assertNumQueries(1):
+            colas.precargar()
+        with self.assertNumQueries(0):
+            self.assertEqual(colas.siguiente(self.sucursal.id).pedido_id, pedido.id)
+            self.assertEqual(len(colas.cola(otra.id)), 1)
+
+    def test_aplicar_evento(self):
+        colas = ColasPreparacion()
+        colas._escuchando = True
+        pedido = self.crear_pedido(20)
+        self.assertEqual(colas.siguiente(self.sucursal.id).pedido_id, pedido.id)
+
+        nuevo = self.crear_pedido(5)
+        colas.aplicar_evento(datos_evento(nuevo, 'creado'))
+        self.assertEqual(colas.siguiente(self.sucursal.id).pedido_id, nuevo.id)
+
+        nuevo.estado = 'cancelado'
+        colas.aplicar_evento(datos_evento(nuevo))
+        self.assertEqual(colas.siguiente(self.sucursal.id).pedido_id, pedido.id)
+
+        pagado = self.crear_pedido(1, estado='pagado')
+        colas.aplicar_evento(datos_evento(pagado, 'creado'))
+        self.assertEqual(colas.siguiente(self.sucursal.id).pedido_id, pagado.id)
+
+    def test_pagado_despues_de_listo_no_vuelve_a_la_cola(self):
+        colas = ColasPreparacion()
+        colas._escuchando = True
+        pedido = self.crear_pedido(20)
+        colas.precargar()
+        for estado in ('preparando', 'listo', 'pagado'):
+            pedido.estado = estado
+            pedido.save()
+            colas.aplicar_evento(datos_evento(pedido))
+        self.assertTrue(pedido.preparado)
+        self.assertIsNone(colas.siguiente(self.sucursal.id))
+
+        url = reverse('caja:tomar_siguiente_pedido', args=[self.sucursal.id])
+        self.assertIsNone(self.client.post(url).json()['pedido'])
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.estado, 'pagado')
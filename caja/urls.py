@@ -8,6 +8,9 @@ app_name = 'caja'
 urlpatterns = [
     path('', views.caja_buscar_pedido, name='caja_buscar_pedido'),
     path('pedidos/', views.lista_pedidos_caja, name='lista_pedidos_caja'),
+    path('pedidos/eventos/', views.eventos_caja, name='eventos_caja'),
+    path('pedidos/cola/<int:sucursal_id>/', views.cola_preparacion, name='cola_preparacion'),
+    path('pedidos/cola/<int:sucursal_id>/tomar/', views.tomar_siguiente_pedido, name='tomar_siguiente_pedido'),
     path('pedidos/<int:pedido_id>/', views.detalle_pedido_caja, name='detalle_pedido_caja'),
     path('pedidos/<int:pedido_id>/cambiar-estado/', views.cambiar_estado_pedido, name='cambiar_estado_pedido'),
     path('pedidos/<int:pedido_id>/eliminar/', views.eliminar_pedido, name='eliminar_pedido'),
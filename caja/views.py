@@ -2,8 +2,18 @@
 from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
+from django.db.models import Q
+from django.http import JsonResponse
+from django.views.decorators.http import require_POST
 from pedido.models import Pedido, DetallePedido
-from pedido.views import sumar_puntos_a_cliente
+from pedido.puntos import otorgar_puntos, puntos_por_compra as calcular_puntos_compra
+from pedido.eventos import datos_evento, publicar_evento_pedido, respuesta_sse
+from SisWebCafe.paginacion import paginar_por_llave
+from .cola import obtener_colas, tomar_siguiente
+from .estadisticas import estadisticas_pedidos, rango_del_dia
+
+PEDIDOS_POR_PAGINA = 50
+PEDIDOS_EN_PANTALLA = 20
 
 @staff_member_required
 def caja_buscar_pedido(request):
@@ -35,8 +45,7 @@ def caja_buscar_pedido(request):
                     if pedido.estado != 'pagado' and nuevo_estado == 'pagado':
                         if pedido.usuario:
                             try:
-                                puntos_ganados = sumar_puntos_a_cliente(pedido.usuario, pedido)
-                                pedido.puntos_ganados = puntos_ganados
+                                puntos_ganados = otorgar_puntos(pedido)
                                 mensaje = f"Estado actualizado a '{nuevo_estado}'. Se otorgaron {puntos_ganados} puntos."
                             except Exception as e:
                                 mensaje = f"Estado actualizado a '{nuevo_estado}', pero hubo un error al otorgar puntos: {str(e)}"
@@ -48,6 +57,7 @@ def caja_buscar_pedido(request):
                     
                     pedido.estado = nuevo_estado
                     pedido.save()
+                    publicar_evento_pedido(pedido)
                     mensaje_tipo = 'success'
                     
                     # Recargar pedidos pendientes
@@ -59,12 +69,12 @@ def caja_buscar_pedido(request):
                 productos_puntos = []
                 try:
                     for detalle in pedido.detalles.all():
-                        # Obtener puntos extra del producto (con fallback a 0)
-                        puntos_extra = getattr(detalle.producto, 'puntos_extra', 0)
+                        # Puntos extra copiados al crear el pedido
+                        puntos_extra = detalle.puntos_extra
                         puntos_totales = puntos_extra * detalle.cantidad
                         
                         productos_puntos.append({
-                            'nombre': detalle.producto.nombre,  # ← Corregido de nombre_producto a nombre
+                            'nombre': detalle.nombre_producto,
                             'cantidad': detalle.cantidad,
                             'subtotal': detalle.subtotal,
                             'puntos_extra_unitario': puntos_extra,
@@ -91,11 +101,11 @@ def caja_buscar_pedido(request):
                 
                 # Cargar detalles del pedido con productos y puntos
                 for detalle in pedido.detalles.all():
-                    puntos_extra = getattr(detalle.producto, 'puntos_extra', 0)
+                    puntos_extra = detalle.puntos_extra
                     puntos_totales = puntos_extra * detalle.cantidad
                     
                     productos_puntos.append({
-                        'nombre': detalle.producto.nombre,  # ← Corregido
+                        'nombre': detalle.nombre_producto,
                         'cantidad': detalle.cantidad,
                         'subtotal': detalle.subtotal,
                         'puntos_extra_unitario': puntos_extra,
@@ -111,7 +121,7 @@ def caja_buscar_pedido(request):
     
     # Calcular totales de puntos
     total_puntos_productos = sum(p['puntos_extra_total'] for p in productos_puntos)
-    puntos_por_compra = int(pedido.total // 30) * 5 if pedido else 0
+    puntos_por_compra = calcular_puntos_compra(pedido.total) if pedido else 0
     total_puntos = total_puntos_productos + puntos_por_compra
     
     return render(request, 'caja/caja_buscar_pedido.html', {
@@ -149,59 +159,49 @@ def lista_pedidos_caja(request):
     fecha_filtro = request.GET.get('fecha', 'todos')
     buscar = request.GET.get('buscar', '').strip()
     
-    # Filtro base
-    pedidos = Pedido.objects.all()
+    # Filtro base: usuario, sucursal y pickup se muestran en cada fila
+    pedidos = Pedido.objects.select_related('usuario', 'sucursal', 'pickup')
     
     # Filtro por estado
     if estado_filtro != 'todos':
         pedidos = pedidos.filter(estado=estado_filtro)
     
-    # Filtro por fecha
+    # Filtro por fecha, como rango sobre fecha_hora para aprovechar el índice
     from django.utils import timezone
     from datetime import timedelta
     
     hoy = timezone.now().date()
+    inicio_hoy, fin_hoy = rango_del_dia(hoy)
     if fecha_filtro == 'hoy':
-        pedidos = pedidos.filter(fecha_hora__date=hoy)
+        pedidos = pedidos.filter(fecha_hora__gte=inicio_hoy, fecha_hora__lt=fin_hoy)
     elif fecha_filtro == 'ayer':
-        ayer = hoy - timedelta(days=1)
-        pedidos = pedidos.filter(fecha_hora__date=ayer)
+        pedidos = pedidos.filter(fecha_hora__gte=inicio_hoy - timedelta(days=1), fecha_hora__lt=inicio_hoy)
     elif fecha_filtro == 'semana':
-        inicio_semana = hoy - timedelta(days=7)
-        pedidos = pedidos.filter(fecha_hora__date__gte=inicio_semana)
+        pedidos = pedidos.filter(fecha_hora__gte=inicio_hoy - timedelta(days=7))
     elif fecha_filtro == 'mes':
-        inicio_mes = hoy - timedelta(days=30)
-        pedidos = pedidos.filter(fecha_hora__date__gte=inicio_mes)
+        pedidos = pedidos.filter(fecha_hora__gte=inicio_hoy - timedelta(days=30))
     
-    # Búsqueda por código o usuario
+    # Búsqueda por prefijo de código o por usuario, resuelta en la base de datos
     if buscar:
-        pedidos = [p for p in pedidos if buscar.upper() in p.codigo.upper() or 
-                   (p.usuario and buscar.lower() in p.usuario.username.lower())]
-    
-    # Ordenar por fecha más reciente
-    pedidos = sorted(pedidos, key=lambda x: x.fecha_hora, reverse=True)
+        pedidos = pedidos.filter(
+            Q(codigo__istartswith=buscar) | Q(usuario__username__icontains=buscar)
+        )
     
-    # Estadísticas
-    todos_pedidos = list(Pedido.objects.all())
-    estadisticas = {
-        'total': len(todos_pedidos),
-        'pendientes': len([p for p in todos_pedidos if p.estado == 'pendiente']),
-        'preparando': len([p for p in todos_pedidos if p.estado == 'preparando']),
-        'listos': len([p for p in todos_pedidos if p.estado == 'listo']),
-        'pagados': len([p for p in todos_pedidos if p.estado == 'pagado']),
-        'recogidos': len([p for p in todos_pedidos if p.estado == 'recogido']),
-        'cancelados': len([p for p in todos_pedidos if p.estado == 'cancelado']),
-    }
+    # Más recientes primero, paginado por (fecha_hora, id)
+    cursor = request.GET.get('cursor')
+    pedidos, siguiente_cursor = paginar_por_llave(
+        pedidos, cursor, por_pagina=PEDIDOS_POR_PAGINA)
     
-    # Calcular totales del día
-    pedidos_hoy = [p for p in todos_pedidos if p.fecha_hora.date() == hoy]
-    total_ventas_hoy = sum(float(p.total) for p in pedidos_hoy if p.estado in ['pagado', 'recogido'])
+    # Estadísticas: un GROUP BY estado con la suma de ventas de hoy
+    estadisticas, total_ventas_hoy = estadisticas_pedidos(hoy)
     
     return render(request, 'caja/lista_pedidos.html', {
         'pedidos': pedidos,
         'estado_filtro': estado_filtro,
         'fecha_filtro': fecha_filtro,
         'buscar': buscar,
+        'cursor': cursor,
+        'siguiente_cursor': siguiente_cursor,
         'estadisticas': estadisticas,
         'total_ventas_hoy': total_ventas_hoy,
     })
@@ -226,8 +226,7 @@ def detalle_pedido_caja(request, pedido_id):
             if pedido.estado != 'pagado' and nuevo_estado == 'pagado':
                 if pedido.usuario:
                     try:
-                        puntos_ganados = sumar_puntos_a_cliente(pedido.usuario, pedido)
-                        pedido.puntos_ganados = puntos_ganados
+                        puntos_ganados = otorgar_puntos(pedido)
                         mensaje = f"Estado actualizado a '{nuevo_estado}'. Se otorgaron {puntos_ganados} puntos."
                     except Exception as e:
                         mensaje = f"Estado actualizado a '{nuevo_estado}', pero hubo un error al otorgar puntos: {str(e)}"
@@ -239,11 +238,12 @@ def detalle_pedido_caja(request, pedido_id):
 
             pedido.estado = nuevo_estado
             pedido.save()
+            publicar_evento_pedido(pedido)
             mensaje_tipo = 'success'
 
     # Cargar detalles del pedido con productos y puntos
     for detalle in pedido.detalles.all():
-        puntos_extra = getattr(detalle, 'puntos_extra', 0)  # usar campo cacheado si lo agregaste
+        puntos_extra = detalle.puntos_extra
         puntos_totales = puntos_extra * detalle.cantidad
 
         productos_puntos.append({
@@ -257,7 +257,7 @@ def detalle_pedido_caja(request, pedido_id):
 
     # Calcular totales de puntos
     total_puntos_productos = sum(p['puntos_extra_total'] for p in productos_puntos)
-    puntos_por_compra = int(pedido.total // 30) * 5 if pedido else 0
+    puntos_por_compra = calcular_puntos_compra(pedido.total) if pedido else 0
     total_puntos = total_puntos_productos + puntos_por_compra
 
     return render(request, 'caja/detalle_pedido.html', {
@@ -288,8 +288,7 @@ def cambiar_estado_pedido(request, pedido_id):
                 if pedido.estado != 'pagado' and nuevo_estado == 'pagado':
                     if pedido.usuario:
                         try:
-                            puntos_ganados = sumar_puntos_a_cliente(pedido.usuario, pedido)
-                            pedido.puntos_ganados = puntos_ganados
+                            puntos_ganados = otorgar_puntos(pedido)
                             messages.success(request, f'Pedido {pedido.codigo} marcado como pagado. Se otorgaron {puntos_ganados} puntos.')
                         except Exception as e:
                             messages.warning(request, f'Pedido actualizado pero error al otorgar puntos: {str(e)}')
@@ -300,6 +299,7 @@ def cambiar_estado_pedido(request, pedido_id):
                 
                 pedido.estado = nuevo_estado
                 pedido.save()
+                publicar_evento_pedido(pedido)
             else:
                 messages.error(request, 'Estado no válido.')
                 
@@ -334,3 +334,34 @@ def imprimir_ticket(request, pedido_id):
         messages.error(request, f'Error al generar ticket: {str(e)}')
         return redirect('caja:lista_pedidos_caja')
 
+
+
+@staff_member_required
+async def eventos_caja(request):
+    """Flujo SSE con los pedidos creados y sus cambios de estado (opcional: ?sucursal=<id>)"""
+    sucursal_id = request.GET.get('sucursal')
+    if sucursal_id and sucursal_id.isdigit():
+        return respuesta_sse(request, lambda evento: evento['sucursal_id'] == int(sucursal_id))
+    return respuesta_sse(request, lambda evento: True)
+
+
+@staff_member_required
+def cola_preparacion(request, sucursal_id):
+    """Siguientes pedidos a preparar de una sucursal (JSON)"""
+    primeros, en_cola = obtener_colas().primeros(sucursal_id, PEDIDOS_EN_PANTALLA)
+    return JsonResponse({
+        'sucursal_id': sucursal_id,
+        'en_cola': en_cola,
+        'siguiente': primeros[0].to_dict() if primeros else None,
+        'pedidos': [entrada.to_dict() for entrada in primeros],
+    })
+
+
+@staff_member_required
+@require_POST
+def tomar_siguiente_pedido(request, sucursal_id):
+    """Marca como 'preparando' el siguiente pedido de la cola de la sucursal"""
+    pedido = tomar_siguiente(sucursal_id)
+    if pedido is None:
+        return JsonResponse({'pedido': None})
+    return JsonResponse({'pedido': datos_evento(pedido)})
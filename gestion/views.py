@@ -2,10 +2,7 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import user_passes_test
 from pedido.models import Sucursal
 from .forms import SucursalForm
-
-
-def es_gerente(user):
-    return user.is_authenticated and user.groups.filter(name='Gerente').exists()
+from SisWebCafe.roles import es_gerente
 
 
 @user_passes_test(es_gerente)
@@ -0,0 +1,139 @@
+"""
+Almacenamiento de imágenes de productos direccionado por contenido.
+
+Cada archivo se guarda como imgProductos/<aa>/<sha256><ext>: subir la misma
+foto dos veces no duplica bytes y el nombre nunca cambia de contenido. Como
+un archivo puede ser compartido por varios productos, ReferenciaImagen lleva
+un contador por ruta.
+
+Ni el archivo ni el contador se borran al llegar a cero: en Cassandra un
+contador borrado no se puede volver a incrementar de forma confiable, y
+volver a subir la misma foto mientras otro request la borra dejaría a un
+producto sin imagen. El comando limpiar_media borra los archivos que ningún
+producto referencia, cuyo contador no es positivo y que no se subieron
+durante el periodo de gracia; el contador queda en cero para la próxima vez.
+"""
+import hashlib
+import os
+import time
+import uuid
+
+from cassandra.cqlengine.functions import Token
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+
+from .models import Producto, ReferenciaImagen
+from .tablas_consulta import recorrer
+
+CARPETA_IMAGENES = 'imgProductos'
+CARPETA_TEMPORAL = f'{CARPETA_IMAGENES}/tmp'
+# Carpetas que revisa limpiar_media; 'productos' es donde editar_producto
+# guardaba antes las imágenes
+CARPETAS_IMAGENES = (CARPETA_IMAGENES, 'productos')
+
+
+class AlmacenamientoPorContenido(FileSystemStorage):
+    """FileSystemStorage que nombra cada archivo por el SHA-256 de su contenido."""
+
+    def __init__(self, carpeta=CARPETA_IMAGENES, **kwargs):
+        self.carpeta = carpeta
+        super().__init__(**kwargs)
+
+    def nombre_por_contenido(self, content, name):
+        resumen = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            resumen.update(chunk)
+        content.seek(0)
+        digest = resumen.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return f'{self.carpeta}/{digest[:2]}/{digest}{extension}'
+
+    def save(self, name, content, max_length=None):
+        nombre = self.nombre_por_contenido(content, name or content.name)
+        if self.exists(nombre):
+            # Otra subida de la misma foto: el periodo de gracia de
+            # limpiar_media vuelve a contar desde ahora
+            os.utime(self.path(nombre))
+            return nombre
+        # Se escribe con nombre temporal y se renombra: nadie ve un archivo a medias
+        # y dos subidas simultáneas de la misma foto dejan un solo archivo
+        temporal = super().save(f'{CARPETA_TEMPORAL}/{uuid.uuid4().hex}', content, max_length)
+        os.makedirs(os.path.dirname(self.path(nombre)), exist_ok=True)
+        os.replace(self.path(temporal), self.path(nombre))
+        return nombre
+
+
+almacenamiento_imagenes = AlmacenamientoPorContenido()
+
+
+def _cambiar_referencias(ruta, delta):
+    contador = ReferenciaImagen(ruta=ruta)
+    contador.referencias += delta
+    contador.update()
+
+
+def registrar_referencia(ruta):
+    """Un producto más usa la imagen."""
+    if ruta:
+        _cambiar_referencias(ruta, 1)
+
+
+def liberar_referencia(ruta):
+    """
+    Un producto dejó de usar la imagen. El archivo y sus variantes quedan
+    para limpiar_media.
+    """
+    if ruta:
+        _cambiar_referencias(ruta, -1)
+
+
+def rutas_con_referencias(tamanio_pagina=500):
+    """Rutas cuyo contador de ReferenciaImagen es positivo."""
+    return {
+        contador.ruta for contador in recorrer(ReferenciaImagen, tamanio_pagina)
+        if (contador.referencias or 0) > 0
+    }
+
+
+def recorrer_productos(tamanio_pagina=500):
+    """
+    Produce (id, imagen, variantes) de todos los productos pidiendo páginas
+    de `tamanio_pagina` por rango de token, sin cargar la tabla completa.
+    """
+    consulta = Producto.objects.all().limit(tamanio_pagina).values_list('id', 'imagen', 'variantes')
+    pagina = list(consulta)
+    while pagina:
+        yield from pagina
+        if len(pagina) < tamanio_pagina:
+            return
+        ultimo_id = pagina[-1][0]
+        pagina = list(consulta.filter(pk__token__gt=Token(ultimo_id)))
+
+
+def rutas_referenciadas(tamanio_pagina=500):
+    """Conjunto de rutas de media (originales y variantes) que usa algún producto."""
+    rutas = set()
+    for _, imagen, variantes in recorrer_productos(tamanio_pagina):
+        if imagen:
+            rutas.add(imagen)
+        rutas.update((variantes or {}).values())
+    return rutas
+
+
+def archivos_huerfanos(gracia=24 * 3600, tamanio_pagina=500):
+    """
+    Rutas de las carpetas de imágenes que ningún producto referencia, sin
+    referencias en su contador y que no se subieron en los últimos `gracia`
+    segundos (una subida reciente puede no estar asignada todavía a su
+    producto).
+    """
+    referenciadas = rutas_referenciadas(tamanio_pagina) | rutas_con_referencias(tamanio_pagina)
+    limite = time.time() - gracia
+    for carpeta in CARPETAS_IMAGENES:
+        for raiz, _, archivos in os.walk(os.path.join(settings.MEDIA_ROOT, carpeta)):
+            for archivo in archivos:
+                completo = os.path.join(raiz, archivo)
+                ruta = os.path.relpath(completo, settings.MEDIA_ROOT).replace(os.sep, '/')
+                if ruta not in referenciadas and os.path.getmtime(completo) < limite:
+                    yield ruta
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class MenuConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'menu'
+
+    def ready(self):
+        if settings.CASSANDRA_BACKEND == 'memoria':
+            from SisWebCafe import cassandra_memoria
+            cassandra_memoria.instalar()
+        else:
+            from SisWebCafe import cassandra_perfiles
+            cassandra_perfiles.instalar()
@@ -0,0 +1,170 @@
+"""
+Snapshot en memoria del catálogo (productos, categorías, subcategorías y
+atributos) versionado por un número guardado en la caché de Django.
+
+Cada escritura al catálogo debe llamar a invalidar_catalogo(); los lectores
+usan obtener_catalogo(), que solo vuelve a leer Cassandra cuando la versión
+cambió desde la última reconstrucción en este proceso. Las vistas
+asíncronas usan obtener_catalogo_async(), que reconstruye leyendo las
+tablas de Cassandra a la vez sin bloquear el event loop.
+"""
+from dataclasses import dataclass
+from types import MappingProxyType
+import asyncio
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from SisWebCafe.cassandra_asincrono import consultar
+from SisWebCafe.cassandra_perfiles import PERFIL_MENU, perfil_cassandra
+
+from .models import Producto, Categoria, Subcategoria, AtributoSubcategoria
+
+logger = logging.getLogger(__name__)
+
+CLAVE_VERSION = 'catalogo_version'
+
+_snapshot = None
+_lock = threading.Lock()
+# (versión, tarea) de la reconstrucción asíncrona en curso
+_reconstruccion = None
+
+
+@dataclass(frozen=True)
+class MenuCatalogo:
+    """Catálogo completo congelado en una versión. No modificar sus objetos."""
+    version: int
+    productos: tuple
+    productos_activos: tuple
+    categorias: tuple
+    categorias_activas: tuple
+    subcategorias: tuple
+    atributos: tuple
+    productos_por_id: MappingProxyType
+    nombres_atributos: MappingProxyType
+
+
+def version_catalogo():
+    """Versión actual del catálogo; se inicializa si la caché no la tiene."""
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        # Arrancar desde el reloj evita reutilizar una versión anterior si la
+        # caché perdió la clave mientras algún proceso tenía un snapshot viejo.
+        cache.add(CLAVE_VERSION, int(time.time() * 1000), None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def invalidar_catalogo():
+    """Incrementa la versión para que todos los procesos reconstruyan."""
+    try:
+        return cache.incr(CLAVE_VERSION)
+    except ValueError:
+        return version_catalogo()
+
+
+def _armar(version, productos, categorias, subcategorias, atributos):
+    productos, categorias, atributos = tuple(productos), tuple(categorias), tuple(atributos)
+    return MenuCatalogo(
+        version=version,
+        productos=productos,
+        productos_activos=tuple(p for p in productos if p.activo),
+        categorias=categorias,
+        categorias_activas=tuple(c for c in categorias if c.activo),
+        subcategorias=tuple(subcategorias),
+        atributos=atributos,
+        productos_por_id=MappingProxyType({p.id: p for p in productos}),
+        # Las llaves de Producto.atributos son el id del atributo como texto
+        nombres_atributos=MappingProxyType({str(a.id): a.nombre for a in atributos}),
+    )
+
+
+@perfil_cassandra(PERFIL_MENU)
+def _construir(version):
+    return _armar(
+        version,
+        Producto.objects.all(),
+        Categoria.objects.all(),
+        Subcategoria.objects.all(),
+        AtributoSubcategoria.objects.all(),
+    )
+
+
+async def _construir_async(version):
+    # Las cuatro tablas se leen a la vez
+    with perfil_cassandra(PERFIL_MENU):
+        tablas = await asyncio.gather(*(
+            consultar(modelo.objects.all())
+            for modelo in (Producto, Categoria, Subcategoria, AtributoSubcategoria)
+        ))
+    return _armar(version, *tablas)
+
+
+def obtener_catalogo():
+    """
+    Devuelve el snapshot vigente. Si otro hilo ya está reconstruyendo, se
+    sirve el snapshot anterior en lugar de esperar.
+    """
+    global _snapshot
+    version = version_catalogo()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    if not _lock.acquire(blocking=snapshot is None):
+        return snapshot
+    try:
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = _construir(version)
+        return _snapshot
+    finally:
+        _lock.release()
+
+
+async def obtener_catalogo_async():
+    """
+    obtener_catalogo() para vistas asíncronas. La corrutina que encuentra el
+    snapshot viejo lo reconstruye; mientras tanto las demás reciben el
+    snapshot anterior, o esperan la misma reconstrucción si aún no hay
+    ninguno. Si la reconstrucción falla se sirve el snapshot anterior y el
+    siguiente request lo vuelve a intentar.
+    """
+    global _snapshot, _reconstruccion
+    version = await sync_to_async(version_catalogo, thread_sensitive=False)()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    loop = asyncio.get_running_loop()
+    pendiente = _reconstruccion
+    if pendiente is None or pendiente[0] != version or pendiente[1].get_loop() is not loop:
+        tarea = loop.create_task(_construir_async(version))
+        tarea.add_done_callback(_reconstruccion_terminada)
+        pendiente = _reconstruccion = (version, tarea)
+    elif snapshot is not None:
+        # Otra corrutina ya está reconstruyendo
+        return snapshot
+    try:
+        nuevo = await asyncio.shield(pendiente[1])
+    except Exception:
+        if snapshot is None:
+            raise
+        logger.warning('No se pudo reconstruir el catálogo; se sirve la versión %s',
+                       snapshot.version, exc_info=True)
+        return snapshot
+    if _snapshot is None or _snapshot.version != version:
+        _snapshot = nuevo
+    return _snapshot
+
+
+def _reconstruccion_terminada(tarea):
+    """Olvida la reconstrucción terminada para que una que falló se vuelva a intentar."""
+    global _reconstruccion
+    if _reconstruccion is not None and _reconstruccion[1] is tarea:
+        _reconstruccion = None
+    if not tarea.cancelled():
+        # Evita el aviso de excepción no recuperada si nadie la esperaba
+        tarea.exception()
@@ -1,6 +1,7 @@
 # menu/forms.py
 from django import forms
 from .models import Producto, Categoria, Subcategoria
+from .catalogo import obtener_catalogo
 from decimal import Decimal
 
 class ProductoForm(forms.ModelForm):
@@ -71,13 +72,14 @@ class ProductoForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         
         # Poblar opciones de categoría
-        categorias = Categoria.objects.filter(activo=True)
+        # Snapshot del catálogo: activo no tiene índice y filtrarlo recorre la tabla
+        categorias = obtener_catalogo().categorias_activas
         choices_categoria = [('', 'Selecciona una categoría')]
         for categoria in categorias:
             choices_categoria.append((str(categoria.id), categoria.nombre))
         self.fields['categoria_id'].choices = choices_categoria
        
-        subcategorias = Subcategoria.objects.filter(activo=True)
+        subcategorias = [s for s in obtener_catalogo().subcategorias if s.activo]
         choices_subcategoria = [('', 'Selecciona una subcategoría (opcional)')]
         for subcategoria in subcategorias:
             choices_subcategoria.append((str(subcategoria.id), subcategoria.nombre))
@@ -0,0 +1,100 @@
+"""
+Variantes de las imágenes de productos.
+
+Al subir una imagen se generan copias de ancho fijo (miniatura, tarjeta y
+detalle) en WebP y JPEG, sin metadatos (EXIF, perfiles), y sus rutas se
+guardan en Producto.variantes con claves '<variante>.<formato>'. Se nombran
+a partir del original, que ya lleva el hash de su contenido (ver
+menu.almacenamiento), así que la misma foto comparte variantes. El trabajo
+corre en un pool de hilos del proceso para no bloquear la subida; mientras
+tanto las plantillas siguen mostrando la imagen original.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from .catalogo import invalidar_catalogo
+from .models import Producto
+
+logger = logging.getLogger(__name__)
+
+# Ancho en píxeles de cada variante, de menor a mayor
+VARIANTES = {
+    'miniatura': 160,
+    'tarjeta': 400,
+    'detalle': 800,
+}
+# formato de Pillow -> (extensión, opciones de guardado)
+FORMATOS = {
+    'WEBP': ('webp', {'quality': 80, 'method': 4}),
+    'JPEG': ('jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+CARPETA_VARIANTES = 'imgProductos/variantes'
+
+_pool = None
+
+
+def _ejecutor():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'IMAGENES_WORKERS', 2),
+            thread_name_prefix='imagenes',
+        )
+    return _pool
+
+
+def generar_variantes(ruta_original):
+    """
+    Genera las variantes de una imagen guardada en MEDIA_ROOT y devuelve el
+    diccionario {'<variante>.<extensión>': ruta relativa}. Nunca agranda la
+    imagen: las variantes más anchas que el original se omiten.
+    """
+    nombre = os.path.splitext(os.path.basename(ruta_original))[0]
+    os.makedirs(os.path.join(settings.MEDIA_ROOT, CARPETA_VARIANTES), exist_ok=True)
+
+    with Image.open(os.path.join(settings.MEDIA_ROOT, ruta_original)) as original:
+        # Aplica la orientación EXIF antes de descartar los metadatos
+        imagen = ImageOps.exif_transpose(original).convert('RGB')
+
+    variantes = {}
+    for variante, ancho in VARIANTES.items():
+        if ancho > imagen.width and variantes:
+            break
+        alto = round(imagen.height * min(ancho, imagen.width) / imagen.width)
+        redimensionada = imagen.resize((min(ancho, imagen.width), alto), Image.LANCZOS)
+        redimensionada.info = {}
+        for formato, (extension, opciones) in FORMATOS.items():
+            ruta = f'{CARPETA_VARIANTES}/{nombre}-{ancho}.{extension}'
+            destino = os.path.join(settings.MEDIA_ROOT, ruta)
+            # El original se nombra por contenido: si ya existe, es la misma imagen
+            if not os.path.exists(destino):
+                redimensionada.save(destino, formato, **opciones)
+            variantes[f'{variante}.{extension}'] = ruta
+    return variantes
+
+
+def procesar_imagen_producto(producto_id, ruta_original):
+    """Genera las variantes y las registra en el producto si su imagen no cambió mientras tanto."""
+    try:
+        variantes = generar_variantes(ruta_original)
+        producto = Producto.objects.get(id=producto_id)
+        if producto.imagen != ruta_original:
+            # Las variantes pueden ser de otro producto con la misma foto; si
+            # quedaron huérfanas las borra limpiar_media
+            return None
+        producto.variantes = variantes
+        producto.save()
+        invalidar_catalogo()
+        return variantes
+    except Exception:
+        logger.exception('No se pudieron generar las variantes de %s', ruta_original)
+        return None
+
+
+def encolar_imagen_producto(producto_id, ruta_original):
+    """Programa la generación de variantes en el pool de hilos."""
+    return _ejecutor().submit(procesar_imagen_producto, producto_id, ruta_original)
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from menu.almacenamiento import almacenamiento_imagenes, archivos_huerfanos
+from SisWebCafe.cassandra_perfiles import PERFIL_MASIVO, perfil_cassandra
+
+
+class Command(BaseCommand):
+    help = 'Borra las imágenes de productos que ningún producto referencia.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gracia', type=float, default=24,
+                            help='Horas que se respetan los archivos recientes aunque no estén referenciados.')
+        parser.add_argument('--pagina', type=int, default=500,
+                            help='Productos leídos de Cassandra por consulta.')
+        parser.add_argument('--simular', action='store_true', help='Solo lista los archivos, no los borra.')
+
+    @perfil_cassandra(PERFIL_MASIVO)
+    def handle(self, *args, **options):
+        borrados = 0
+        liberados = 0
+        for ruta in archivos_huerfanos(options['gracia'] * 3600, options['pagina']):
+            liberados += almacenamiento_imagenes.size(ruta)
+            borrados += 1
+            if options['simular']:
+                self.stdout.write(ruta)
+                continue
+            # El contador se queda (en cero): registrar_referencia lo vuelve a usar
+            almacenamiento_imagenes.delete(ruta)
+
+        accion = 'por borrar' if options['simular'] else 'borrados'
+        self.stdout.write(self.style.SUCCESS(
+            f'{borrados} archivos {accion} ({liberados / 1024 / 1024:.1f} MB).'))
@@ -0,0 +1,64 @@
+from cassandra.cqlengine import connection
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from menu.models import Producto, Subcategoria, AtributoSubcategoria
+from menu.tablas_consulta import recorrer
+from SisWebCafe.cassandra_perfiles import PERFIL_MASIVO, perfil_cassandra
+
+MODELOS_BASE = (Producto, Subcategoria, AtributoSubcategoria)
+
+# Columnas que tenían index=True antes de las tablas de consulta
+COLUMNAS_INDEXADAS = ('categoria_id', 'subcategoria_id')
+
+
+class Command(BaseCommand):
+    help = 'Llena las tablas de consulta del menú con los datos existentes y borra copias huérfanas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pagina', type=int, default=500,
+                            help='Filas leídas de Cassandra por consulta.')
+        parser.add_argument('--eliminar-indices', action='store_true',
+                            help='Borra los índices secundarios de categoria_id y subcategoria_id.')
+
+    @perfil_cassandra(PERFIL_MASIVO)
+    def handle(self, *args, **options):
+        for base in MODELOS_BASE:
+            for modelo in base.modelos_consulta():
+                copiadas, huerfanas = self.poblar(base, modelo, options['pagina'])
+                self.stdout.write(
+                    f'{modelo.__name__}: {copiadas} copiadas, {huerfanas} huérfanas borradas.')
+
+        if options['eliminar_indices']:
+            self.eliminar_indices()
+        self.stdout.write(self.style.SUCCESS('Tablas de consulta al día.'))
+
+    def poblar(self, base, modelo, pagina):
+        # Llave vigente de cada fila base en la tabla de consulta
+        llaves = {}
+        for fila in recorrer(base, pagina):
+            fila.copia_en(modelo).save()
+            llave = fila._llave_en(modelo)
+            llaves[fila.id] = llave
+
+        huerfanas = 0
+        for copia in recorrer(modelo, pagina):
+            llave = {nombre: getattr(copia, nombre) for nombre in modelo._primary_keys}
+            if llaves.get(copia.id) != llave:
+                # Fila borrada o copia con una llave vieja (renombrada, movida de categoría)
+                modelo(**llave).delete()
+                huerfanas += 1
+        return len(llaves), huerfanas
+
+    def eliminar_indices(self):
+        if settings.CASSANDRA_BACKEND == 'memoria':
+            self.stdout.write('El backend en memoria no tiene índices.')
+            return
+        metadatos = connection.get_cluster().metadata
+        for base in MODELOS_BASE:
+            keyspace = base._get_keyspace()
+            tabla = metadatos.keyspaces[keyspace].tables[base._raw_column_family_name()]
+            for indice in list(tabla.indexes.values()):
+                if dict(indice.index_options).get('target') in COLUMNAS_INDEXADAS:
+                    connection.execute(f'DROP INDEX IF EXISTS "{keyspace}"."{indice.name}"')
+                    self.stdout.write(f'Índice {indice.name} borrado.')
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:54
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0002_atributosubcategoria_delete_atributocategoria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AtributoPorSubcategoria',
+            fields=[
+            ],
+            options={
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ReferenciaImagen',
+            fields=[
+            ],
+            options={
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='SubcategoriaPorCategoria',
+            fields=[
+            ],
+            options={
+                'managed': False,
+            },
+        ),
+    ]
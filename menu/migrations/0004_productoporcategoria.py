@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:11
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0003_tablas_consulta_referenciaimagen'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductoPorCategoria',
+            fields=[
+            ],
+            options={
+                'managed': False,
+            },
+        ),
+    ]
@@ -3,6 +3,8 @@ from django_cassandra_engine.models import DjangoCassandraModel
 from cassandra.cqlengine import columns
 import uuid
 
+from .tablas_consulta import ConTablasDeConsulta
+
 class Categoria(DjangoCassandraModel):
     id = columns.UUID(primary_key=True, default=uuid.uuid4)
     nombre = columns.Text(required=True)
@@ -12,9 +14,11 @@ class Categoria(DjangoCassandraModel):
     class Meta:
         get_pk_field = 'id'
 
-class Subcategoria(DjangoCassandraModel):
+class Subcategoria(ConTablasDeConsulta, DjangoCassandraModel):
+    tablas_consulta = ('SubcategoriaPorCategoria',)
+
     id = columns.UUID(primary_key=True, default=uuid.uuid4)
-    categoria_id = columns.UUID(required=True, index=True)
+    categoria_id = columns.UUID(required=True)
     nombre = columns.Text(required=True)
     descripcion = columns.Text()
     activo = columns.Boolean(default=True)
@@ -22,9 +26,11 @@ class Subcategoria(DjangoCassandraModel):
     class Meta:
         get_pk_field = 'id'
 
-class AtributoSubcategoria(DjangoCassandraModel):
+class AtributoSubcategoria(ConTablasDeConsulta, DjangoCassandraModel):
+    tablas_consulta = ('AtributoPorSubcategoria',)
+
     id = columns.UUID(primary_key=True, default=uuid.uuid4)
-    subcategoria_id = columns.UUID(required=True, index=True)  
+    subcategoria_id = columns.UUID(required=True)
     nombre = columns.Text(required=True)
     tipo = columns.Text(required=True) 
     requerido = columns.Boolean(default=False)
@@ -33,14 +39,18 @@ class AtributoSubcategoria(DjangoCassandraModel):
     class Meta:
         get_pk_field = 'id'
 
-class Producto(DjangoCassandraModel):
+class Producto(ConTablasDeConsulta, DjangoCassandraModel):
+    tablas_consulta = ('ProductoPorCategoria',)
+
     id = columns.UUID(primary_key=True, default=uuid.uuid4)
-    categoria_id = columns.UUID(required=True, index=True)
-    subcategoria_id = columns.UUID(index=True)
+    categoria_id = columns.UUID(required=True)
+    subcategoria_id = columns.UUID()
     nombre = columns.Text(required=True)
     descripcion = columns.Text()
     precio = columns.Decimal(required=True)
     imagen = columns.Text()
+    # Variantes redimensionadas de la imagen: '<variante>.<formato>' -> ruta (menu.imagenes)
+    variantes = columns.Map(key_type=columns.Text, value_type=columns.Text)
     stock = columns.Integer(default=0)
     activo = columns.Boolean(default=True)
     atributos = columns.Map(key_type=columns.Text, value_type=columns.Text)
@@ -49,4 +59,57 @@ class Producto(DjangoCassandraModel):
     puntos_extra = columns.Integer(default=0)
     
     class Meta:
-        get_pk_field = 'id'
\ No newline at end of file
+        get_pk_field = 'id'
+
+
+class ReferenciaImagen(DjangoCassandraModel):
+    # Cuántos productos usan cada archivo de imagen (menu.almacenamiento)
+    ruta = columns.Text(primary_key=True)
+    referencias = columns.Counter()
+
+    class Meta:
+        get_pk_field = 'ruta'
+
+
+# Tablas de consulta (menu.tablas_consulta): copias particionadas por la columna
+# que se filtra y ordenadas por nombre. Solo las escribe ConTablasDeConsulta.
+
+class ProductoPorCategoria(DjangoCassandraModel):
+    categoria_id = columns.UUID(partition_key=True)
+    nombre = columns.Text(primary_key=True)
+    id = columns.UUID(primary_key=True)
+    subcategoria_id = columns.UUID()
+    descripcion = columns.Text()
+    precio = columns.Decimal()
+    imagen = columns.Text()
+    variantes = columns.Map(key_type=columns.Text, value_type=columns.Text)
+    stock = columns.Integer()
+    activo = columns.Boolean()
+    atributos = columns.Map(key_type=columns.Text, value_type=columns.Text)
+    puntos_extra = columns.Integer()
+
+    class Meta:
+        get_pk_field = 'id'
+
+
+class SubcategoriaPorCategoria(DjangoCassandraModel):
+    categoria_id = columns.UUID(partition_key=True)
+    nombre = columns.Text(primary_key=True)
+    id = columns.UUID(primary_key=True)
+    descripcion = columns.Text()
+    activo = columns.Boolean()
+
+    class Meta:
+        get_pk_field = 'id'
+
+
+class AtributoPorSubcategoria(DjangoCassandraModel):
+    subcategoria_id = columns.UUID(partition_key=True)
+    nombre = columns.Text(primary_key=True)
+    id = columns.UUID(primary_key=True)
+    tipo = columns.Text()
+    requerido = columns.Boolean()
+    opciones = columns.List(value_type=columns.Text)
+
+    class Meta:
+        get_pk_field = 'id'
@@ -0,0 +1,108 @@
+"""
+Tablas de consulta desnormalizadas del menú.
+
+Cassandra resuelve un filtro por índice secundario preguntando a todos los
+nodos. Para las lecturas por categoría o subcategoría cada modelo base
+declara en `tablas_consulta` copias particionadas por esa columna
+(ProductoPorCategoria, SubcategoriaPorCategoria, AtributoPorSubcategoria),
+así la lectura es una sola partición ya ordenada por nombre. lista_productos
+lee ProductoPorCategoria cuando se filtra por categoría; sin filtro sigue
+sirviendo el snapshot de menu.catalogo.
+
+ConTablasDeConsulta mantiene las copias: save(), update() y delete()
+escriben la fila principal y sus copias en un mismo lote registrado (logged
+batch), que Cassandra aplica completo aunque falle un nodo a la mitad. Si la
+llave de la copia cambia (otro nombre u otra categoría) se borra la copia
+vieja. El comando poblar_tablas_consulta llena las tablas con los datos que
+ya existían y borra copias huérfanas.
+"""
+from cassandra.cqlengine.functions import Token
+from cassandra.cqlengine.query import BatchQuery
+
+
+def recorrer(modelo, tamanio_pagina=500):
+    """Todas las filas de `modelo` por páginas de rango de token, sin cargar la tabla completa."""
+    particion = list(modelo._partition_keys)
+    consulta = modelo.objects.all().limit(tamanio_pagina)
+    pagina = list(consulta)
+    while pagina:
+        if len(pagina) < tamanio_pagina:
+            yield from pagina
+            return
+        ultima = [getattr(pagina[-1], columna) for columna in particion]
+        if modelo._clustering_keys:
+            # La última partición puede quedar partida por el límite: se pide completa
+            yield from (fila for fila in pagina if [getattr(fila, c) for c in particion] != ultima)
+            yield from modelo.objects.filter(**dict(zip(particion, ultima)))
+        else:
+            yield from pagina
+        pagina = list(consulta.filter(pk__token__gt=Token(*ultima)))
+
+
+class ConTablasDeConsulta:
+    """Modelo de Cassandra que mantiene copias en sus tablas de consulta."""
+
+    # Nombres de los modelos de menu que copian a este modelo
+    tablas_consulta = ()
+
+    @classmethod
+    def modelos_consulta(cls):
+        return [cls._meta.apps.get_model(cls._meta.app_label, nombre) for nombre in cls.tablas_consulta]
+
+    def _llave_en(self, modelo, guardada=False):
+        """Llave primaria de la copia en `modelo`; con guardada=True, la que tiene en la base."""
+        valores = {}
+        for nombre in modelo._primary_keys:
+            valor = self._values[nombre]
+            valores[nombre] = valor.previous_value if guardada else valor.value
+        return valores
+
+    def copia_en(self, modelo):
+        copia = modelo(**{nombre: getattr(self, nombre) for nombre in modelo._columns})
+        for valor in copia._values.values():
+            # Sin esto el INSERT deja en la copia el valor anterior de una columna vaciada
+            if valor.value is None:
+                valor.explicit = True
+        return copia
+
+    def _en_lote(self, escribir):
+        propio = self._batch is None
+        lote = self._batch or BatchQuery()
+        self.batch(lote)
+        try:
+            escribir(lote)
+        finally:
+            self._batch = None
+        if propio:
+            lote.execute()
+
+    def save(self):
+        anteriores = [
+            self._llave_en(modelo, guardada=True) if self._is_persisted else None
+            for modelo in self.modelos_consulta()
+        ]
+
+        def escribir(lote):
+            super(ConTablasDeConsulta, self).save()
+            for modelo, anterior in zip(self.modelos_consulta(), anteriores):
+                if anterior and anterior != self._llave_en(modelo):
+                    modelo(**anterior).batch(lote).delete()
+                self.copia_en(modelo).batch(lote).save()
+
+        self._en_lote(escribir)
+        return self
+
+    def update(self, **valores):
+        for nombre, valor in valores.items():
+            setattr(self, nombre, valor)
+        return self.save()
+
+    def delete(self):
+        llaves = [self._llave_en(modelo, guardada=True) for modelo in self.modelos_consulta()]
+
+        def escribir(lote):
+            super(ConTablasDeConsulta, self).delete()
+            for modelo, llave in zip(self.modelos_consulta(), llaves):
+                modelo(**llave).batch(lote).delete()
+
+        self._en_lote(escribir)
@@ -0,0 +1,65 @@
+from django import template
+from django.conf import settings
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from menu.imagenes import FORMATOS, VARIANTES
+
+register = template.Library()
+
+
+def _campo(producto, nombre):
+    if isinstance(producto, dict):
+        return producto.get(nombre)
+    return getattr(producto, nombre, None)
+
+
+def _srcset(variantes, extension):
+    return ', '.join(
+        f'{settings.MEDIA_URL}{variantes[clave]} {ancho}w'
+        for variante, ancho in VARIANTES.items()
+        if (clave := f'{variante}.{extension}') in variantes
+    )
+
+
+def fuentes_imagen(producto, variante='tarjeta'):
+    """
+    URLs de la imagen del producto: {'src', 'webp', 'jpeg'} con los srcset de
+    cada formato (vacíos si aún no hay variantes), o None si no tiene imagen.
+    """
+    imagen = _campo(producto, 'imagen')
+    if not imagen:
+        return None
+    variantes = _campo(producto, 'variantes') or {}
+    extension_webp, _ = FORMATOS['WEBP']
+    extension_jpeg, _ = FORMATOS['JPEG']
+    jpeg = [variantes[f'{v}.{extension_jpeg}'] for v in VARIANTES if f'{v}.{extension_jpeg}' in variantes]
+    # Una imagen chica puede no tener las variantes más anchas
+    src = variantes.get(f'{variante}.{extension_jpeg}') or (jpeg[-1] if jpeg else None)
+
+    if not src:
+        return {'src': f'{settings.MEDIA_URL}{imagen}', 'webp': '', 'jpeg': ''}
+    return {
+        'src': f'{settings.MEDIA_URL}{src}',
+        'webp': _srcset(variantes, extension_webp),
+        'jpeg': _srcset(variantes, extension_jpeg),
+    }
+
+
+@register.simple_tag
+def imagen_producto(producto, variante='tarjeta', sizes='(max-width: 576px) 100vw, 400px', **atributos):
+    """
+    <picture> con srcset en WebP y JPEG para que el navegador elija el ancho.
+    Sin variantes (imagen recién subida o anterior al pipeline) muestra la
+    imagen original. Los atributos extra (alt, class, style...) van al <img>.
+    """
+    fuentes = fuentes_imagen(producto, variante)
+    if fuentes is None:
+        return ''
+    if not fuentes['jpeg']:
+        return format_html('<img src="{}" loading="lazy"{}>', fuentes['src'], flatatt(atributos))
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" loading="lazy"{}></picture>',
+        fuentes['webp'], sizes, fuentes['src'], fuentes['jpeg'], sizes, flatatt(atributos),
+    )
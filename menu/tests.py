@@ -1,9 +1,48 @@
 # menu/tests.py
-from django.test import TestCase, skipUnlessDBFeature
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.core.files.base import ContentFile
+from django.template import Context, Template
+from django.urls import reverse
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.management import call_command
+from django.test import TestCase, override_settings, skipUnlessDBFeature
 from django_cassandra_engine.test import TestCase as CassandraTestCase
-from .models import Categoria, Subcategoria, Producto
+from contextlib import contextmanager
+from .models import (
+    Categoria, Subcategoria, Producto, AtributoSubcategoria, ReferenciaImagen,
+    ProductoPorCategoria, SubcategoriaPorCategoria, AtributoPorSubcategoria,
+)
+from . import catalogo as modulo_catalogo
+from .catalogo import obtener_catalogo, obtener_catalogo_async, invalidar_catalogo
+from .almacenamiento import (
+    almacenamiento_imagenes, archivos_huerfanos, liberar_referencia, recorrer_productos,
+    registrar_referencia,
+)
+from .imagenes import VARIANTES, procesar_imagen_producto
+from .tablas_consulta import recorrer
+from PIL import Image
+from asgiref.sync import sync_to_async
+from SisWebCafe import cassandra_memoria
+from SisWebCafe.consultas import contar_consultas
+from io import StringIO
+import unittest
+from unittest import mock
+import os
+import tempfile
+import time
 import uuid
 
+
+@contextmanager
+def contar_consultas_cassandra():
+    """Cuenta las sentencias enviadas a Cassandra, también las de execute_async"""
+    resultado = {}
+    with contar_consultas() as contador:
+        yield resultado
+    resultado['consultas'] = contador.cassandra
+
 class CategoriaModelTest(CassandraTestCase):
     def test_creacion_categoria(self):
         """Prueba la creación de una categoría en Cassandra"""
@@ -71,4 +110,389 @@ class ProductoModelTest(CassandraTestCase):
         self.assertEqual(producto.nombre, 'Café Latte')
         self.assertEqual(producto.precio, 45.00)
         self.assertEqual(producto.stock, 50)
-        self.assertEqual(producto.atributos['temperatura'], 'caliente')
\ No newline at end of file
+        self.assertEqual(producto.atributos['temperatura'], 'caliente')
+
+
+class CatalogoTest(CassandraTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.categoria = Categoria.create(nombre='Bebidas', activo=True)
+        Producto.create(
+            categoria_id=self.categoria.id,
+            nombre='Café Latte',
+            precio=45.00,
+            activo=True
+        )
+        invalidar_catalogo()
+
+    def test_snapshot_sin_consultas_en_estado_estable(self):
+        """Prueba que el catálogo se sirve de memoria mientras no cambie la versión"""
+        catalogo = obtener_catalogo()
+        self.assertEqual(len(catalogo.productos_activos), 1)
+
+        with contar_consultas_cassandra() as contador:
+            self.assertIs(obtener_catalogo(), catalogo)
+            self.client.get('/productos/')
+        self.assertEqual(contador['consultas'], 0)
+
+    def test_invalidar_reconstruye_snapshot(self):
+        """Prueba que una escritura con invalidación se refleja en el catálogo"""
+        anterior = obtener_catalogo()
+        Producto.create(
+            categoria_id=self.categoria.id,
+            nombre='Té Chai',
+            precio=40.00,
+            activo=True
+        )
+        invalidar_catalogo()
+
+        catalogo = obtener_catalogo()
+        self.assertGreater(catalogo.version, anterior.version)
+        self.assertEqual(len(catalogo.productos_activos), 2)
+
+    async def test_reconstruccion_fallida_se_reintenta(self):
+        """Prueba que una reconstrucción asíncrona que falla no se queda guardada"""
+        await sync_to_async(invalidar_catalogo)()
+        modulo_catalogo._snapshot = None
+        construir = modulo_catalogo._construir_async
+        llamadas = []
+
+        async def falla_la_primera(version):
+            llamadas.append(version)
+            if len(llamadas) == 1:
+                raise TimeoutError('Cassandra no respondió')
+            return await construir(version)
+
+        with mock.patch.object(modulo_catalogo, '_construir_async', falla_la_primera):
+            with self.assertRaises(TimeoutError):
+                await obtener_catalogo_async()
+            anterior = await obtener_catalogo_async()
+            self.assertEqual(len(anterior.productos_activos), 1)
+
+            # Con un snapshot anterior, el error se cubre con él
+            await sync_to_async(invalidar_catalogo)()
+            llamadas.clear()
+            with self.assertLogs('menu.catalogo', 'WARNING'):
+                self.assertIs(await obtener_catalogo_async(), anterior)
+            self.assertGreater((await obtener_catalogo_async()).version, anterior.version)
+        self.assertEqual(len(llamadas), 2)
+
+    def test_tarjetas_en_cache_por_version(self):
+        """Prueba que las tarjetas se guardan por versión y una edición las renueva"""
+        producto = obtener_catalogo().productos_activos[0]
+        response = self.client.get('/productos/')
+        llave = make_template_fragment_key('tarjeta_producto', [
+            producto.id, response.context['catalogo_version'], response.context['theme_version'], False])
+        self.assertIn('Café Latte', caches['fragmentos'].get(llave))
+
+        Producto.objects.get(id=producto.id).update(nombre='Café Moka')
+        invalidar_catalogo()
+        response = self.client.get('/productos/')
+        self.assertContains(response, 'Café Moka')
+        self.assertNotContains(response, 'Café Latte')
+
+    def test_api_catalogo_con_etag(self):
+        """Prueba que la API responde 304 mientras no cambie la versión del catálogo"""
+        url = reverse('menu:api_catalogo')
+        response = self.client.get(url)
+        datos = response.json()
+        self.assertEqual([p['nombre'] for p in datos['productos']], ['Café Latte'])
+        self.assertEqual(datos['categorias'], [{'id': str(self.categoria.id), 'nombre': 'Bebidas'}])
+        etag = response['ETag']
+        self.assertEqual(etag, f'"catalogo-{datos["version"]}"')
+
+        with contar_consultas_cassandra() as contador:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(contador['consultas'], 0)
+
+        invalidar_catalogo()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ListaProductosConsultasTest(CassandraTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        categoria = Categoria.create(nombre='Bebidas', activo=True)
+        subcategoria = Subcategoria.create(categoria_id=categoria.id, nombre='Cafés', activo=True)
+        atributos = [
+            AtributoSubcategoria.create(subcategoria_id=subcategoria.id, nombre=nombre, tipo='texto')
+            for nombre in ('Tamaño', 'Leche', 'Temperatura', 'Azúcar')
+        ]
+        for i in range(20):
+            Producto.create(
+                categoria_id=categoria.id,
+                subcategoria_id=subcategoria.id,
+                nombre=f'Café {i}',
+                precio=40.00,
+                activo=True,
+                atributos={str(a.id): 'valor' for a in atributos}
+            )
+        invalidar_catalogo()
+
+    def test_numero_fijo_de_consultas(self):
+        """Prueba que los atributos no generan una consulta por producto y atributo"""
+        with contar_consultas_cassandra() as reconstruccion:
+            response = self.client.get('/productos/')
+        self.assertContains(response, 'Temperatura')
+        # Una lectura por tabla del catálogo, sin importar productos o atributos
+        self.assertEqual(reconstruccion['consultas'], 4)
+
+        with contar_consultas_cassandra() as estable:
+            self.client.get('/productos/')
+        self.assertEqual(estable['consultas'], 0)
+
+
+class ImagenesProductoTest(CassandraTestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.override = override_settings(MEDIA_ROOT=media.name)
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+        self.media = media.name
+
+    def crear_producto(self, ancho, alto):
+        os.makedirs(os.path.join(self.media, 'imgProductos'))
+        exif = Image.Exif()
+        exif[0x010F] = 'Cámara'
+        Image.new('RGB', (ancho, alto), 'brown').save(
+            os.path.join(self.media, 'imgProductos', 'latte.jpg'), exif=exif)
+        return Producto.create(
+            categoria_id=uuid.uuid4(), nombre='Café Latte', precio=45.00,
+            imagen='imgProductos/latte.jpg')
+
+    def test_variantes_sin_metadatos(self):
+        producto = self.crear_producto(1200, 900)
+        variantes = procesar_imagen_producto(producto.id, producto.imagen)
+
+        self.assertEqual(set(variantes), {
+            f'{variante}.{extension}' for variante in VARIANTES for extension in ('webp', 'jpg')})
+        self.assertEqual(Producto.objects.get(id=producto.id).variantes, variantes)
+        with Image.open(os.path.join(self.media, variantes['tarjeta.jpg'])) as tarjeta:
+            self.assertEqual(tarjeta.size, (400, 300))
+            self.assertEqual(len(tarjeta.getexif()), 0)
+
+        html = Template('{% load imagenes_producto %}{% imagen_producto p alt="Latte" %}').render(
+            Context({'p': Producto.objects.get(id=producto.id)}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(f'/media/{variantes["detalle.webp"]} 800w', html)
+        self.assertIn(f'src="/media/{variantes["tarjeta.jpg"]}"', html)
+
+    def test_no_agranda_imagenes_chicas(self):
+        producto = self.crear_producto(300, 200)
+        variantes = procesar_imagen_producto(producto.id, producto.imagen)
+        self.assertEqual(set(variantes), {'miniatura.webp', 'miniatura.jpg'})
+
+        html = Template('{% load imagenes_producto %}{% imagen_producto p "detalle" %}').render(
+            Context({'p': Producto.objects.get(id=producto.id)}))
+        self.assertIn(f'src="/media/{variantes["miniatura.jpg"]}"', html)
+
+
+class AlmacenamientoPorContenidoTest(CassandraTestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.override = override_settings(MEDIA_ROOT=media.name)
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+        self.media = media.name
+
+    def test_misma_foto_se_guarda_una_vez(self):
+        primera = almacenamiento_imagenes.save('latte.JPG', ContentFile(b'foto', name='latte.JPG'))
+        segunda = almacenamiento_imagenes.save('otra.jpg', ContentFile(b'foto', name='otra.jpg'))
+        distinta = almacenamiento_imagenes.save('moka.jpg', ContentFile(b'otra foto', name='moka.jpg'))
+
+        self.assertEqual(primera, segunda)
+        self.assertNotEqual(primera, distinta)
+        self.assertTrue(primera.startswith('imgProductos/') and primera.endswith('.jpg'))
+        self.assertEqual(os.listdir(os.path.join(self.media, 'imgProductos', 'tmp')), [])
+
+    def envejecer(self, ruta):
+        antigua = time.time() - 7200
+        os.utime(os.path.join(self.media, ruta), (antigua, antigua))
+
+    def referencias(self, ruta):
+        return ReferenciaImagen.objects.get(ruta=ruta).referencias
+
+    def test_subir_borrar_y_volver_a_subir(self):
+        ruta = almacenamiento_imagenes.save('latte.jpg', ContentFile(b'foto', name='latte.jpg'))
+        registrar_referencia(ruta)
+        registrar_referencia(ruta)
+        liberar_referencia(ruta)
+        liberar_referencia(ruta)
+        # Sin referencias el archivo y el contador (en cero) se quedan hasta limpiar_media
+        self.assertTrue(almacenamiento_imagenes.exists(ruta))
+        self.assertEqual(self.referencias(ruta), 0)
+
+        # Volver a subir la foto reinicia el periodo de gracia y el contador sigue contando
+        self.envejecer(ruta)
+        self.assertEqual(almacenamiento_imagenes.save('otra.jpg', ContentFile(b'foto', name='otra.jpg')), ruta)
+        registrar_referencia(ruta)
+        self.assertEqual(self.referencias(ruta), 1)
+        self.assertEqual(list(archivos_huerfanos(gracia=3600)), [])
+
+        # Con el contador positivo no se borra aunque ningún producto la tenga todavía
+        self.envejecer(ruta)
+        call_command('limpiar_media', gracia=1, stdout=StringIO())
+        self.assertTrue(almacenamiento_imagenes.exists(ruta))
+
+        liberar_referencia(ruta)
+        call_command('limpiar_media', gracia=1, stdout=StringIO())
+        self.assertFalse(almacenamiento_imagenes.exists(ruta))
+        self.assertEqual(self.referencias(ruta), 0)
+
+        self.assertEqual(almacenamiento_imagenes.save('latte.jpg', ContentFile(b'foto', name='latte.jpg')), ruta)
+        registrar_referencia(ruta)
+        self.assertEqual(self.referencias(ruta), 1)
+
+    def test_huerfanos_recorriendo_por_paginas(self):
+        usadas = []
+        for i in range(5):
+            ruta = almacenamiento_imagenes.save('p.jpg', ContentFile(f'foto {i}'.encode(), name='p.jpg'))
+            Producto.create(categoria_id=uuid.uuid4(), nombre=f'Café {i}', precio=40.00, imagen=ruta)
+            usadas.append(ruta)
+        huerfana = almacenamiento_imagenes.save('x.jpg', ContentFile(b'sin producto', name='x.jpg'))
+
+        self.assertEqual(len(list(recorrer_productos(tamanio_pagina=2))), 5)
+        self.assertEqual(list(archivos_huerfanos(gracia=3600, tamanio_pagina=2)), [])
+        antigua = time.time() - 7200
+        for ruta in usadas + [huerfana]:
+            os.utime(os.path.join(self.media, ruta), (antigua, antigua))
+        self.assertEqual(list(archivos_huerfanos(gracia=3600, tamanio_pagina=2)), [huerfana])
+
+
+class TablasConsultaTest(CassandraTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.bebidas = uuid.uuid4()
+        self.postres = uuid.uuid4()
+
+    def por_categoria(self, categoria_id):
+        return [s.nombre for s in SubcategoriaPorCategoria.objects.filter(categoria_id=categoria_id)]
+
+    def test_copias_al_crear_modificar_y_borrar(self):
+        frias = Subcategoria.create(categoria_id=self.bebidas, nombre='Frías', descripcion='Con hielo')
+        Subcategoria.create(categoria_id=self.bebidas, nombre='Calientes')
+        self.assertEqual(self.por_categoria(self.bebidas), ['Calientes', 'Frías'])
+
+        frias.update(nombre='Heladas', descripcion=None)
+        self.assertEqual(self.por_categoria(self.bebidas), ['Calientes', 'Heladas'])
+        copia = SubcategoriaPorCategoria.objects.get(categoria_id=self.bebidas, nombre='Heladas')
+        self.assertIsNone(copia.descripcion)
+
+        frias.categoria_id = self.postres
+        frias.save()
+        self.assertEqual(self.por_categoria(self.bebidas), ['Calientes'])
+        self.assertEqual(self.por_categoria(self.postres), ['Heladas'])
+
+        frias.delete()
+        self.assertEqual(self.por_categoria(self.postres), [])
+
+    def productos_de(self, categoria_id):
+        return [p.nombre for p in ProductoPorCategoria.objects.filter(categoria_id=categoria_id)]
+
+    def test_copias_de_productos(self):
+        latte = Producto.create(categoria_id=self.bebidas, nombre='Latte', precio=45, descripcion='Con leche')
+        Producto.create(categoria_id=self.bebidas, nombre='Americano', precio=35)
+        self.assertEqual(self.productos_de(self.bebidas), ['Americano', 'Latte'])
+
+        latte.update(nombre='Cappuccino', descripcion=None, categoria_id=self.postres)
+        self.assertEqual(self.productos_de(self.bebidas), ['Americano'])
+        copia = ProductoPorCategoria.objects.get(categoria_id=self.postres, nombre='Cappuccino')
+        self.assertIsNone(copia.descripcion)
+
+        latte.delete()
+        self.assertEqual(self.productos_de(self.postres), [])
+
+    def test_menu_por_categoria_lee_una_particion(self):
+        Producto.create(categoria_id=self.bebidas, nombre='Moka', precio=50)
+        Producto.create(categoria_id=self.bebidas, nombre='Americano', precio=35)
+        Producto.create(categoria_id=self.bebidas, nombre='Agotado', precio=30, activo=False)
+        Producto.create(categoria_id=self.postres, nombre='Pay', precio=40)
+        invalidar_catalogo()
+        self.client.get(reverse('menu:producto_list'))
+
+        with contar_consultas_cassandra() as consultas:
+            response = self.client.get(reverse('menu:producto_list') + f'?categoria={self.bebidas}')
+        self.assertEqual(consultas['consultas'], 1)
+        self.assertEqual([p['nombre'] for p in response.context['productos']], ['Americano', 'Moka'])
+
+        response = self.client.get(reverse('menu:producto_list') + '?categoria=no-es-uuid')
+        self.assertEqual(response.context['productos'], [])
+
+    def test_poblar_llena_y_borra_huerfanas(self):
+        for i in range(5):
+            Subcategoria.create(categoria_id=self.bebidas, nombre=f'Café {i}')
+        producto = Producto.create(categoria_id=self.bebidas, nombre='Latte', precio=45)
+        atributo = AtributoSubcategoria.create(subcategoria_id=self.postres, nombre='Tamaño', tipo='texto')
+        # Datos de antes de las tablas de consulta y una copia que ya no corresponde
+        for modelo in (ProductoPorCategoria, SubcategoriaPorCategoria, AtributoPorSubcategoria):
+            for copia in list(modelo.objects.all()):
+                copia.delete()
+        SubcategoriaPorCategoria.create(categoria_id=self.postres, nombre='Pays', id=uuid.uuid4())
+
+        call_command('poblar_tablas_consulta', pagina=2, stdout=StringIO())
+
+        self.assertEqual(self.por_categoria(self.bebidas), [f'Café {i}' for i in range(5)])
+        self.assertEqual(self.por_categoria(self.postres), [])
+        self.assertEqual(
+            [a.id for a in AtributoPorSubcategoria.objects.filter(subcategoria_id=self.postres)], [atributo.id])
+        self.assertEqual(len(list(recorrer(SubcategoriaPorCategoria, tamanio_pagina=2))), 5)
+        self.assertEqual(
+            [p.id for p in ProductoPorCategoria.objects.filter(categoria_id=self.bebidas)], [producto.id])
+
+    def test_apis_de_administracion(self):
+        gerente = User.objects.create_user('gerente', password='clave')
+        gerente.groups.add(Group.objects.create(name='Gerente'))
+        self.client.force_login(gerente)
+        calientes = Subcategoria.create(categoria_id=self.bebidas, nombre='Calientes')
+        Subcategoria.create(categoria_id=self.bebidas, nombre='Agotadas', activo=False)
+        AtributoSubcategoria.create(subcategoria_id=calientes.id, nombre='Tamaño', tipo='opciones',
+                                    opciones=['chico', 'grande'])
+
+        with contar_consultas_cassandra() as consultas:
+            subcategorias = self.client.get(reverse('administracion:api_subcategorias_categoria', args=[self.bebidas])).json()
+            atributos = self.client.get(reverse('administracion:api_atributos_subcategoria', args=[calientes.id])).json()
+        self.assertEqual([s['nombre'] for s in subcategorias['subcategorias']], ['Calientes'])
+        self.assertEqual(atributos['atributos'][0]['opciones'], ['chico', 'grande'])
+        self.assertEqual(consultas['consultas'], 2)
+
+
+@unittest.skipUnless(settings.CASSANDRA_BACKEND == 'memoria', 'Solo con CASSANDRA_BACKEND = memoria')
+class CassandraMemoriaTest(CassandraTestCase):
+    def setUp(self):
+        self.categoria = uuid.uuid4()
+        self.cafe = Producto.create(
+            categoria_id=self.categoria, nombre='Café', precio=35, atributos={'tamano': 'chico'})
+        self.pan = Producto.create(categoria_id=uuid.uuid4(), nombre='Pan', precio=20, activo=False)
+
+    def test_consultas_del_proyecto(self):
+        self.assertEqual(Producto.objects.get(id=self.cafe.id).atributos, {'tamano': 'chico'})
+        self.assertEqual([p.id for p in Producto.objects.filter(categoria_id=self.categoria)], [self.cafe.id])
+        self.assertEqual(Producto.objects.filter(id__in=[self.cafe.id, self.pan.id]).count(), 2)
+        self.assertEqual(len(list(Producto.objects.filter(activo=True).allow_filtering())), 1)
+        with self.assertRaises(Producto.DoesNotExist):
+            Producto.objects.get(id=uuid.uuid4())
+
+    def test_escrituras(self):
+        # Producto.objects es un queryset compartido que guarda su count(): se usa all()
+        self.cafe.update(precio=40, atributos={'tamano': 'grande'})
+        self.assertEqual(Producto.objects.get(id=self.cafe.id).precio, 40)
+        self.pan.delete()
+        self.assertEqual(Producto.objects.all().count(), 1)
+
+        referencia = ReferenciaImagen(ruta='a.jpg')
+        referencia.referencias += 2
+        referencia.update()
+        self.assertEqual(ReferenciaImagen.objects.get(ruta='a.jpg').referencias, 2)
+
+    def test_tablas_vacias_en_cada_prueba(self):
+        cassandra_memoria.limpiar()
+        self.assertEqual(Producto.objects.all().count(), 0)
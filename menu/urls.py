@@ -6,6 +6,7 @@ app_name = 'menu'
 
 urlpatterns = [
     path('productos/', views.lista_productos, name='producto_list'),
+    path('api/catalogo/', views.api_catalogo, name='api_catalogo'),
     path('productos/agregar/', views.agregar_producto, name='agregar_producto'),
     path('productos/<uuid:producto_id>/editar/', views.editar_producto, name='editar_producto'),
     path('productos/<uuid:producto_id>/eliminar/', views.eliminar_producto, name='eliminar_producto'),
@@ -2,47 +2,68 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import user_passes_test
-from .models import Producto, Categoria, Subcategoria, AtributoSubcategoria
+from .models import Producto, Categoria, Subcategoria, AtributoSubcategoria, ProductoPorCategoria
 from .forms import ProductoForm
+from .catalogo import obtener_catalogo_async, invalidar_catalogo, version_catalogo
+from .almacenamiento import almacenamiento_imagenes, liberar_referencia, registrar_referencia
+from .imagenes import encolar_imagen_producto
+from .templatetags.imagenes_producto import fuentes_imagen
 from django.core.files.storage import default_storage
-from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_safe
+from SisWebCafe.roles import es_gerente
+from SisWebCafe.archivos import CACHE_REVALIDAR
+from SisWebCafe.asincrono import obtener_usuario, renderizar
+from SisWebCafe.cassandra_asincrono import consultar
+from SisWebCafe.cassandra_perfiles import PERFIL_ADMIN, PERFIL_MENU, perfil_cassandra
+from SisWebCafe.cache_paginas import pagina_publica
+from asgiref.sync import sync_to_async
+import asyncio
+import json
 import uuid
-import os
 
-def es_gerente(user):
-    return user.is_authenticated and user.groups.filter(name='Gerente').exists()
 
-def lista_productos(request):
+async def _productos_de_categoria(categoria_id):
+    """Productos activos de una categoría: una sola partición de ProductoPorCategoria, ordenada por nombre."""
+    try:
+        categoria_id = uuid.UUID(categoria_id)
+    except ValueError:
+        return []
+    with perfil_cassandra(PERFIL_MENU):
+        copias = await consultar(ProductoPorCategoria.objects.filter(categoria_id=categoria_id))
+    return [p for p in copias if p.activo]
+
+
+@pagina_publica
+async def lista_productos(request):
     categoria_id = request.GET.get('categoria')
     subcategoria_id = request.GET.get('subcategoria')
-    productos = Producto.objects.filter(activo=True)
-    categorias = Categoria.objects.filter(activo=True)
-
+    usuario = await obtener_usuario(request)
+    # El rol sale de la sesión (Postgres) mientras se revisa o reconstruye el
+    # catálogo y se lee la partición de la categoría
+    lecturas = [obtener_catalogo_async(), sync_to_async(es_gerente)(usuario)]
     if categoria_id:
-        productos = productos.filter(categoria_id=categoria_id)
-    if subcategoria_id:
-        productos = productos.filter(subcategoria_id=subcategoria_id)
+        lecturas.append(_productos_de_categoria(categoria_id))
+    catalogo, es_gerente_flag, *de_categoria = await asyncio.gather(*lecturas)
+    productos = de_categoria[0] if de_categoria else catalogo.productos_activos
+    categorias = catalogo.categorias_activas
 
-    es_gerente_flag = request.user.is_authenticated and request.user.groups.filter(
-        name='Gerente').exists()
+    if subcategoria_id:
+        productos = [p for p in productos if str(p.subcategoria_id) == subcategoria_id]
 
-    # Resolver atributos legibles e inyectarlos en cada producto
+    # Resolver atributos legibles con el diccionario id→nombre del catálogo
+    nombres_atributos = catalogo.nombres_atributos
     productos_con_atributos = []
     for p in productos:
         atributos_legibles = []
         if p.atributos:
             for key, value in p.atributos.items():
-                try:
-                    atributo = AtributoSubcategoria.objects.get(id=key)
-                    atributos_legibles.append({
-                        'nombre': atributo.nombre,
-                        'valor': value
-                    })
-                except AtributoSubcategoria.DoesNotExist:
-                    atributos_legibles.append({
-                        'nombre': key,
-                        'valor': value
-                    })
+                atributos_legibles.append({
+                    'nombre': nombres_atributos.get(key, key),
+                    'valor': value
+                })
         productos_con_atributos.append({
             'id': p.id,
             'nombre': p.nombre,
@@ -50,6 +71,7 @@ def lista_productos(request):
             'precio': p.precio,
            
             'imagen': p.imagen if p.imagen else None,
+            'variantes': p.variantes,
       
             'stock': p.stock,
             'activo': p.activo,
@@ -58,16 +80,74 @@ def lista_productos(request):
 
     context = {
         'productos': productos_con_atributos,
+        # Parte de la llave de la caché de cada tarjeta
+        'catalogo_version': catalogo.version,
         'categorias': categorias,
         'categoria_seleccionada': categoria_id,
         'subcategoria_seleccionada': subcategoria_id,
         'es_gerente': es_gerente_flag,
     }
 
-    return render(request, 'menu/lista_productos.html', context)
+    return await renderizar(request, 'menu/lista_productos.html', context)
+
+
+# (versión, cuerpo) del último JSON armado por api_catalogo
+_json_catalogo = None
+
+
+def _etag_catalogo(version):
+    return f'"catalogo-{version}"'
+
+
+def _cuerpo_catalogo(catalogo):
+    """Menú activo en JSON compacto; se arma una vez por versión del catálogo."""
+    global _json_catalogo
+    memo = _json_catalogo
+    if memo is not None and memo[0] == catalogo.version:
+        return memo[1]
+    datos = {
+        'version': catalogo.version,
+        'categorias': [{'id': c.id, 'nombre': c.nombre} for c in catalogo.categorias_activas],
+        'productos': [
+            {
+                'id': p.id,
+                'nombre': p.nombre,
+                'descripcion': p.descripcion or '',
+                'precio': p.precio,
+                'categoria_id': p.categoria_id,
+                'subcategoria_id': p.subcategoria_id,
+                'puntos_extra': p.puntos_extra or 0,
+                'imagen': fuentes_imagen(p),
+            }
+            for p in catalogo.productos_activos
+        ],
+    }
+    cuerpo = json.dumps(datos, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+    _json_catalogo = (catalogo.version, cuerpo)
+    return cuerpo
+
+
+@require_safe
+async def api_catalogo(request):
+    """
+    Menú activo para el kiosko y el pickup. El ETag sale de la versión del
+    catálogo: si el cliente ya tiene esa versión se responde 304 sin tocar
+    Cassandra ni armar el JSON.
+    """
+    version = await sync_to_async(version_catalogo, thread_sensitive=False)()
+    respuesta = get_conditional_response(request, etag=_etag_catalogo(version))
+    if respuesta is None:
+        catalogo = await obtener_catalogo_async()
+        # El snapshot puede ser de una versión más nueva que la leída arriba
+        version = catalogo.version
+        respuesta = HttpResponse(_cuerpo_catalogo(catalogo), content_type='application/json')
+    respuesta['ETag'] = _etag_catalogo(version)
+    respuesta['Cache-Control'] = CACHE_REVALIDAR
+    return respuesta
 
 
 @user_passes_test(es_gerente)
+@perfil_cassandra(PERFIL_ADMIN)
 def agregar_producto(request):
     es_gerente_flag = es_gerente(request.user)
     if request.method == 'POST':
@@ -81,25 +161,10 @@ def agregar_producto(request):
             imagen_file = getattr(form, 'cleaned_imagen_file', None) # Obtener el archivo subido
 
             if imagen_file:
-                # Generar un nombre único para evitar conflictos
-                nombre_original = imagen_file.name
-                print("Nombre original de la imagen subida:", nombre_original)
-                nombre_base, extension = os.path.splitext(nombre_original)
-                nombre_unico = f"{uuid.uuid4()}{extension}"
-                # Definir la ruta donde se guardará (dentro de MEDIA_ROOT)
-                ruta_relativa_destino = os.path.join('imgProductos', nombre_unico) # Carpeta 'productos' dentro de 'media'
-                ruta_absoluta_destino = os.path.join(settings.MEDIA_ROOT, ruta_relativa_destino)
-                print("Rutare relativa destino:", ruta_relativa_destino)
-                # Crear directorios si no existen
-                os.makedirs(os.path.dirname(ruta_absoluta_destino), exist_ok=True)
-
-                # Guardar el archivo físicamente
+                # El nombre sale del hash del contenido: la misma foto se guarda una sola vez
                 try:
-                    with open(ruta_absoluta_destino, 'wb+') as destination:
-                        for chunk in imagen_file.chunks():
-                            destination.write(chunk)
                     # Guardamos la ruta RELATIVA para almacenarla en Cassandra como string
-                    imagen_guardada_path = ruta_relativa_destino
+                    imagen_guardada_path = almacenamiento_imagenes.save(imagen_file.name, imagen_file)
                 except Exception as e:
                     messages.error(request, f'Error al guardar la imagen localmente: {e}')
                     # Retorna el formulario con errores o maneja como prefieras
@@ -115,6 +180,7 @@ def agregar_producto(request):
             # Ahora sí, guardar en Cassandra
             try:
                 producto.save()
+                registrar_referencia(imagen_guardada_path)
                 messages.success(request, 'Producto agregado exitosamente.')
 
                 # Manejar atributos dinámicos después de guardar el producto
@@ -128,6 +194,10 @@ def agregar_producto(request):
                     if atributos_actualizados:
                         producto.atributos = atributos_actualizados
                         producto.save() # Guardar de nuevo con los atributos
+                invalidar_catalogo()
+                if imagen_guardada_path:
+                    # Las variantes se generan en segundo plano
+                    encolar_imagen_producto(producto.id, imagen_guardada_path)
 
                 # Redirigir según acción
                 if 'action' in request.POST and request.POST['action'] == 'save_and_add':
@@ -135,9 +205,7 @@ def agregar_producto(request):
                 else:
                     return redirect('menu:producto_list') # Ir a la lista
             except Exception as e:
-                # Si la imagen se guardó pero falla el modelo, borrar la imagen
-                if imagen_guardada_path and os.path.exists(os.path.join(settings.MEDIA_ROOT, imagen_guardada_path)):
-                    os.remove(os.path.join(settings.MEDIA_ROOT, imagen_guardada_path))
+                # La imagen puede ser de otro producto: si quedó sin usar la borra limpiar_media
                 messages.error(request, f'Error al guardar el producto en la base de datos: {e}')
                 # Retorna el formulario con errores o maneja como prefieras
                 return render(request, 'menu/agregar_producto.html', {'form': form, 'es_gerente': es_gerente_flag})
@@ -150,6 +218,7 @@ def agregar_producto(request):
 
 
 @user_passes_test(es_gerente)
+@perfil_cassandra(PERFIL_ADMIN)
 def editar_producto(request, producto_id):
     producto = get_object_or_404(Producto, id=producto_id)
     es_gerente_flag = es_gerente(request.user)
@@ -161,42 +230,31 @@ def editar_producto(request, producto_id):
         form = ProductoForm(request.POST, request.FILES, instance=producto) # Asegúrate de incluir request.FILES
         if form.is_valid():
             # --- MANEJO DE IMAGEN (similar al agregar, pero considerando la imagen anterior) ---
-            imagen_anterior_path_para_borrar = imagen_anterior_path # Copia para posible borrado
             imagen_guardada_path = imagen_anterior_path # Por defecto, mantener la anterior
             imagen_file = request.FILES.get('imagen')
+            imagen_cambio = False
 
             if imagen_file: # Si se subió una nueva imagen
-                # Borrar la imagen anterior si existía
-                if imagen_anterior_path_para_borrar and os.path.exists(os.path.join(settings.MEDIA_ROOT, imagen_anterior_path_para_borrar)):
-                    try:
-                        os.remove(os.path.join(settings.MEDIA_ROOT, imagen_anterior_path_para_borrar))
-                    except OSError as e:
-                        # Opcional: Loggear el error o mostrar un mensaje
-                        print(f"Error al borrar imagen anterior {imagen_anterior_path_para_borrar}: {e}")
-
-                # Generar nuevo nombre y guardar (igual que en agregar)
-                nombre_original = imagen_file.name
-                nombre_base, extension = os.path.splitext(nombre_original)
-                nombre_unico = f"{uuid.uuid4()}{extension}"
-                ruta_relativa_destino = os.path.join('productos', nombre_unico)
-                ruta_absoluta_destino = os.path.join(settings.MEDIA_ROOT, ruta_relativa_destino)
-
-                os.makedirs(os.path.dirname(ruta_absoluta_destino), exist_ok=True)
-
+                # Guardar con el mismo almacenamiento por contenido que al agregar
                 try:
-                    with open(ruta_absoluta_destino, 'wb+') as destination:
-                        for chunk in imagen_file.chunks():
-                            destination.write(chunk)
-                    imagen_guardada_path = ruta_relativa_destino # Ruta nueva
+                    imagen_guardada_path = almacenamiento_imagenes.save(imagen_file.name, imagen_file)
                 except Exception as e:
                     messages.error(request, f'Error al guardar la nueva imagen: {e}')
                     return render(request, 'menu/editar_producto.html', {'form': form, 'producto': producto, 'es_gerente': es_gerente_flag})
+                # Volver a subir la misma foto deja la misma ruta
+                imagen_cambio = imagen_guardada_path != imagen_anterior_path
 
             # --- FIN MANEJO DE IMAGEN ---
 
             producto = form.save(commit=False) # No guardar aún
             producto.imagen = imagen_guardada_path # Asignar la nueva ruta o la anterior como STRING
+            if imagen_cambio:
+                producto.variantes = {}
             producto.save() # Ahora sí guardar
+            if imagen_cambio:
+                registrar_referencia(imagen_guardada_path)
+                # limpiar_media borra la imagen anterior si ningún otro producto la usa
+                liberar_referencia(imagen_anterior_path)
 
             # Manejar atributos dinámicos
             atributos_actualizados = {}
@@ -208,6 +266,9 @@ def editar_producto(request, producto_id):
 
             producto.atributos = atributos_actualizados
             producto.save()
+            invalidar_catalogo()
+            if imagen_cambio:
+                encolar_imagen_producto(producto.id, imagen_guardada_path)
 
             messages.success(request, 'Producto actualizado exitosamente.')
             return redirect('menu:producto_list')
@@ -217,17 +278,14 @@ def editar_producto(request, producto_id):
     return render(request, 'menu/editar_producto.html', {'form': form, 'producto': producto, 'es_gerente': es_gerente_flag})
 
 @user_passes_test(es_gerente)
+@perfil_cassandra(PERFIL_ADMIN)
 def eliminar_producto(request, producto_id):
     try:
         producto = Producto.objects.get(id=producto_id)
-        # Borrar la imagen asociada si existe
-        if producto.imagen and os.path.exists(os.path.join(settings.MEDIA_ROOT, producto.imagen)):
-            try:
-                os.remove(os.path.join(settings.MEDIA_ROOT, producto.imagen))
-            except OSError as e:
-               
-                print(f"Error al borrar imagen del producto eliminado {producto.imagen}: {e}")
         producto.delete()
+        # limpiar_media borra la imagen asociada si ningún otro producto la usa
+        liberar_referencia(producto.imagen)
+        invalidar_catalogo()
         messages.success(request, 'Producto eliminado exitosamente.')
     except Producto.DoesNotExist:
         messages.error(request, 'El producto no existe.')
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class MiinicioConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'miInicio'
+
+    def ready(self):
+        # Conecta las señales que invalidan los roles guardados en sesión
+        import SisWebCafe.roles
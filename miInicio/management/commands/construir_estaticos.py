@@ -0,0 +1,29 @@
+import os
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from SisWebCafe.estaticos import brotli
+
+
+class Command(BaseCommand):
+    help = ('Genera STATIC_ROOT para producción: nombres con hash, manifiesto y '
+            'copias .gz/.br de los archivos de texto (SisWebCafe.estaticos).')
+
+    def handle(self, *args, **options):
+        call_command('collectstatic', interactive=False, clear=True, verbosity=options['verbosity'])
+
+        totales = {'': [0, 0], '.gz': [0, 0], '.br': [0, 0]}
+        for raiz, _, archivos in os.walk(settings.STATIC_ROOT):
+            for archivo in archivos:
+                sufijo = os.path.splitext(archivo)[1]
+                total = totales[sufijo if sufijo in totales else '']
+                total[0] += 1
+                total[1] += os.path.getsize(os.path.join(raiz, archivo))
+
+        for sufijo, (cantidad, bytes_) in totales.items():
+            self.stdout.write(f'{sufijo or "originales":>10}: {cantidad} archivos, {bytes_ / 1024:.1f} KB')
+        if brotli is None:
+            self.stdout.write(self.style.WARNING('El paquete brotli no está instalado: solo se generaron .gz.'))
+        self.stdout.write(self.style.SUCCESS(f'Estáticos listos en {settings.STATIC_ROOT}.'))
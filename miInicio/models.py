@@ -1,3 +1,10 @@
 from django.db import models
 
-# Create your models here.
+
+class VersionRoles(models.Model):
+    """
+    Versión de los roles guardados en sesión (SisWebCafe.roles). Vive en la
+    base, como las sesiones, para que todos los procesos vean la misma.
+    """
+    clave = models.CharField(max_length=40, primary_key=True)
+    version = models.BigIntegerField()
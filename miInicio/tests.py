@@ -1,3 +1,439 @@
-from django.test import TestCase
+import gzip
+import os
+import shutil
+import tempfile
+import uuid
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from cassandra import ConsistencyLevel, InvalidRequest
+from cassandra.cqlengine import connection as cqlengine_connection
+from cassandra.cqlengine import query as cqlengine_query
+from cassandra.cqlengine.query import BatchQuery
+from cassandra.query import SimpleStatement
+from django_cassandra_engine.test import TestCase as CassandraTestCase
+from prometheus_client import REGISTRY
+
+from SisWebCafe import cassandra_memoria, cassandra_perfiles
+from SisWebCafe.archivos import CACHE_INMUTABLE, CACHE_REVALIDAR
+from SisWebCafe.cache_paginas import ALIAS_CACHE, PREFIJO_CANDADO, CachePaginasMiddleware
+from SisWebCafe.roles import es_gerente, roles_de
+from menu.catalogo import invalidar_catalogo
+from menu.models import Producto, Subcategoria
+
+
+class RolesTest(TestCase):
+    def setUp(self):
+        self.gerentes = Group.objects.create(name='Gerente')
+        self.usuario = User.objects.create_user('laura', password='clave12345')
+        self.url = reverse('lista_sucursales')
+
+    def consultas_de_grupos(self):
+        with CaptureQueriesContext(connection) as capturadas:
+            response = self.client.get(self.url)
+        consultas = [q for q in capturadas.captured_queries if 'auth_group' in q['sql']]
+        return response, len(consultas)
+
+    def test_una_consulta_de_roles_por_sesion(self):
+        self.usuario.groups.add(self.gerentes)
+        self.client.login(username='laura', password='clave12345')
+
+        # Decorador, vista y context processor comparten el mismo resultado
+        response, consultas = self.consultas_de_grupos()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(consultas, 1)
+
+        response, consultas = self.consultas_de_grupos()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(consultas, 0)
+
+    def test_cambio_de_grupos_invalida_la_sesion(self):
+        self.client.login(username='laura', password='clave12345')
+        response, _ = self.consultas_de_grupos()
+        self.assertEqual(response.status_code, 302)
+
+        self.usuario.groups.add(self.gerentes)
+        response, _ = self.consultas_de_grupos()
+        self.assertEqual(response.status_code, 200)
+
+        self.gerentes.user_set.clear()
+        response, _ = self.consultas_de_grupos()
+        self.assertEqual(response.status_code, 302)
+
+    def test_invalidacion_visible_desde_otro_proceso(self):
+        self.usuario.groups.add(self.gerentes)
+        self.client.login(username='laura', password='clave12345')
+        response, _ = self.consultas_de_grupos()
+        self.assertEqual(response.status_code, 200)
+
+        # Otro proceso quita el rol: la caché local de este no se enteró
+        self.usuario.groups.remove(self.gerentes)
+        cache.clear()
+        response, consultas = self.consultas_de_grupos()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(consultas, 1)
+
+    def test_roles_fuera_de_un_request(self):
+        self.assertEqual(roles_de(AnonymousUser()), frozenset())
+        self.usuario.groups.add(self.gerentes)
+        usuario = User.objects.get(pk=self.usuario.pk)
+        self.assertTrue(es_gerente(usuario))
+        with self.assertNumQueries(0):
+            self.assertTrue(es_gerente(usuario))
+
+
+class EstaticosComprimidosTest(TestCase):
+    def setUp(self):
+        self.destino = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.destino, ignore_errors=True)
+        ajustes = override_settings(STATIC_ROOT=self.destino)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def construir(self):
+        call_command('construir_estaticos', verbosity=0, stdout=open(os.devnull, 'w'))
+
+    def test_genera_nombres_con_hash_y_copias_gzip(self):
+        self.construir()
+        con_hash = staticfiles_storage.stored_name('css/base.css')
+        self.assertNotEqual(con_hash, 'css/base.css')
+        self.assertTrue(os.path.isfile(os.path.join(self.destino, 'staticfiles.json')))
+
+        ruta = os.path.join(self.destino, con_hash)
+        with open(ruta, 'rb') as original, open(ruta + '.gz', 'rb') as comprimido:
+            self.assertEqual(gzip.decompress(comprimido.read()), original.read())
+        # Las imágenes ya vienen comprimidas
+        imagen = staticfiles_storage.stored_name('img/menu.jpg')
+        self.assertFalse(os.path.exists(os.path.join(self.destino, imagen + '.gz')))
+
+    def test_sirve_la_variante_comprimida_con_cache_inmutable(self):
+        self.construir()
+        url = staticfiles_storage.url('css/base.css')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Cache-Control'], CACHE_INMUTABLE)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertTrue(gzip.decompress(b"".join(response.streaming_content)))
+
+        sin_gzip = self.client.get(url)
+        self.assertNotIn('Content-Encoding', sin_gzip)
+        self.assertNotEqual(sin_gzip['ETag'], response['ETag'])
+
+        repetida = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repetida.status_code, 304)
+
+        # El nombre sin hash puede cambiar de contenido: se revalida
+        original = self.client.get('/static/css/base.css')
+        self.assertEqual(original['Cache-Control'], CACHE_REVALIDAR)
+
+    def test_sin_collectstatic_usa_las_carpetas_de_origen(self):
+        response = self.client.get(staticfiles_storage.url('css/base.css'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], CACHE_REVALIDAR)
+        self.assertEqual(self.client.get('/static/..%2Fmanage.py').status_code, 404)
+        self.assertEqual(self.client.get('/static/css/no-existe.css').status_code, 404)
+
+
+class ServirMediaTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        os.makedirs(os.path.join(self.media, 'video'))
+        self.contenido = bytes(range(256)) * 40
+        with open(os.path.join(self.media, 'video', 'inicio.mp4'), 'wb') as archivo:
+            archivo.write(self.contenido)
+        self.url = '/media/video/inicio.mp4'
+
+    def contenido_de(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_archivo_completo_con_etag_fuerte(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'], CACHE_REVALIDAR)
+        self.assertFalse(response['ETag'].startswith('W/'))
+        self.assertEqual(self.contenido_de(response), self.contenido)
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(
+            self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"otro"').status_code, 200)
+
+    def test_rangos_de_bytes(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.contenido)}')
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(self.contenido_de(response), self.contenido[100:200])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(self.contenido_de(response), self.contenido[-10:])
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10000-')
+        self.assertEqual(self.contenido_de(response), self.contenido[10000:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.contenido)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.contenido)}')
+
+        # If-Range con otra versión: se manda el archivo completo
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"viejo"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_imagen_por_contenido_es_inmutable(self):
+        digest = 'ab' * 32
+        os.makedirs(os.path.join(self.media, 'imgProductos', 'ab'))
+        with open(os.path.join(self.media, 'imgProductos', 'ab', f'{digest}.jpg'), 'wb') as archivo:
+            archivo.write(b'imagen')
+        response = self.client.get(f'/media/imgProductos/ab/{digest}.jpg')
+        self.assertEqual(response['Cache-Control'], CACHE_INMUTABLE)
+        self.assertEqual(response['ETag'], f'"{digest[:32]}"')
+
+    @override_settings(ARCHIVOS_PROXY='nginx')
+    def test_delega_el_envio_al_proxy(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/_media/video/inicio.mp4')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.client.get('/media/video/no-existe.mp4').status_code, 404)
+
+
+class ConteoConsultasTest(TestCase):
+    @override_settings(CONTAR_CONSULTAS=True)
+    def test_agrega_las_consultas_del_request(self):
+        User.objects.create_user('laura', password='clave12345')
+        self.client.login(username='laura', password='clave12345')
+        with CaptureQueriesContext(connection) as capturadas:
+            response = self.client.get(reverse('lista_sucursales'))
+        self.assertEqual(int(response['X-Consultas-SQL']), len(capturadas.captured_queries))
+        self.assertEqual(response['X-Consultas-Cassandra'], '0')
+
+    def test_apagado_no_agrega_cabeceras(self):
+        response = self.client.get(reverse('signin'))
+        self.assertNotIn('X-Consultas-SQL', response)
+
+    def metrica(self, nombre, vista, alias='default'):
+        return REGISTRY.get_sample_value(nombre, {'vista': vista, 'alias': alias}) or 0
+
+    def test_publica_metricas_por_vista(self):
+        User.objects.create_user('laura', password='clave12345')
+        self.client.login(username='laura', password='clave12345')
+        requests_antes = self.metrica('siswebcafe_consultas_por_request_count', 'lista_sucursales')
+        consultas_antes = self.metrica('siswebcafe_consultas_por_request_sum', 'lista_sucursales')
+        cassandra_antes = self.metrica('siswebcafe_consultas_por_request_count', 'lista_sucursales', 'cassandra')
+
+        with CaptureQueriesContext(connection) as capturadas:
+            self.client.get(reverse('lista_sucursales'))
+
+        self.assertEqual(self.metrica('siswebcafe_consultas_por_request_count', 'lista_sucursales'), requests_antes + 1)
+        self.assertEqual(
+            self.metrica('siswebcafe_consultas_por_request_sum', 'lista_sucursales'),
+            consultas_antes + len(capturadas.captured_queries))
+        self.assertEqual(
+            self.metrica('siswebcafe_consultas_por_request_count', 'lista_sucursales', 'cassandra'), cassandra_antes + 1)
+        self.assertGreater(self.metrica('siswebcafe_consulta_segundos_count', 'lista_sucursales'), 0)
+
+        response = self.client.get('/metrics')
+        self.assertIn(b'siswebcafe_consulta_filas_bucket{alias="default"', response.content)
+
+
+class SesionFalsa:
+    def __init__(self, error=None):
+        self.preparadas = []
+        self.ejecutadas = []
+        self.error = error
+
+    def prepare(self, texto):
+        self.preparadas.append(texto)
+        if self.error:
+            raise self.error
+        return SimpleNamespace(bind=lambda valores: SimpleNamespace(valores=valores))
+
+    def execute_async(self, sentencia, valores, timeout=None, execution_profile=None):
+        self.ejecutadas.append((sentencia, execution_profile))
+        return SimpleNamespace(result=lambda: [], coordinator_host=None)
+
+
+class CassandraPerfilesTest(SimpleTestCase):
+    def ejecutar(self, sesion, texto, parametros, perfil=None):
+        # Como la arma cqlengine: sin fetch_size, todas las filas de una vez
+        return cassandra_perfiles.preparar(sesion, SimpleStatement(texto, fetch_size=None), parametros, perfil)
+
+    def test_prepara_la_sentencia_que_se_repite(self):
+        sesion = SesionFalsa()
+        texto = 'SELECT * FROM producto WHERE "categoria_id" = %(1)s AND "id" IN %(0)s LIMIT 10'
+        sentencia, parametros = self.ejecutar(sesion, texto, {'0': ('a', 'b'), '1': 'c'})
+        self.assertEqual(parametros, {'0': ('a', 'b'), '1': 'c'})
+        self.assertTrue(sentencia.is_idempotent)
+
+        for _ in range(3):
+            ligada, parametros = self.ejecutar(sesion, texto, {'0': ('d',), '1': 'e'})
+        self.assertIsNone(parametros)
+        # Los valores van en el orden de los marcadores en el texto
+        self.assertEqual(ligada.valores, ['e', ('d',)])
+        self.assertEqual(
+            sesion.preparadas, ['SELECT * FROM producto WHERE "categoria_id" = ? AND "id" IN ? LIMIT 10'])
+
+    def test_sentencias_que_no_se_preparan(self):
+        invalida = SesionFalsa(InvalidRequest('no'))
+        with self.assertLogs('SisWebCafe.cassandra_perfiles', 'WARNING'):
+            for _ in range(3):
+                sentencia, _ = self.ejecutar(
+                    invalida, 'UPDATE menu SET "x" = %(0)s WHERE "id" = %(1)s', {'0': 1, '1': 2})
+        self.assertIsInstance(sentencia, SimpleStatement)
+        self.assertFalse(sentencia.is_idempotent)
+        self.assertEqual(len(invalida.preparadas), 1)
+
+        lote = SesionFalsa()
+        for _ in range(3):
+            self.ejecutar(lote, 'BEGIN BATCH INSERT INTO t ("id") VALUES (%(0)s) APPLY BATCH', {'0': 1})
+        self.assertEqual(lote.preparadas, [])
+
+        sentencia, _ = self.ejecutar(SesionFalsa(), 'SELECT * FROM t', {}, cassandra_perfiles.PERFIL_MASIVO)
+        self.assertEqual(sentencia.fetch_size, cassandra_perfiles.TAMANIO_PAGINA_MASIVO)
+
+    def test_hosts_lentos_al_final_del_plan(self):
+        self.addCleanup(cassandra_perfiles.latencias.hosts.clear)
+        hija = SimpleNamespace(make_query_plan=lambda keyspace, query: ['a', 'b', 'c'])
+        politica = cassandra_perfiles.LatenciaPrimero(hija, umbral=2.0)
+        self.assertEqual(list(politica.make_query_plan()), ['a', 'b', 'c'])
+
+        cassandra_perfiles.latencias.registrar('a', 0.5)
+        cassandra_perfiles.latencias.registrar('b', 0.01)
+        self.assertEqual(list(politica.make_query_plan()), ['b', 'c', 'a'])
+        politica.vigencia = -1
+        self.assertEqual(list(politica.make_query_plan()), ['a', 'b', 'c'])
+
+    def test_perfiles_y_metricas(self):
+        perfiles = cassandra_perfiles.perfiles_de_ejecucion()
+        self.assertEqual(perfiles[cassandra_perfiles.PERFIL_ADMIN].consistency_level, ConsistencyLevel.LOCAL_QUORUM)
+        self.assertEqual(perfiles[cassandra_perfiles.PERFIL_MENU].consistency_level, ConsistencyLevel.LOCAL_ONE)
+        self.assertIsNotNone(perfiles[cassandra_perfiles.PERFIL_MENU].speculative_execution_policy)
+
+        @cassandra_perfiles.perfil_cassandra(cassandra_perfiles.PERFIL_ADMIN)
+        def vista():
+            return cassandra_perfiles.perfil_actual()
+
+        self.assertEqual(vista(), cassandra_perfiles.PERFIL_ADMIN)
+        self.assertEqual(cassandra_perfiles.nombre_perfil(cassandra_perfiles.perfil_actual()), 'default')
+
+        antes = REGISTRY.get_sample_value('siswebcafe_cassandra_perfil_segundos_count', {'perfil': 'admin'}) or 0
+        cassandra_perfiles.medir(cassandra_perfiles.PERFIL_ADMIN, SimpleNamespace(coordinator_host=None), 0.01)
+        self.assertEqual(
+            REGISTRY.get_sample_value('siswebcafe_cassandra_perfil_segundos_count', {'perfil': 'admin'}), antes + 1)
+
+    def test_lotes_de_escritura_con_perfil_admin(self):
+        # El camino real de cqlengine en lugar del almacén en memoria
+        sesion = SesionFalsa()
+        self.enterContext(mock.patch.object(
+            cqlengine_query.BatchQuery, 'execute', cassandra_memoria.batch_execute_cqlengine))
+        self.enterContext(mock.patch.object(cqlengine_connection, 'execute', cassandra_perfiles.ejecutar))
+        self.enterContext(mock.patch.object(cqlengine_connection, 'get_session', lambda connection=None: sesion))
+        metrica = ('siswebcafe_cassandra_perfil_segundos_count', {'perfil': 'admin'})
+        antes = REGISTRY.get_sample_value(*metrica) or 0
+
+        with BatchQuery() as lote:
+            Producto(categoria_id=uuid.uuid4(), nombre='Latte', precio=Decimal('45.00')).batch(lote).save()
+        with cassandra_perfiles.perfil_cassandra(cassandra_perfiles.PERFIL_MENU), BatchQuery() as lote:
+            Producto(categoria_id=uuid.uuid4(), nombre='Moka', precio=Decimal('50.00')).batch(lote).save()
+
+        self.assertEqual(len(sesion.ejecutadas), 2)
+        for sentencia, perfil in sesion.ejecutadas:
+            self.assertEqual(sentencia.query_string.split()[:2], ['BEGIN', 'BATCH'])
+            self.assertEqual(perfil, cassandra_perfiles.PERFIL_ADMIN)
+        self.assertEqual(REGISTRY.get_sample_value(*metrica), antes + 2)
+
+        with cassandra_perfiles.perfil_cassandra(cassandra_perfiles.PERFIL_MASIVO):
+            Subcategoria(categoria_id=uuid.uuid4(), nombre='Tés').save()
+        self.assertEqual(sesion.ejecutadas[-1][1], cassandra_perfiles.PERFIL_MASIVO)
+
+
+class CachePaginasTest(CassandraTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.paginas = caches[ALIAS_CACHE]
+        self.paginas.clear()
+        self.producto = Producto.create(
+            categoria_id=uuid.uuid4(), nombre='Latte', precio=Decimal('45.00'), activo=True)
+        invalidar_catalogo()
+        self.url = reverse('menu:producto_list') + f'?categoria={self.producto.categoria_id}'
+
+    def test_anonimos_reciben_la_copia(self):
+        for url in (reverse('home'), reverse('seleccionar_tipo_pedido'), self.url):
+            self.assertEqual(self.client.get(url)['X-Cache-Pagina'], 'MISS')
+            with CaptureQueriesContext(connection) as capturadas:
+                response = self.client.get(url)
+            self.assertEqual(response['X-Cache-Pagina'], 'HIT')
+            self.assertEqual(len(capturadas), 0)
+        self.assertContains(response, 'Latte')
+        # Otra query string es otra página
+        self.assertEqual(self.client.get(reverse('menu:producto_list'))['X-Cache-Pagina'], 'MISS')
+
+    def test_parametros_ajenos_no_crean_copias(self):
+        self.client.get(self.url)
+        con_campania = self.url + '&utm_source=correo&fbclid=abc'
+        self.assertEqual(self.client.get(con_campania)['X-Cache-Pagina'], 'HIT')
+        clave = CachePaginasMiddleware(None).clave(RequestFactory().get(con_campania))
+        self.assertEqual(clave, CachePaginasMiddleware(None).clave(RequestFactory().get(self.url)))
+        # Las copias no van en la caché de las versiones
+        self.assertIsNotNone(self.paginas.get(clave))
+        self.assertIsNone(cache.get(clave))
+
+    async def test_asgi(self):
+        self.assertEqual((await self.async_client.get(self.url))['X-Cache-Pagina'], 'MISS')
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response['X-Cache-Pagina'], 'HIT')
+        self.assertContains(response, 'Latte')
+
+    def test_usuarios_con_sesion_no_usan_la_cache(self):
+        self.client.get(self.url)
+        self.client.force_login(User.objects.create_user('cliente', password='clave12345'))
+        self.assertNotIn('X-Cache-Pagina', self.client.get(self.url))
+
+    def test_copia_obsoleta_mientras_se_regenera(self):
+        self.client.get(self.url)
+        Producto.objects.get(id=self.producto.id).update(nombre='Moka')
+        invalidar_catalogo()
+
+        # Otro request tiene el candado: se sirve la copia anterior
+        clave = CachePaginasMiddleware(None).clave(RequestFactory().get(self.url))
+        self.paginas.add(PREFIJO_CANDADO + clave, 1)
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache-Pagina'], 'STALE')
+        self.assertContains(response, 'Latte')
+
+        self.paginas.delete(PREFIJO_CANDADO + clave)
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache-Pagina'], 'MISS')
+        self.assertContains(response, 'Moka')
+        self.assertIsNone(self.paginas.get(PREFIJO_CANDADO + clave))
+        self.assertEqual(self.client.get(self.url)['X-Cache-Pagina'], 'HIT')
+
+    def test_no_guarda_paginas_con_token_csrf(self):
+        def con_formulario(request):
+            return HttpResponse(f'<input value="{get_token(request)}">')
+
+        middleware = CachePaginasMiddleware(con_formulario)
+        for _ in range(2):
+            response = middleware(RequestFactory().get(reverse('home')))
+        self.assertNotIn('X-Cache-Pagina', response)
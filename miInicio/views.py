@@ -5,12 +5,11 @@ from django.contrib.auth import login, authenticate, logout
 from .forms import CustomUserCreationForm
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.decorators import login_required
+from SisWebCafe.roles import es_gerente
+from SisWebCafe.cache_paginas import pagina_publica
 
 
-def es_gerente(user):
-    return user.is_authenticated and user.groups.filter(name='Gerente').exists()
-
-
+@pagina_publica
 def home(request):
     """funcion de inicio"""
     return render(request, 'Principal/home.html')
@@ -0,0 +1,108 @@
+"""Cotización del carrito contra el catálogo de Cassandra y escritura de sus líneas."""
+from dataclasses import dataclass
+from decimal import Decimal
+import uuid
+
+from menu.models import Producto
+from SisWebCafe.cassandra_asincrono import consultar
+from SisWebCafe.cassandra_perfiles import PERFIL_MENU, perfil_cassandra
+
+from .models import DetallePedido
+
+
+@dataclass(frozen=True)
+class LineaCotizada:
+    """Precio congelado de una línea del carrito al momento del checkout."""
+    producto_id: uuid.UUID
+    nombre: str
+    precio_unitario: Decimal
+    cantidad: int
+    puntos_extra: int = 0
+
+    @property
+    def subtotal(self):
+        return self.precio_unitario * self.cantidad
+
+
+@dataclass(frozen=True)
+class CotizacionCarrito:
+    """Snapshot inmutable de precios de un carrito completo."""
+    lineas: tuple
+    total: Decimal
+
+    def __iter__(self):
+        return iter(self.lineas)
+
+    def __len__(self):
+        return len(self.lineas)
+
+
+def _items(carrito):
+    return [(uuid.UUID(str(item['id'])), int(item['cantidad'])) for item in carrito]
+
+
+def cotizar_carrito(carrito):
+    """
+    Resuelve todos los productos del carrito con una sola consulta IN a
+    Cassandra y devuelve una CotizacionCarrito con el total y las líneas.
+
+    Lanza Producto.DoesNotExist si algún id del carrito no existe.
+    """
+    items = _items(carrito)
+    ids = list({producto_id for producto_id, _ in items})
+
+    productos = {}
+    if ids:
+        with perfil_cassandra(PERFIL_MENU):
+            productos = {p.id: p for p in Producto.objects.filter(id__in=ids)}
+    return _cotizar(items, productos)
+
+
+async def cotizar_carrito_async(carrito):
+    """cotizar_carrito() con la consulta IN por execute_async del driver."""
+    items = _items(carrito)
+    ids = list({producto_id for producto_id, _ in items})
+
+    productos = {}
+    if ids:
+        with perfil_cassandra(PERFIL_MENU):
+            productos = {p.id: p for p in await consultar(Producto.objects.filter(id__in=ids))}
+    return _cotizar(items, productos)
+
+
+def _cotizar(items, productos):
+    lineas = []
+    for producto_id, cantidad in items:
+        producto = productos.get(producto_id)
+        if producto is None:
+            raise Producto.DoesNotExist(f'El producto {producto_id} no existe.')
+        lineas.append(LineaCotizada(
+            producto_id=producto.id,
+            nombre=producto.nombre,
+            precio_unitario=producto.precio,
+            cantidad=cantidad,
+            puntos_extra=producto.puntos_extra or 0,
+        ))
+
+    total = sum((linea.subtotal for linea in lineas), Decimal('0.00'))
+    return CotizacionCarrito(lineas=tuple(lineas), total=total)
+
+
+def crear_detalles_pedido(pedido, cotizacion):
+    """
+    Inserta todas las líneas del pedido con un solo bulk_create, llenando los
+    campos de caché (nombre, precio, subtotal, puntos extra) desde la cotización. No pasa
+    por DetallePedido.save(), así que no consulta Cassandra.
+    """
+    return DetallePedido.objects.bulk_create([
+        DetallePedido(
+            pedido=pedido,
+            producto_id=linea.producto_id,
+            cantidad=linea.cantidad,
+            nombre_producto=linea.nombre,
+            precio_unitario=linea.precio_unitario,
+            subtotal=linea.subtotal,
+            puntos_extra=linea.puntos_extra,
+        )
+        for linea in cotizacion
+    ])
@@ -0,0 +1,220 @@
+"""
+Eventos de pedidos sobre LISTEN/NOTIFY de PostgreSQL.
+
+publicar_evento_pedido() manda un NOTIFY con el estado del pedido. NOTIFY
+es transaccional: si se llama dentro de transaction.atomic() el evento
+solo sale cuando la transacción confirma, y se descarta si se revierte.
+
+escuchar_eventos() abre una conexión propia (no la del request), hace
+LISTEN y produce los eventos conforme llegan.
+
+Los flujos SSE de caja y del cliente son generadores asíncronos bajo ASGI:
+un solo hilo por proceso (difusor) escucha y reparte cada evento a la
+asyncio.Queue de cada flujo abierto, así un flujo no ocupa un hilo ni una
+conexión a la base y cada evento sale en cuanto llega. Bajo WSGI (runserver)
+se usa flujo_sse_sincrono, con su propio LISTEN.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections, connection, connections
+from django.http import StreamingHttpResponse
+
+logger = logging.getLogger(__name__)
+
+CANAL = 'pedidos_estado'
+
+# Los flujos se cortan periódicamente y EventSource se reconecta solo
+# después de RECONEXION_MS.
+DURACION_FLUJO = 300
+LATIDO = 15
+# Cada cuánto revisa el difusor si quedan flujos abiertos
+ESPERA_DIFUSOR = 1
+RECONEXION_MS = 3000
+
+
+def _horario_recoleccion(pedido):
+    try:
+        return pedido.pickup.horario_recoleccion
+    except ObjectDoesNotExist:
+        return pedido.fecha_hora
+
+
+def datos_evento(pedido, tipo='estado'):
+    horario = _horario_recoleccion(pedido)
+    return {
+        'tipo': tipo,
+        'id': pedido.id,
+        'codigo': pedido.codigo,
+        'estado': pedido.estado,
+        'estado_display': pedido.get_estado_display(),
+        'sucursal_id': pedido.sucursal_id,
+        'usuario_id': pedido.usuario_id,
+        'total': str(pedido.total),
+        'preparado': pedido.preparado,
+        'horario_recoleccion': horario.isoformat() if horario else None,
+    }
+
+
+def publicar_evento_pedido(pedido, tipo='estado'):
+    """Notifica un cambio del pedido ('creado' o 'estado') a quien esté escuchando."""
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, %s)', [CANAL, json.dumps(datos_evento(pedido, tipo))])
+
+
+def _conexion_dedicada():
+    base = connections['default']
+    conn = base.Database.connect(**base.get_connection_params())
+    conn.autocommit = True
+    return conn
+
+
+def _esperar(conn, timeout):
+    """Payloads recibidos en a lo más `timeout` segundos (psycopg2 o psycopg 3)."""
+    if hasattr(conn, 'poll'):
+        if select.select([conn], [], [], timeout) == ([], [], []):
+            return []
+        conn.poll()
+        payloads = [n.payload for n in conn.notifies]
+        conn.notifies.clear()
+        return payloads
+    return [n.payload for n in conn.notifies(timeout=timeout, stop_after=100)]
+
+
+def escuchar_eventos(timeout=15, al_conectar=None):
+    """
+    Generador de eventos (dicts). Produce None cada `timeout` segundos sin
+    eventos para que el llamador pueda mandar latidos o cortar el flujo.
+    `al_conectar` se llama cuando el LISTEN ya está activo. La conexión se
+    cierra al cerrar el generador.
+    """
+    conn = _conexion_dedicada()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN {CANAL}')
+        if al_conectar is not None:
+            al_conectar()
+        while True:
+            payloads = _esperar(conn, timeout)
+            if not payloads:
+                yield None
+            for payload in payloads:
+                yield json.loads(payload)
+    finally:
+        conn.close()
+
+
+class _Difusor:
+    """
+    Un LISTEN por proceso que reparte los eventos a las colas de los flujos
+    SSE. El hilo arranca con el primer flujo y termina cuando no queda ninguno.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._suscriptores = set()
+        self._hilo = None
+        # Se activa cuando el LISTEN está listo; antes de eso no llega nada
+        self.conectado = threading.Event()
+
+    def suscribir(self, loop, cola):
+        with self._lock:
+            self._suscriptores.add((loop, cola))
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._escuchar, name='eventos-sse', daemon=True)
+                self._hilo.start()
+
+    def desuscribir(self, loop, cola):
+        with self._lock:
+            self._suscriptores.discard((loop, cola))
+
+    def repartir(self, evento):
+        with self._lock:
+            suscriptores = list(self._suscriptores)
+        for loop, cola in suscriptores:
+            try:
+                loop.call_soon_threadsafe(cola.put_nowait, evento)
+            except RuntimeError:
+                # El event loop de ese flujo ya se cerró
+                self.desuscribir(loop, cola)
+
+    def _sin_suscriptores(self):
+        with self._lock:
+            if self._suscriptores:
+                return False
+            self._hilo = None
+            self.conectado.clear()
+            return True
+
+    def _escuchar(self):
+        while True:
+            try:
+                for evento in escuchar_eventos(timeout=ESPERA_DIFUSOR, al_conectar=self.conectado.set):
+                    if evento is not None:
+                        self.repartir(evento)
+                    elif self._sin_suscriptores():
+                        return
+            except Exception:
+                logger.exception('Se perdió la escucha de eventos para los flujos SSE')
+                self.conectado.clear()
+                close_old_connections()
+                time.sleep(5)
+
+
+difusor = _Difusor()
+
+
+async def flujo_sse(filtro, duracion=DURACION_FLUJO, latido=LATIDO):
+    """Cuerpo text/event-stream con los eventos que pasan `filtro` (ASGI)."""
+    loop = asyncio.get_running_loop()
+    cola = asyncio.Queue()
+    # Antes del primer bloque: lo que pase después de que el cliente lo lee le llega
+    difusor.suscribir(loop, cola)
+    limite = loop.time() + duracion
+    try:
+        yield f'retry: {RECONEXION_MS}\n\n'
+        while (restante := limite - loop.time()) > 0:
+            try:
+                evento = await asyncio.wait_for(cola.get(), min(latido, restante))
+            except asyncio.TimeoutError:
+                yield ': latido\n\n'
+                continue
+            if filtro(evento):
+                yield f'event: pedido\ndata: {json.dumps(evento)}\n\n'
+    finally:
+        difusor.desuscribir(loop, cola)
+
+
+def flujo_sse_sincrono(filtro, duracion=DURACION_FLUJO, latido=LATIDO):
+    """flujo_sse para WSGI: ocupa un hilo del servidor y su propia conexión LISTEN."""
+    yield f'retry: {RECONEXION_MS}\n\n'
+    limite = time.monotonic() + duracion
+    eventos = escuchar_eventos(timeout=latido)
+    try:
+        for evento in eventos:
+            if evento is None:
+                yield ': latido\n\n'
+            elif filtro(evento):
+                yield f'event: pedido\ndata: {json.dumps(evento)}\n\n'
+            if time.monotonic() >= limite:
+                break
+    finally:
+        eventos.close()
+
+
+def respuesta_sse(request, filtro):
+    # Bajo ASGI un iterador síncrono se lee completo antes de enviarlo
+    flujo = flujo_sse(filtro) if isinstance(request, ASGIRequest) else flujo_sse_sincrono(filtro)
+    response = StreamingHttpResponse(flujo, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Que nginx no acumule el flujo en su buffer
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from pedido.puntos import perfiles_descuadrados, reconciliar_saldos
+
+
+class Command(BaseCommand):
+    help = 'Compara PerfilUsuario.puntos con la suma de MovimientoPuntos y, con --corregir, lo ajusta al libro.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corregir', action='store_true', help='Reescribe los saldos descuadrados con el saldo del libro.')
+
+    def handle(self, *args, **options):
+        descuadrados = perfiles_descuadrados().values_list('user_id', 'puntos', 'saldo_libro')
+        total = 0
+        for user_id, puntos, saldo_libro in descuadrados.iterator():
+            self.stdout.write(f'Usuario {user_id}: perfil {puntos}, libro {saldo_libro}')
+            total += 1
+
+        if not total:
+            self.stdout.write(self.style.SUCCESS('Todos los saldos coinciden con el libro.'))
+        elif options['corregir']:
+            corregidos = reconciliar_saldos()
+            self.stdout.write(self.style.SUCCESS(f'{corregidos} saldos corregidos.'))
+        else:
+            self.stdout.write(self.style.WARNING(f'{total} saldos descuadrados. Usa --corregir para ajustarlos.'))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedido', '0002_alter_perfilusuario_estado_cuenta_usuario'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['estado'], name='pedido_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['fecha_hora'], name='pedido_fecha_hora_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:31
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+# auth_user no es nuestro, así que el índice trigram para
+# usuario__username__icontains se crea con SQL. Si el servidor no tiene
+# pg_trgm disponible se omite y la búsqueda sigue funcionando sin índice.
+CREAR_INDICE_USERNAME = """
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS auth_user_username_upper_trgm
+            ON auth_user USING gin (UPPER(username) gin_trgm_ops);
+    END IF;
+END
+$$;
+"""
+
+BORRAR_INDICE_USERNAME = 'DROP INDEX IF EXISTS auth_user_username_upper_trgm;'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedido', '0003_pedido_pedido_estado_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='pedido',
+            name='pedido_fecha_hora_idx',
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['fecha_hora', 'id'], name='pedido_fecha_hora_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('codigo'), name='text_pattern_ops'), name='pedido_codigo_upper_idx'),
+        ),
+        migrations.RunSQL(CREAR_INDICE_USERNAME, BORRAR_INDICE_USERNAME),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def abrir_libro(apps, schema_editor):
+    """Un movimiento de saldo inicial por cada perfil con puntos."""
+    PerfilUsuario = apps.get_model('pedido', 'PerfilUsuario')
+    MovimientoPuntos = apps.get_model('pedido', 'MovimientoPuntos')
+    MovimientoPuntos.objects.bulk_create(
+        [
+            MovimientoPuntos(usuario_id=user_id, tipo='saldo_inicial', puntos=puntos)
+            for user_id, puntos in PerfilUsuario.objects.filter(puntos__gt=0).values_list('user_id', 'puntos')
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedido', '0004_indices_busqueda_caja'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detallepedido',
+            name='puntos_extra',
+            field=models.PositiveIntegerField(default=0, help_text='Puntos extra por unidad al momento del pedido'),
+        ),
+        migrations.CreateModel(
+            name='MovimientoPuntos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('saldo_inicial', 'Saldo inicial'), ('ganados', 'Ganados por compra'), ('usados', 'Usados en un pedido'), ('ajuste', 'Ajuste')], max_length=20)),
+                ('puntos', models.IntegerField()),
+                ('fecha_hora', models.DateTimeField(auto_now_add=True)),
+                ('pedido', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_puntos', to='pedido.pedido')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos_puntos', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['usuario', 'fecha_hora'], name='movimiento_usuario_fecha_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('pedido__isnull', False)), fields=('pedido', 'tipo'), name='movimiento_puntos_pedido_unico')],
+            },
+        ),
+        migrations.RunPython(abrir_libro, migrations.RunPython.noop),
+    ]
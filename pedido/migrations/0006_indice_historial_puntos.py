@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedido', '0005_libro_puntos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['usuario', 'estado', 'fecha_hora', 'id'], name='pedido_usuario_historial_idx'),
+        ),
+    ]
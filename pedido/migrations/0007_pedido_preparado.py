@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+def marcar_preparados(apps, schema_editor):
+    """
+    Los pedidos que ya no están pendientes pasaron por cocina o ya se
+    entregaron; sin esto todos los pagados antiguos entrarían a la cola.
+    """
+    Pedido = apps.get_model('pedido', 'Pedido')
+    Pedido.objects.exclude(estado='pendiente').update(preparado=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedido', '0006_indice_historial_puntos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='preparado',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(marcar_preparados, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+PRODUCTOS_POR_CONSULTA = 100
+
+
+def rellenar_puntos_extra(apps, schema_editor):
+    """
+    0005 agregó DetallePedido.puntos_extra en 0 para las líneas que ya
+    existían; antes se leían del catálogo al otorgar puntos y en el
+    historial. Se copian de Producto.puntos_extra (Cassandra) para que los
+    pedidos pendientes no pierdan el bono y el historial no muestre menos.
+    """
+    DetallePedido = apps.get_model('pedido', 'DetallePedido')
+    ids = list(DetallePedido.objects.filter(puntos_extra=0).values_list('producto_id', flat=True).distinct())
+    if not ids:
+        return
+    # Los modelos de Cassandra no tienen estado histórico en las migraciones
+    from menu.models import Producto
+
+    for inicio in range(0, len(ids), PRODUCTOS_POR_CONSULTA):
+        for producto in Producto.objects.filter(id__in=ids[inicio:inicio + PRODUCTOS_POR_CONSULTA]):
+            if producto.puntos_extra:
+                DetallePedido.objects.filter(producto_id=producto.id, puntos_extra=0).update(
+                    puntos_extra=producto.puntos_extra)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedido', '0007_pedido_preparado'),
+    ]
+
+    operations = [
+        migrations.RunPython(rellenar_puntos_extra, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,8 @@
 
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import OpClass
+from django.db.models.functions import Upper
 import uuid
 # Create your models here.
 
@@ -60,10 +62,28 @@ class Pedido(models.Model):
     total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     puntos_ganados = models.PositiveIntegerField(default=0)
     puntos_usados = models.PositiveIntegerField(default=0)
+    # Ya pasó por cocina (preparando o listo): al pagarlo no vuelve a la cola de preparación
+    preparado = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['estado'], name='pedido_estado_idx'),
+            # Orden y cursor de la lista de caja: (fecha_hora, id)
+            models.Index(fields=['fecha_hora', 'id'], name='pedido_fecha_hora_id_idx'),
+            # Historial de puntos: pedidos pagados de un usuario por (fecha_hora, id)
+            models.Index(fields=['usuario', 'estado', 'fecha_hora', 'id'], name='pedido_usuario_historial_idx'),
+            # Búsqueda por prefijo de código (codigo__istartswith)
+            models.Index(
+                OpClass(Upper('codigo'), name='text_pattern_ops'),
+                name='pedido_codigo_upper_idx',
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.codigo:
             self.codigo = uuid.uuid4().hex[:8].upper()
+        if self.estado in ('preparando', 'listo'):
+            self.preparado = True
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -95,6 +115,10 @@ class DetallePedido(models.Model):
     
     cantidad = models.PositiveIntegerField(default=1)
     # Campos de caché del producto
+    puntos_extra = models.PositiveIntegerField(
+        default=0,
+        help_text="Puntos extra por unidad al momento del pedido"
+    )
     nombre_producto = models.CharField(
         max_length=255, 
         default='Producto sin nombre'
@@ -115,14 +139,51 @@ class DetallePedido(models.Model):
 
     def save(self, *args, **kwargs):
         from menu.models import Producto
-        # Actualizar información del producto desde Cassandra
-        try:
-            producto = Producto.objects.get(id=self.producto_id)
-            self.nombre_producto = producto.nombre
-            self.precio_unitario = producto.precio
-        except Producto.DoesNotExist:
-            pass
+        # Solo consultar Cassandra si los campos de caché no vienen llenos
+        # (el checkout ya los trae de la cotización del carrito)
+        if self.nombre_producto == 'Producto sin nombre' or not self.precio_unitario:
+            try:
+                producto = Producto.objects.get(id=self.producto_id)
+                self.nombre_producto = producto.nombre
+                self.precio_unitario = producto.precio
+                self.puntos_extra = producto.puntos_extra or 0
+            except Producto.DoesNotExist:
+                pass
         
         # Calcular subtotal
         self.subtotal = self.cantidad * self.precio_unitario
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+class MovimientoPuntos(models.Model):
+    """Registro inmutable de cada cambio en el saldo de puntos de un usuario."""
+    TIPOS = [
+        ('saldo_inicial', 'Saldo inicial'),
+        ('ganados', 'Ganados por compra'),
+        ('usados', 'Usados en un pedido'),
+        ('ajuste', 'Ajuste'),
+    ]
+    usuario = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='movimientos_puntos')
+    pedido = models.ForeignKey(
+        Pedido, null=True, blank=True, on_delete=models.SET_NULL,
+        related_name='movimientos_puntos')
+    tipo = models.CharField(max_length=20, choices=TIPOS)
+    # Positivo al acreditar, negativo al descontar
+    puntos = models.IntegerField()
+    fecha_hora = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # Un pedido otorga y descuenta puntos a lo más una vez
+            models.UniqueConstraint(
+                fields=['pedido', 'tipo'],
+                condition=models.Q(pedido__isnull=False),
+                name='movimiento_puntos_pedido_unico',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['usuario', 'fecha_hora'], name='movimiento_usuario_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.puntos:+} puntos ({self.get_tipo_display()}) - {self.usuario_id}'
@@ -0,0 +1,139 @@
+"""
+Motor de puntos de lealtad.
+
+Cada cambio de saldo queda en MovimientoPuntos (libro de solo inserción) y
+PerfilUsuario.puntos es el saldo materializado. El saldo siempre se cambia
+con expresiones F(), así dos cajas que cobran al mismo tiempo no pierden
+puntos. Los puntos extra salen de DetallePedido.puntos_extra, copiados del
+catálogo al crear el pedido, por lo que otorgar puntos no consulta Cassandra.
+Las líneas anteriores a esa columna se rellenaron del catálogo en la
+migración 0008.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from SisWebCafe.paginacion import paginar_por_llave
+
+from .models import MovimientoPuntos, Pedido, PerfilUsuario
+
+# PUNTOS_POR_MONTO puntos por cada MONTO_POR_PUNTOS pesos del total
+MONTO_POR_PUNTOS = 30
+PUNTOS_POR_MONTO = 5
+# Valor en pesos de un punto al pagar con puntos
+VALOR_PUNTO = Decimal('0.50')
+PEDIDOS_POR_PAGINA_HISTORIAL = 20
+
+
+class PuntosInsuficientes(Exception):
+    """El saldo del usuario no alcanza para los puntos que se quieren usar."""
+
+
+def puntos_por_compra(total):
+    return int(total // MONTO_POR_PUNTOS) * PUNTOS_POR_MONTO
+
+
+def puntos_de_pedido(pedido):
+    """Puntos que otorga un pedido: por monto más los extra de sus líneas."""
+    extra = pedido.detalles.aggregate(
+        total=Sum(F('puntos_extra') * F('cantidad')))['total'] or 0
+    return puntos_por_compra(pedido.total) + extra
+
+
+def otorgar_puntos(pedido):
+    """
+    Acredita al cliente los puntos del pedido y devuelve cuántos fueron.
+    Es idempotente: un pedido que ya otorgó puntos devuelve 0.
+    """
+    if not pedido.usuario_id:
+        return 0
+    with transaction.atomic():
+        # El bloqueo serializa dos cobros simultáneos del mismo pedido
+        bloqueado = Pedido.objects.select_for_update().only('id', 'total', 'puntos_ganados').get(pk=pedido.pk)
+        if bloqueado.puntos_ganados:
+            # Que un save() posterior del llamador no borre los ya otorgados
+            pedido.puntos_ganados = bloqueado.puntos_ganados
+            return 0
+        puntos = puntos_de_pedido(bloqueado)
+        if puntos <= 0:
+            return 0
+        acreditados = PerfilUsuario.objects.filter(user_id=pedido.usuario_id).update(
+            puntos=F('puntos') + puntos)
+        if not acreditados:
+            return 0
+        MovimientoPuntos.objects.create(
+            usuario_id=pedido.usuario_id, pedido_id=pedido.pk, tipo='ganados', puntos=puntos)
+        Pedido.objects.filter(pk=pedido.pk).update(puntos_ganados=puntos)
+    pedido.puntos_ganados = puntos
+    return puntos
+
+
+def usar_puntos(usuario, pedido, puntos):
+    """
+    Descuenta `puntos` del saldo del usuario para pagar el pedido. Lanza
+    PuntosInsuficientes si el saldo ya no alcanza (otra compra lo gastó).
+    """
+    if puntos <= 0:
+        return 0
+    with transaction.atomic():
+        descontados = PerfilUsuario.objects.filter(user=usuario, puntos__gte=puntos).update(
+            puntos=F('puntos') - puntos)
+        if not descontados:
+            raise PuntosInsuficientes(f'El saldo no alcanza para usar {puntos} puntos.')
+        MovimientoPuntos.objects.create(usuario=usuario, pedido=pedido, tipo='usados', puntos=-puntos)
+    return puntos
+
+
+def historial_puntos(usuario, cursor=None, por_pagina=PEDIDOS_POR_PAGINA_HISTORIAL):
+    """
+    Pedidos pagados del usuario, del más reciente al más antiguo, con sus
+    detalles ya cargados. Devuelve (entradas, siguiente_cursor); cada entrada
+    es {'pedido', 'detalles'} con los puntos extra de cada línea, los
+    guardados en el detalle (rellenados por la migración 0008 en las líneas
+    anteriores). Cuesta dos consultas por página sin importar cuántos
+    pedidos tenga el usuario.
+    """
+    pedidos = Pedido.objects.filter(usuario=usuario, estado='pagado').prefetch_related('detalles')
+    pedidos, siguiente = paginar_por_llave(pedidos, cursor, por_pagina=por_pagina)
+    entradas = [
+        {
+            'pedido': pedido,
+            'detalles': [
+                {
+                    'nombre': detalle.nombre_producto,
+                    'cantidad': detalle.cantidad,
+                    'puntos_extra': detalle.puntos_extra * detalle.cantidad,
+                }
+                for detalle in pedido.detalles.all()
+            ],
+        }
+        for pedido in pedidos
+    ]
+    return entradas, siguiente
+
+
+def _saldo_del_libro():
+    return Coalesce(
+        Subquery(
+            MovimientoPuntos.objects.filter(usuario=OuterRef('user'))
+            .values('usuario')
+            .annotate(saldo=Sum('puntos'))
+            .values('saldo')
+        ),
+        0,
+    )
+
+
+def perfiles_descuadrados():
+    """Perfiles cuyo saldo no coincide con la suma de su libro, anotados con `saldo_libro`."""
+    return PerfilUsuario.objects.annotate(saldo_libro=_saldo_del_libro()).exclude(
+        puntos=F('saldo_libro'))
+
+
+def reconciliar_saldos():
+    """Recalcula en un solo UPDATE los saldos descuadrados; devuelve cuántos corrigió."""
+    return PerfilUsuario.objects.filter(
+        pk__in=perfiles_descuadrados().values('pk'),
+    ).update(puntos=_saldo_del_libro())
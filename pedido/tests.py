@@ -1,10 +1,32 @@
 # pedido/tests.py
-from django.test import TestCase
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django_cassandra_engine.test import TestCase as CassandraTestCase
 from django.contrib.auth.models import User
-from .models import Sucursal, PerfilUsuario, Pedido, PedidoPickup, DetallePedido
+from .models import Sucursal, PerfilUsuario, Pedido, PedidoPickup, DetallePedido, MovimientoPuntos
+from .carrito import (
+    CotizacionCarrito, LineaCotizada, cotizar_carrito, cotizar_carrito_async, crear_detalles_pedido,
+)
+from .eventos import difusor, escuchar_eventos, publicar_evento_pedido
+from .puntos import (
+    PuntosInsuficientes, historial_puntos, otorgar_puntos, perfiles_descuadrados, reconciliar_saldos,
+    usar_puntos,
+)
+from django.urls import reverse
+from menu.catalogo import invalidar_catalogo
+from menu.models import Producto
 from django.utils import timezone
 from datetime import datetime
+from decimal import Decimal
 import uuid
+from importlib import import_module
+from django.apps import apps
 
 class SucursalModelTest(TestCase):
     def test_creacion_sucursal(self):
@@ -172,4 +194,376 @@ class DetallePedidoModelTest(TestCase):
         self.assertEqual(detalle.cantidad, 2)
         self.assertEqual(detalle.precio_unitario, 35.00)
         self.assertEqual(detalle.subtotal, 70.00)
-        self.assertEqual(detalle.nombre_producto, 'Café Americano')
\ No newline at end of file
+        self.assertEqual(detalle.nombre_producto, 'Café Americano')
+
+class CotizarCarritoTest(CassandraTestCase):
+    def setUp(self):
+        self.categoria_id = uuid.uuid4()
+        self.cafe = Producto.create(
+            categoria_id=self.categoria_id,
+            nombre='Café Americano',
+            precio=Decimal('35.00'),
+            puntos_extra=2,
+        )
+        self.pan = Producto.create(
+            categoria_id=self.categoria_id,
+            nombre='Pan de elote',
+            precio=Decimal('28.50'),
+        )
+
+    def test_cotizacion_calcula_total_y_lineas(self):
+        """Prueba que la cotización resuelve precios y total del carrito"""
+        cotizacion = cotizar_carrito([
+            {'id': str(self.cafe.id), 'cantidad': 2},
+            {'id': str(self.pan.id), 'cantidad': '1'},
+        ])
+
+        self.assertEqual(len(cotizacion), 2)
+        self.assertEqual(cotizacion.total, Decimal('98.50'))
+        self.assertEqual(cotizacion.lineas[0].nombre, 'Café Americano')
+        self.assertEqual(cotizacion.lineas[0].subtotal, Decimal('70.00'))
+        self.assertEqual(cotizacion.lineas[0].puntos_extra, 2)
+
+    def test_producto_inexistente(self):
+        """Prueba que un producto desconocido en el carrito se rechaza"""
+        with self.assertRaises(Producto.DoesNotExist):
+            cotizar_carrito([{'id': str(uuid.uuid4()), 'cantidad': 1}])
+
+    async def test_cotizacion_asincrona(self):
+        """Prueba que la versión asíncrona cotiza igual que la síncrona"""
+        carrito = [{'id': str(self.cafe.id), 'cantidad': 2}, {'id': str(self.pan.id), 'cantidad': 1}]
+        self.assertEqual(await cotizar_carrito_async(carrito), cotizar_carrito(carrito))
+        with self.assertRaises(Producto.DoesNotExist):
+            await cotizar_carrito_async([{'id': str(uuid.uuid4()), 'cantidad': 1}])
+
+
+class CrearDetallesPedidoTest(TestCase):
+    def setUp(self):
+        self.sucursal = Sucursal.objects.create(
+            nombre_sucursal='Café Central',
+            calle='Av. Reforma',
+            numero_exterior='123',
+            colonia='Centro',
+            ciudad='CDMX',
+            municipio='Cuauhtémoc',
+            codigo_postal='06000',
+            telefono='555-1234',
+            hora_apertura='08:00:00',
+            hora_cierre='20:00:00'
+        )
+
+    def test_detalles_en_un_solo_insert(self):
+        """Prueba que todas las líneas se insertan con una sola sentencia"""
+        cotizacion = CotizacionCarrito(
+            lineas=tuple(
+                LineaCotizada(uuid.uuid4(), f'Producto {i}', Decimal('10.00'), 2)
+                for i in range(12)
+            ),
+            total=Decimal('240.00'),
+        )
+        pedido = Pedido.objects.create(sucursal=self.sucursal, total=cotizacion.total)
+
+        with self.assertNumQueries(1):
+            crear_detalles_pedido(pedido, cotizacion)
+
+        self.assertEqual(pedido.detalles.count(), 12)
+        detalle = pedido.detalles.first()
+        self.assertEqual(detalle.nombre_producto, 'Producto 0')
+        self.assertEqual(detalle.subtotal, Decimal('20.00'))
+
+
+def crear_sucursal():
+    return Sucursal.objects.create(
+        nombre_sucursal='Café Central',
+        calle='Av. Reforma',
+        numero_exterior='123',
+        colonia='Centro',
+        ciudad='CDMX',
+        municipio='Cuauhtémoc',
+        codigo_postal='06000',
+        telefono='555-1234',
+        hora_apertura='08:00:00',
+        hora_cierre='20:00:00'
+    )
+
+
+class EventosPedidoTest(TransactionTestCase):
+    """NOTIFY solo se entrega al confirmar, así que se usa TransactionTestCase"""
+
+    def test_escuchar_recibe_el_evento_publicado(self):
+        pedido = Pedido.objects.create(sucursal=crear_sucursal(), total=Decimal('25.00'))
+        eventos = escuchar_eventos(timeout=0.1)
+        try:
+            # El primer next() hace LISTEN y termina por timeout sin eventos
+            self.assertIsNone(next(eventos))
+            pedido.estado = 'preparando'
+            pedido.save()
+            publicar_evento_pedido(pedido)
+
+            evento = next(eventos)
+            while evento is None:
+                evento = next(eventos)
+        finally:
+            eventos.close()
+
+        self.assertEqual(evento['id'], pedido.id)
+        self.assertEqual(evento['estado'], 'preparando')
+        self.assertEqual(evento['codigo'], pedido.codigo)
+        self.assertEqual(evento['total'], '25.00')
+
+
+class EventosPedidoAsgiTest(TransactionTestCase):
+    """El flujo SSE servido por el handler ASGI entrega cada evento antes de cerrarse"""
+
+    def setUp(self):
+        cliente = User.objects.create_user('cliente', password='clave12345')
+        self.pedido = Pedido.objects.create(sucursal=crear_sucursal(), usuario=cliente, total=10)
+        self.client.force_login(cliente)
+        url = reverse('eventos_pedido', args=[self.pedido.id])
+        self.scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': url, 'raw_path': url.encode(),
+            'query_string': b'', 'root_path': '', 'client': ('127.0.0.1', 5000),
+            'server': ('testserver', 80),
+            'headers': [
+                (b'host', b'testserver'),
+                (b'cookie', f'sessionid={self.client.cookies["sessionid"].value}'.encode()),
+            ],
+        }
+
+    def preparar_pedido(self):
+        self.pedido.estado = 'preparando'
+        self.pedido.save()
+        publicar_evento_pedido(self.pedido)
+
+    async def test_primer_evento_antes_de_cerrar_el_flujo(self):
+        enviados = asyncio.Queue()
+        desconectado = asyncio.Event()
+        leido = False
+
+        async def recibir():
+            nonlocal leido
+            if not leido:
+                leido = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await desconectado.wait()
+            return {'type': 'http.disconnect'}
+
+        async def siguiente():
+            return await asyncio.wait_for(enviados.get(), 5)
+
+        servidor = asyncio.create_task(ASGIHandler()(self.scope, recibir, enviados.put))
+        try:
+            inicio = await siguiente()
+            self.assertEqual(inicio['status'], 200)
+            self.assertTrue((await siguiente())['body'].startswith(b'retry:'))
+
+            self.assertTrue(await asyncio.to_thread(difusor.conectado.wait, 5))
+            await sync_to_async(self.preparar_pedido)()
+            # Llega mientras el flujo sigue abierto (DURACION_FLUJO es de minutos)
+            bloque = await siguiente()
+            self.assertTrue(bloque['more_body'])
+            self.assertTrue(bloque['body'].startswith(b'event: pedido'))
+            self.assertEqual(json.loads(bloque['body'].split(b'data: ')[1])['estado'], 'preparando')
+        finally:
+            hilo = difusor._hilo
+            desconectado.set()
+            await asyncio.wait_for(servidor, 5)
+            # Sin flujos abiertos el difusor suelta su conexión
+            if hilo is not None:
+                await asyncio.to_thread(hilo.join, 5)
+
+
+class EventosPedidoVistaTest(TestCase):
+    def setUp(self):
+        self.cliente = User.objects.create_user('cliente', password='clave12345')
+        self.otro = User.objects.create_user('otro', password='clave12345')
+        self.pedido = Pedido.objects.create(
+            sucursal=crear_sucursal(), usuario=self.cliente, total=10)
+        self.url = reverse('eventos_pedido', args=[self.pedido.id])
+
+    def test_solo_el_duenio_escucha_su_pedido(self):
+        self.client.login(username='otro', password='clave12345')
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_flujo_sse(self):
+        self.client.login(username='cliente', password='clave12345')
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        # Solo se lee el primer bloque; el flujo no abre la conexión LISTEN hasta el segundo
+        self.assertTrue(next(response.streaming_content).startswith(b'retry:'))
+
+
+class PuntosTest(TestCase):
+    def setUp(self):
+        self.cliente = User.objects.create_user('cliente', password='clave12345')
+        self.perfil = self.cliente.perfil
+        self.sucursal = crear_sucursal()
+
+    def crear_pedido(self, total='60.00'):
+        pedido = Pedido.objects.create(sucursal=self.sucursal, usuario=self.cliente, total=Decimal(total))
+        DetallePedido.objects.create(
+            pedido=pedido, nombre_producto='Latte', precio_unitario=Decimal('20.00'),
+            cantidad=3, puntos_extra=2)
+        return pedido
+
+    def test_otorgar_puntos_una_sola_vez(self):
+        pedido = self.crear_pedido()
+        # 60 pesos dan 10 puntos, más 3 x 2 puntos extra copiados en el detalle
+        self.assertEqual(otorgar_puntos(pedido), 16)
+        self.assertEqual(otorgar_puntos(pedido), 0)
+
+        self.perfil.refresh_from_db()
+        self.assertEqual(self.perfil.puntos, 16)
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.puntos_ganados, 16)
+        movimiento = MovimientoPuntos.objects.get(pedido=pedido)
+        self.assertEqual((movimiento.tipo, movimiento.puntos), ('ganados', 16))
+
+    def test_usar_puntos_sin_saldo(self):
+        otorgar_puntos(self.crear_pedido())
+        pedido = self.crear_pedido()
+        usar_puntos(self.cliente, pedido, 10)
+        with self.assertRaises(PuntosInsuficientes):
+            usar_puntos(self.cliente, pedido, 10)
+        self.perfil.refresh_from_db()
+        self.assertEqual(self.perfil.puntos, 6)
+
+    def test_reconciliar_con_el_libro(self):
+        otorgar_puntos(self.crear_pedido())
+        PerfilUsuario.objects.filter(pk=self.perfil.pk).update(puntos=3)
+
+        self.assertEqual([p.saldo_libro for p in perfiles_descuadrados()], [16])
+        self.assertEqual(reconciliar_saldos(), 1)
+        self.perfil.refresh_from_db()
+        self.assertEqual(self.perfil.puntos, 16)
+        self.assertFalse(perfiles_descuadrados().exists())
+
+
+class RellenarPuntosExtraTest(CassandraTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.cliente = User.objects.create_user('cliente', password='clave12345')
+        self.sucursal = crear_sucursal()
+        self.latte = Producto.create(
+            categoria_id=uuid.uuid4(), nombre='Latte', precio=Decimal('20.00'), puntos_extra=2)
+        self.te = Producto.create(categoria_id=uuid.uuid4(), nombre='Té', precio=Decimal('20.00'))
+
+    def rellenar(self):
+        migracion = import_module('pedido.migrations.0008_rellenar_puntos_extra')
+        migracion.rellenar_puntos_extra(apps, None)
+
+    def crear_pedido(self, estado='pendiente'):
+        # Líneas como las dejó 0005: sin los puntos extra del catálogo
+        pedido = Pedido.objects.create(
+            sucursal=self.sucursal, usuario=self.cliente, total=Decimal('60.00'), estado=estado)
+        for producto in (self.latte, self.te):
+            DetallePedido.objects.create(
+                pedido=pedido, producto_id=producto.id, nombre_producto=producto.nombre,
+                precio_unitario=producto.precio, cantidad=3)
+        return pedido
+
+    def test_pedido_pendiente_conserva_el_bono(self):
+        pedido = self.crear_pedido()
+        self.rellenar()
+        self.assertEqual(
+            sorted(pedido.detalles.values_list('puntos_extra', flat=True)), [0, 2])
+        # 60 pesos dan 10 puntos, más 3 x 2 del Latte
+        self.assertEqual(otorgar_puntos(pedido), 16)
+
+    def test_historial_muestra_los_puntos_del_catalogo(self):
+        self.crear_pedido(estado='pagado')
+        self.rellenar()
+        entradas, _ = historial_puntos(self.cliente)
+        self.assertEqual(
+            [(d['nombre'], d['puntos_extra']) for d in entradas[0]['detalles']],
+            [('Latte', 6), ('Té', 0)])
+
+
+class PuntosRecompensasVistaTest(TestCase):
+    def setUp(self):
+        self.cliente = User.objects.create_user('cliente', password='clave12345')
+        self.sucursal = crear_sucursal()
+        self.client.login(username='cliente', password='clave12345')
+        self.url = reverse('puntos_recompensas')
+
+    def crear_pagados(self, cantidad):
+        for _ in range(cantidad):
+            pedido = Pedido.objects.create(
+                sucursal=self.sucursal, usuario=self.cliente, estado='pagado', total=30)
+            crear_detalles_pedido(pedido, CotizacionCarrito(
+                lineas=(LineaCotizada(uuid.uuid4(), 'Latte', Decimal('15.00'), 2, puntos_extra=3),),
+                total=Decimal('30.00'),
+            ))
+
+    def consultas(self, **params):
+        with CaptureQueriesContext(connection) as capturadas:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, len(capturadas.captured_queries)
+
+    def test_consultas_constantes_y_puntos_del_snapshot(self):
+        self.crear_pagados(2)
+        self.consultas()
+        _, pocas = self.consultas()
+        self.crear_pagados(8)
+        response, muchas = self.consultas()
+
+        self.assertEqual(muchas, pocas)
+        entrada = response.context['pedidos_con_detalles'][0]
+        self.assertEqual(entrada['detalles'][0]['puntos_extra'], 6)
+
+    def test_paginacion_por_cursor(self):
+        self.crear_pagados(5)
+        entradas, siguiente = historial_puntos(self.cliente, por_pagina=3)
+        self.assertEqual(len(entradas), 3)
+        entradas, siguiente = historial_puntos(self.cliente, siguiente, por_pagina=3)
+        self.assertEqual(len(entradas), 2)
+        self.assertIsNone(siguiente)
+
+
+class CheckoutAsincronoTest(CassandraTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.sucursal = crear_sucursal()
+        self.latte = Producto.create(
+            categoria_id=uuid.uuid4(), nombre='Latte', precio=Decimal('45.00'), activo=True)
+        self.carrito = json.dumps([{'id': str(self.latte.id), 'cantidad': 2}])
+        invalidar_catalogo()
+
+    async def test_checkouts_de_kiosko_concurrentes(self):
+        respuestas = await asyncio.gather(*(
+            self.async_client.post(reverse('kiosko_pedido'), {
+                'sucursal': self.sucursal.id, 'carrito_json': self.carrito, 'nombre': f'Cliente {i}',
+            })
+            for i in range(5)
+        ))
+        self.assertEqual([r.status_code for r in respuestas], [200] * 5)
+        self.assertEqual(await Pedido.objects.filter(total=Decimal('90.00'), usuario=None).acount(), 5)
+        self.assertEqual(await DetallePedido.objects.filter(nombre_producto='Latte').acount(), 5)
+
+    def test_pickup_y_estado(self):
+        cliente = User.objects.create_user('cliente', password='clave12345')
+        self.client.force_login(cliente)
+        # La página solo trae el armazón; los productos vienen de la API del catálogo
+        self.assertContains(self.client.get(reverse('pickup_pedido')), reverse('menu:api_catalogo'))
+
+        response = self.client.post(reverse('pickup_pedido'), {
+            'sucursal': self.sucursal.id,
+            'carrito_json': self.carrito,
+            'tipo_pago': 'tarjeta',
+            'horario_recoleccion': '2030-01-01T10:00',
+        })
+        pedido = Pedido.objects.get(usuario=cliente)
+        self.assertRedirects(response, reverse('pickup_exito_estado', args=[pedido.id]))
+        self.assertEqual(pedido.total, Decimal('90.00'))
+        self.assertEqual(pedido.pickup.tipo_pago, 'tarjeta')
+
+        response = self.client.get(reverse('pickup_exito_estado', args=[pedido.id]))
+        self.assertContains(response, pedido.codigo)
+        otro = User.objects.create_user('otro', password='clave12345')
+        self.client.force_login(otro)
+        self.assertEqual(self.client.get(reverse('pickup_exito_estado', args=[pedido.id])).status_code, 404)
@@ -14,5 +14,7 @@ urlpatterns = [
          views.cancelar_pedido, name='cancelar_pedido'),
     path('pedidos/estado/<int:pedido_id>/',
          views.pickup_exito_estado, name='pickup_exito_estado'),
+    path('pedidos/estado/<int:pedido_id>/eventos/',
+         views.eventos_pedido, name='eventos_pedido'),
     path('puntos/', views.puntos_recompensas, name='puntos_recompensas'),
 ]
@@ -1,34 +1,97 @@
 from django.views.decorators.csrf import csrf_exempt
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import aget_object_or_404, render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .models import Sucursal, Pedido, PedidoPickup, DetallePedido
+from .models import Sucursal, PerfilUsuario, Pedido, PedidoPickup, DetallePedido
 from .forms import PedidoPickupForm
-from menu.models import Producto, Categoria
+from .carrito import cotizar_carrito_async, crear_detalles_pedido
+from .eventos import publicar_evento_pedido, respuesta_sse
+from .puntos import VALOR_PUNTO, PuntosInsuficientes, historial_puntos, otorgar_puntos, usar_puntos
+from SisWebCafe.asincrono import obtener_usuario, renderizar
+from SisWebCafe.cache_paginas import pagina_publica
+from asgiref.sync import sync_to_async
+import asyncio
 import json
+from django.db import transaction
 from django.utils import timezone
-from decimal import Decimal
 
 
+@pagina_publica
 def seleccionar_tipo_pedido(request):
     return render(request, 'pedido/tipo_pedido.html')
 
 
+async def _sucursales():
+    return [sucursal async for sucursal in Sucursal.objects.all()]
+
+
+async def _perfil(usuario):
+    if not usuario.is_authenticated:
+        return None
+    return await PerfilUsuario.objects.filter(user=usuario).afirst()
+
+
+def _registrar_pickup(usuario, perfil, sucursal, cotizacion, puntos_a_usar, total_final,
+                      horario_recoleccion, tipo_pago):
+    estado_pedido = 'pagado' if total_final == 0 else 'pendiente'
+    with transaction.atomic():
+        # Crear pedido
+        pedido = Pedido.objects.create(
+            usuario=usuario,
+            sucursal=sucursal,
+            estado=estado_pedido,
+            total=total_final,
+            puntos_usados=puntos_a_usar,
+        )
+
+        # Crear detalles del pedido a partir de la cotización
+        crear_detalles_pedido(pedido, cotizacion)
+
+        # Restar puntos usados (revierte el pedido si ya no alcanzan)
+        if perfil:
+            usar_puntos(usuario, pedido, puntos_a_usar)
+
+        # Crear registro de pickup
+        PedidoPickup.objects.create(
+            pedido=pedido,
+            horario_recoleccion=horario_recoleccion,
+            tipo_pago=tipo_pago,
+        )
+
+        # Sale al confirmar la transacción
+        publicar_evento_pedido(pedido, 'creado')
+    return pedido
+
+
+def _actualizar_contacto(usuario, perfil, nombre_post, correo_post, telefono_post):
+    """Completa los datos del usuario con los del pago en efectivo."""
+    if not usuario.first_name and nombre_post:
+        usuario.first_name = nombre_post.split()[0]
+        if len(nombre_post.split()) > 1:
+            usuario.last_name = " ".join(nombre_post.split()[1:])
+    if not usuario.email and correo_post:
+        usuario.email = correo_post
+    usuario.save()
+    if perfil and not perfil.telefono and telefono_post:
+        perfil.telefono = telefono_post
+        perfil.save()
+
+
 @login_required
-def pickup_pedido(request):
-    nombre = request.user.get_full_name() or ''
-    correo = request.user.email or ''
+async def pickup_pedido(request):
+    usuario = await obtener_usuario(request)
+    # Sucursales y perfil no dependen entre sí: se piden a la vez. Los
+    # productos los carga la página desde menu:api_catalogo
+    sucursales, perfil = await asyncio.gather(_sucursales(), _perfil(usuario))
+
+    nombre = usuario.get_full_name() or ''
+    correo = usuario.email or ''
     telefono = ''
-    perfil = getattr(request.user, 'perfil', None)
     if perfil:
         telefono = perfil.telefono or ''
 
-    sucursales = Sucursal.objects.all()
-    productos = Producto.objects.filter(activo=True)  # Solo productos activos
     form = PedidoPickupForm()
 
-    VALOR_PUNTO = Decimal('0.50')
-
     if request.method == 'POST':
         form = PedidoPickupForm(request.POST)
         tipo_pago = request.POST.get('tipo_pago')
@@ -42,11 +105,9 @@ def pickup_pedido(request):
         if tipo_pago == 'efectivo':
             if not nombre_post or not correo_post or not telefono_post:
                 messages.error(request, "Debes completar todos los datos para pago en efectivo.")
-                return render(request, 'pedido/pickup.html', {
+                return await renderizar(request, 'pedido/pickup.html', {
                     'sucursales': sucursales,
                     'form': form,
-                    'productos': productos,
-                    'categorias': Categoria.objects.filter(activo=True),
                     'nombre': nombre_post,
                     'correo': correo_post,
                     'telefono': telefono_post,
@@ -55,15 +116,11 @@ def pickup_pedido(request):
         if form.is_valid():
             horario_recoleccion = form.cleaned_data['horario_recoleccion']
             sucursal_id = request.POST.get('sucursal')
-            sucursal = Sucursal.objects.get(id=sucursal_id)
 
-            # Calcular total del carrito
-            total = Decimal('0.00')
-            for item in carrito:
-                producto = Producto.objects.get(id=item['id'])
-                cantidad = int(item['cantidad'])
-                subtotal = producto.precio * cantidad
-                total += subtotal
+            # Calcular total del carrito (una sola consulta a Cassandra)
+            sucursal, cotizacion = await asyncio.gather(
+                Sucursal.objects.aget(id=sucursal_id), cotizar_carrito_async(carrito))
+            total = cotizacion.total
 
             # Pago con puntos
             puntos_a_usar = int(request.POST.get('puntos_a_usar', 0))
@@ -71,62 +128,25 @@ def pickup_pedido(request):
             puntos_a_usar = min(puntos_a_usar, max_puntos)
             total_final = total - (puntos_a_usar * VALOR_PUNTO)
 
-            estado_pedido = 'pagado' if total_final == 0 else 'pendiente'
-
-            # Crear pedido
-            pedido = Pedido.objects.create(
-                usuario=request.user,
-                sucursal=sucursal,
-                estado=estado_pedido,
-                total=total_final,
-                puntos_usados=puntos_a_usar,
-            )
-
-            # Crear detalles del pedido
-            for item in carrito:
-                producto = Producto.objects.get(id=item['id'])
-                cantidad = int(item['cantidad'])
-                DetallePedido.objects.create(
-                    pedido=pedido,
-                    producto_id=producto.id,  # ✅ usar producto_id (UUID)
-                    cantidad=cantidad,
+            try:
+                pedido = await sync_to_async(_registrar_pickup)(
+                    usuario, perfil, sucursal, cotizacion, puntos_a_usar, total_final,
+                    horario_recoleccion, tipo_pago,
                 )
-
-            # Restar puntos usados
-            if perfil and puntos_a_usar > 0:
-                perfil.puntos -= puntos_a_usar
-                perfil.save()
-
-            # Crear registro de pickup
-            PedidoPickup.objects.create(
-                pedido=pedido,
-                horario_recoleccion=horario_recoleccion,
-                tipo_pago=tipo_pago,
-            )
+            except PuntosInsuficientes:
+                messages.error(request, "Tu saldo de puntos cambió, vuelve a intentarlo.")
+                return redirect('pickup_pedido')
 
             # Actualizar datos del usuario si es pago en efectivo
-            user = request.user
             if tipo_pago == 'efectivo':
-                if not user.first_name and nombre_post:
-                    user.first_name = nombre_post.split()[0]
-                    if len(nombre_post.split()) > 1:
-                        user.last_name = " ".join(nombre_post.split()[1:])
-                if not user.email and correo_post:
-                    user.email = correo_post
-                user.save()
-                if perfil and not perfil.telefono and telefono_post:
-                    perfil.telefono = telefono_post
-                    perfil.save()
+                await sync_to_async(_actualizar_contacto)(
+                    usuario, perfil, nombre_post, correo_post, telefono_post)
 
             return redirect('pickup_exito_estado', pedido_id=pedido.id)
 
-    categorias = Categoria.objects.filter(activo=True)
-
-    return render(request, 'pedido/pickup.html', {
+    return await renderizar(request, 'pedido/pickup.html', {
         'sucursales': sucursales,
         'form': form,
-        'productos': productos,
-        'categorias': categorias,
         'nombre': nombre,
         'correo': correo,
         'telefono': telefono,
@@ -137,21 +157,32 @@ def pickup_pedido(request):
 
 
 @login_required
-def pickup_exito_estado(request, pedido_id):
-    pedido = get_object_or_404(Pedido, id=pedido_id, usuario=request.user)
-    return render(request, 'pedido/pickup_exito.html', {
+async def pickup_exito_estado(request, pedido_id):
+    usuario = await obtener_usuario(request)
+    pedido = await aget_object_or_404(
+        Pedido.objects.select_related('sucursal', 'pickup'), id=pedido_id, usuario=usuario)
+    return await renderizar(request, 'pedido/pickup_exito.html', {
         'pedido': pedido,
         'sucursal': pedido.sucursal,
         'horario': pedido.pickup.horario_recoleccion,
     })
 
 
+@login_required
+async def eventos_pedido(request, pedido_id):
+    """Flujo SSE con los cambios de estado de un pedido del cliente"""
+    usuario = await obtener_usuario(request)
+    pedido = await aget_object_or_404(Pedido, id=pedido_id, usuario=usuario)
+    return respuesta_sse(request, lambda evento: evento['id'] == pedido.id)
+
+
 @login_required
 def cancelar_pedido(request, pedido_id):
     pedido = get_object_or_404(Pedido, id=pedido_id, usuario=request.user)
     if pedido.estado == 'pendiente':
         pedido.estado = 'cancelado'
         pedido.save()
+        publicar_evento_pedido(pedido)
     return redirect('lista_pedidos_pickup')
 
 
@@ -189,118 +220,41 @@ def lista_pedidos_pickup(request):
     })
 
 
-def sumar_puntos_a_cliente(usuario, pedido):
-    if not usuario or not hasattr(usuario, 'perfil'):
-        return 0
-    perfil = usuario.perfil
-
-    # puntos por monto gastado
-    puntos_por_total = int(pedido.total // 30) * 5
-
-    # puntos extra por producto
-    puntos_extra = 0
-    from menu.models import Producto
-    for detalle in pedido.detalles.all():
-        try:
-            producto = Producto.objects.get(id=detalle.producto_id)
-            puntos_extra += producto.puntos_extra * detalle.cantidad
-        except Producto.DoesNotExist:
-            pass
-
-    total_puntos = puntos_por_total + puntos_extra
-    perfil.puntos += total_puntos
-    perfil.save()
-    return total_puntos
-
-
-
-def usar_puntos_en_pedido(usuario, pedido):
-    perfil = usuario.perfil
-
-    puntos_a_usar = min(perfil.puntos, int(pedido.total))
-    pedido.total -= puntos_a_usar
-    perfil.puntos -= puntos_a_usar
-    perfil.save()
-    pedido.save()
-    return puntos_a_usar
-
 @login_required
 def puntos_recompensas(request):
     perfil = request.user.perfil
-    pedidos = Pedido.objects.filter(
-        usuario=request.user, estado='pagado'
-    ).order_by('-fecha_hora')
-    pedidos_con_detalles = []
-    from menu.models import Producto
-    for pedido in pedidos:
-        detalles = []
-        for detalle in pedido.detalles.all():
-            puntos_extra = 0
-            try:
-                producto = Producto.objects.get(id=detalle.producto_id)
-                puntos_extra = (producto.puntos_extra) * detalle.cantidad
-            except Producto.DoesNotExist:
-                pass
-
-            detalles.append({
-                'nombre': detalle.nombre_producto,
-                'cantidad': detalle.cantidad,
-                'puntos_extra': puntos_extra,
-            })
-        pedidos_con_detalles.append({
-            'pedido': pedido,
-            'detalles': detalles,
-        })
+    # Pedidos y detalles en dos consultas, paginados por fecha_hora
+    cursor = request.GET.get('cursor')
+    pedidos_con_detalles, siguiente_cursor = historial_puntos(request.user, cursor)
 
     return render(request, 'pedido/puntos_recompensas.html', {
         'perfil': perfil,
         'pedidos_con_detalles': pedidos_con_detalles,
+        'cursor': cursor,
+        'siguiente_cursor': siguiente_cursor,
     })
 
 
 
 
-@csrf_exempt
-def kiosko_pedido(request):
-    productos = Producto.objects.filter(activo=True)
-    sucursales = Sucursal.objects.all()
-    mensaje = None
-    VALOR_PUNTO = Decimal('0.50')
-
-    if request.method == 'POST':
-        sucursal_id = request.POST.get('sucursal')
-        sucursal = Sucursal.objects.get(id=sucursal_id)
-        carrito_json = request.POST.get('carrito_json')
-        carrito = json.loads(carrito_json) if carrito_json else []
-        nombre = request.POST.get('nombre', '').strip()
-        telefono = request.POST.get('telefono', '').strip()
-
-        total = Decimal('0')
-        for item in carrito:
-            producto = Producto.objects.get(id=item['id'])
-            cantidad = int(item['cantidad'])
-            subtotal = producto.precio * cantidad
-            total += subtotal
-
-        if request.user.is_authenticated and hasattr(request.user, 'perfil'):
-            perfil = request.user.perfil
-            puntos_a_usar = int(request.POST.get('puntos_a_usar', 0))
+def _registrar_kiosko(usuario, perfil, sucursal, cotizacion, puntos_a_usar):
+    total = cotizacion.total
+    with transaction.atomic():
+        if perfil:
             max_puntos = min(perfil.puntos, int(total // VALOR_PUNTO))
             puntos_a_usar = min(puntos_a_usar, max_puntos)
             total_final = total - (puntos_a_usar * VALOR_PUNTO)
             estado_pedido = 'pagado' if total_final == 0 else 'pendiente'
             pedido = Pedido.objects.create(
-                usuario=request.user,
+                usuario=usuario,
                 sucursal=sucursal,
                 estado=estado_pedido,
                 total=total_final,
                 puntos_usados=puntos_a_usar,
             )
-            if puntos_a_usar > 0:
-                perfil.puntos -= puntos_a_usar
-                perfil.save()
+            usar_puntos(usuario, pedido, puntos_a_usar)
         else:
-          
+
             pedido = Pedido.objects.create(
                 usuario=None,
                 sucursal=sucursal,
@@ -310,17 +264,8 @@ def kiosko_pedido(request):
                 puntos_usados=0,
             )
 
-        # Crea los detalles del pedido
-        for item in carrito:
-            producto = Producto.objects.get(id=item['id'])
-            cantidad = int(item['cantidad'])
-            subtotal = producto.precio * cantidad
-            DetallePedido.objects.create(
-                pedido=pedido,
-                producto_id=producto.id,
-                cantidad=cantidad,
-                subtotal=subtotal,
-            )
+        # Crea los detalles del pedido a partir de la cotización
+        crear_detalles_pedido(pedido, cotizacion)
 
         PedidoPickup.objects.create(
             pedido=pedido,
@@ -328,30 +273,48 @@ def kiosko_pedido(request):
             tipo_pago='kiosko',
         )
 
-        if request.user.is_authenticated and hasattr(request.user, 'perfil') and pedido.total > 0:
-            puntos_por_total = int(pedido.total // 30) * 5
-            puntos_extra = sum([
-                getattr(detalle.producto_id, 'puntos_extra', 0) * detalle.cantidad
-                for detalle in pedido.detalles.all()
-            ])
-            total_puntos = puntos_por_total + puntos_extra
-            perfil = request.user.perfil
-            perfil.puntos += total_puntos
-            perfil.save()
-            pedido.puntos_ganados = total_puntos
-            pedido.save()
+        if pedido.usuario_id and pedido.total > 0:
+            otorgar_puntos(pedido)
+
+        publicar_evento_pedido(pedido, 'creado')
+    return pedido
+
+
+@csrf_exempt
+async def kiosko_pedido(request):
+    usuario = await obtener_usuario(request)
+
+    if request.method == 'POST':
+        sucursal_id = request.POST.get('sucursal')
+        carrito_json = request.POST.get('carrito_json')
+        carrito = json.loads(carrito_json) if carrito_json else []
+        nombre = request.POST.get('nombre', '').strip()
+        telefono = request.POST.get('telefono', '').strip()
+
+        # Sucursal y perfil en Postgres mientras Cassandra cotiza el carrito
+        sucursal, cotizacion, perfil = await asyncio.gather(
+            Sucursal.objects.aget(id=sucursal_id),
+            cotizar_carrito_async(carrito),
+            _perfil(usuario),
+        )
+
+        try:
+            pedido = await sync_to_async(_registrar_kiosko)(
+                usuario, perfil, sucursal, cotizacion, int(request.POST.get('puntos_a_usar', 0)))
+        except PuntosInsuficientes:
+            messages.error(request, "Tu saldo de puntos cambió, vuelve a intentarlo.")
+            return redirect('kiosko_pedido')
 
         mensaje = f"¡Pedido realizado! Código: {pedido.codigo}"
 
-        return render(request, 'pedido/kiosko_exito.html', {
+        return await renderizar(request, 'pedido/kiosko_exito.html', {
             'pedido': pedido,
             'mensaje': mensaje,
             'nombre': nombre,
             'telefono': telefono,
         })
 
-    return render(request, 'pedido/kiosko.html', {
-        'productos': productos,
-        'sucursales': sucursales,
-        'categorias': Categoria.objects.filter(activo=True),  # Agregado para organizar productos
-    })
\ No newline at end of file
+    # Los productos los carga la página desde menu:api_catalogo
+    return await renderizar(request, 'pedido/kiosko.html', {
+        'sucursales': await _sucursales(),
+    })
@@ -0,0 +1,71 @@
+// Menú del kiosko y del pickup desde /api/catalogo/.
+// La página llega sin productos; con cache: 'no-cache' el navegador revalida
+// su copia con If-None-Match y, si el catálogo no cambió, el servidor
+// responde 304 sin cuerpo.
+
+async function cargarCatalogo(url) {
+  const respuesta = await fetch(url, { cache: 'no-cache', credentials: 'same-origin' });
+  if (!respuesta.ok) {
+    throw new Error('No se pudo cargar el menú (' + respuesta.status + ')');
+  }
+  return respuesta.json();
+}
+
+function recortarTexto(texto, maximo) {
+  // Igual que el filtro truncatechars de Django
+  return texto.length > maximo ? texto.slice(0, maximo - 1) + '…' : texto;
+}
+
+function llenarCategorias(select, categorias) {
+  categorias.forEach(function(categoria) {
+    const opcion = document.createElement('option');
+    opcion.value = categoria.id;
+    opcion.textContent = categoria.nombre;
+    select.appendChild(opcion);
+  });
+}
+
+// Una tarjeta por producto a partir del <template> de la página
+function pintarProductos(contenedor, plantilla, productos) {
+  const fragmento = document.createDocumentFragment();
+  productos.forEach(function(producto) {
+    const tarjeta = plantilla.content.firstElementChild.cloneNode(true);
+    tarjeta.dataset.categoria = producto.categoria_id;
+
+    const imagen = tarjeta.querySelector('.producto-imagen');
+    const sinImagen = tarjeta.querySelector('.producto-sin-imagen');
+    if (producto.imagen) {
+      const img = imagen.querySelector('img');
+      img.src = producto.imagen.src;
+      img.alt = producto.nombre;
+      if (producto.imagen.jpeg) {
+        img.srcset = producto.imagen.jpeg;
+        imagen.querySelector('source').srcset = producto.imagen.webp;
+      } else {
+        imagen.querySelector('source').remove();
+      }
+      if (sinImagen) sinImagen.remove();
+    } else {
+      imagen.remove();
+    }
+
+    tarjeta.querySelector('.producto-nombre').textContent = producto.nombre;
+    tarjeta.querySelector('.producto-descripcion').textContent = recortarTexto(producto.descripcion, 60);
+    tarjeta.querySelector('.producto-precio').textContent = '$' + producto.precio;
+    tarjeta.querySelectorAll('[data-id]').forEach(function(elemento) {
+      elemento.dataset.id = producto.id;
+    });
+    const agregar = tarjeta.querySelector('.agregar-btn');
+    agregar.dataset.nombre = producto.nombre;
+    agregar.dataset.precio = producto.precio;
+    agregar.dataset.puntosExtra = producto.puntos_extra;
+    fragmento.appendChild(tarjeta);
+  });
+  contenedor.replaceChildren(fragmento);
+}
+
+function filtrarPorCategoria(contenedor, categoria) {
+  contenedor.querySelectorAll('.producto-card').forEach(function(tarjeta) {
+    tarjeta.style.display = (categoria === 'todos' || tarjeta.dataset.categoria === categoria) ? '' : 'none';
+  });
+}